@@ -1,6 +1,6 @@
-import pandas as pd
 import os
-import json
+
+from point_store import load_table
 
 
 def analyze_xlsx_files():
@@ -26,8 +26,8 @@ def analyze_xlsx_files():
         print('='*60)
 
         try:
-            # Читаем Excel файл
-            df = pd.read_excel(filepath)
+            # Читаем Excel файл (повторные запуски — из хранилища точек)
+            df = load_table(filepath)
 
             print(
                 f"📊 Размер данных: {df.shape[0]} строк × {df.shape[1]} столбцов")
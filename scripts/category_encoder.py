@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+category_encoder.py
+Стабильное one-hot кодирование категорий (тег building) вместо pd.get_dummies.
+Набор колонок фиксирован и не зависит от того, какие теги встретились в файле:
+    vocab — замороженный словарь самых частых тегов + колонка other для редких
+            и новых тегов (словарь подбирается один раз и хранится в модели);
+    hash  — теги раскладываются по фиксированному числу корзин хэшем
+            (словарь не нужен, схема одинакова для любых данных).
+Колонки int8 (или разреженные), поэтому ширина и память таблицы ограничены.
+Описание кодировщика — простой dict: кладется в joblib модели (model_data["encoders"])
+и в файл <фичи>.encoders.json рядом с таблицей фич.
+"""
+
+import hashlib
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MODES = ("vocab", "hash")
+MISSING = "unknown"
+OTHER = "other"
+
+
+class CategoryEncoder:
+    """One-hot кодировщик с фиксированным набором колонок"""
+
+    def __init__(self, prefix, mode="vocab", vocabulary=(), buckets=16, rare=True):
+        if mode not in MODES:
+            raise ValueError(f"Неизвестный режим кодирования: {mode}")
+        self.prefix = prefix
+        self.mode = mode
+        self.vocabulary = list(vocabulary)
+        self.buckets = int(buckets)
+        # Колонка other для тегов вне словаря (у старых моделей ее нет)
+        self.rare = rare
+
+    @classmethod
+    def fit(cls, values, prefix, mode="vocab", max_categories=16, min_count=5, buckets=16):
+        """
+        Подбирает словарь: не больше max_categories самых частых значений,
+        встретившихся хотя бы min_count раз (пропуски — отдельное значение unknown)
+        """
+        if mode == "hash":
+            return cls(prefix, mode="hash", buckets=buckets)
+        counts = clean(values).value_counts()
+        counts = counts[counts >= min_count].head(max_categories)
+        encoder = cls(prefix, vocabulary=sorted(counts.index))
+        logger.info(f"Словарь {prefix}: {len(encoder.vocabulary)} значений "
+                    f"из {clean(values).nunique()} (остальные -> {prefix}_{OTHER})")
+        return encoder
+
+    @classmethod
+    def from_columns(cls, columns, prefix):
+        """Словарь из имен колонок старой модели (bld_type_<тег>, без other)"""
+        start = len(prefix) + 1
+        vocabulary = [c[start:] for c in columns if str(c).startswith(prefix + "_")]
+        return cls(prefix, vocabulary=sorted(vocabulary), rare=False)
+
+    @classmethod
+    def from_dict(cls, spec):
+        return cls(spec["prefix"], mode=spec["mode"], vocabulary=spec.get("vocabulary", ()),
+                   buckets=spec.get("buckets", 16), rare=spec.get("rare", True))
+
+    def to_dict(self):
+        return {"prefix": self.prefix, "mode": self.mode, "vocabulary": self.vocabulary,
+                "buckets": self.buckets, "rare": self.rare}
+
+    @property
+    def columns(self):
+        if self.mode == "hash":
+            return [f"{self.prefix}_h{i}" for i in range(self.buckets)]
+        return [f"{self.prefix}_{v}" for v in self.vocabulary] + \
+            ([f"{self.prefix}_{OTHER}"] if self.rare else [])
+
+    def codes(self, values):
+        """Номер колонки для каждого значения (-1 — ни одной)"""
+        values = clean(values)
+        if self.mode == "hash":
+            uniques, inverse = np.unique(values.to_numpy(dtype=str), return_inverse=True)
+            lookup = np.array([stable_hash(u) % self.buckets for u in uniques], dtype=np.int64)
+            return lookup[inverse]
+        position = pd.Series(np.arange(len(self.vocabulary)), index=self.vocabulary)
+        codes = values.map(position)
+        fallback = len(self.vocabulary) if self.rare else -1
+        return codes.fillna(fallback).to_numpy(dtype=np.int64)
+
+    def transform(self, values, sparse=False):
+        """DataFrame int8 (или разреженный) с колонками self.columns"""
+        index = values.index if isinstance(values, pd.Series) else None
+        codes = self.codes(values)
+        n, width = len(codes), len(self.columns)
+        hit = codes >= 0
+        if sparse:
+            from scipy.sparse import csr_matrix
+            matrix = csr_matrix((np.ones(int(hit.sum()), dtype=np.int8),
+                                 (np.flatnonzero(hit), codes[hit])), shape=(n, width))
+            return pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=self.columns)
+        dense = np.zeros((n, width), dtype=np.int8)
+        dense[np.flatnonzero(hit), codes[hit]] = 1
+        return pd.DataFrame(dense, index=index, columns=self.columns)
+
+
+def clean(values):
+    """Строковые значения категорий; пропуски — unknown"""
+    values = pd.Series(values)
+    return values.where(values.notna(), MISSING).astype(str)
+
+
+def stable_hash(value):
+    """Хэш, одинаковый между процессами и запусками (в отличие от hash())"""
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "little")
+
+
+def encoders_path(features_path):
+    """Файл описания кодировщиков рядом с таблицей фич"""
+    path = Path(features_path)
+    return path.with_name(path.stem + ".encoders.json")
+
+
+def save_encoders(encoders, features_path):
+    """{колонка OSM: описание кодировщика} -> <фичи>.encoders.json"""
+    path = encoders_path(features_path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(encoders, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_encoders(features_path):
+    """Описания кодировщиков, сохраненные рядом с таблицей фич ({} если нет)"""
+    path = encoders_path(features_path)
+    if not path.exists():
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
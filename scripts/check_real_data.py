@@ -1,16 +1,18 @@
-import geopandas as gpd
-import pandas as pd
 import os
 
+from point_store import load_points
+
 print("="*60)
 print("ПРОВЕРКА РЕАЛЬНЫХ ДАННЫХ")
 print("="*60)
 
 # 1. Проверяем данные Свердловской области
 print("\n📍 СВЕРДЛОВСКАЯ ОБЛАСТЬ:")
-sverdlovsk_path = "data/zones/sverdlovsk_points.geojson"
+sverdlovsk_path = "data/Свердловская область - Население.xlsx"
 if os.path.exists(sverdlovsk_path):
-    gdf = gpd.read_file(sverdlovsk_path)
+    # Координаты из хранилища точек уже числовые
+    gdf = load_points(sverdlovsk_path, lon="LON", lat="LAT").rename(
+        columns={"INHAB": "population"})
     print(f"   Всего точек: {len(gdf)}")
 
     # Проверяем координаты
@@ -36,9 +38,10 @@ if os.path.exists(sverdlovsk_path):
 
 # 2. Проверяем данные Пермского края
 print("\n📍 ПЕРМСКИЙ КРАЙ:")
-perm_path = "data/zones/perm_points.geojson"
+perm_path = "data/Пермский край - Население.xlsx"
 if os.path.exists(perm_path):
-    gdf = gpd.read_file(perm_path)
+    gdf = load_points(perm_path, lon="Longitude", lat="Latitude").rename(
+        columns={"ЧН_Расчет": "population"})
     print(f"   Всего точек: {len(gdf)}")
 
     # Проверяем координаты
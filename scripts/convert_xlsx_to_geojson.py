@@ -1,24 +1,14 @@
-import pandas as pd
-import geopandas as gpd
-from shapely.geometry import Point
 import os
 
+from point_store import load_points
+
 
 def convert_perm():
     """Конвертирует данные Пермского края"""
     print("📥 Читаем данные Пермского края...")
-    df = pd.read_excel('data/Пермский край - Население.xlsx')
-
-    # Создаем геометрию из координат
-    geometry = [Point(lon, lat)
-                for lon, lat in zip(df['Longitude'], df['Latitude'])]
-
-    # Создаем GeoDataFrame
-    gdf = gpd.GeoDataFrame(
-        df,
-        geometry=geometry,
-        crs='EPSG:4326'
-    )
+    # Книга читается потоком один раз, дальше — из хранилища точек
+    gdf = load_points('data/Пермский край - Население.xlsx',
+                      lon='Longitude', lat='Latitude')
 
     # Переименовываем колонку с населением (если она есть)
     if 'ЧН_Расчет' in gdf.columns:
@@ -40,17 +30,8 @@ def convert_perm():
 def convert_sverdlovsk():
     """Конвертирует данные Свердловской области"""
     print("\n📥 Читаем данные Свердловской области...")
-    df = pd.read_excel('data/Свердловская область - Население.xlsx')
-
-    # Создаем геометрию из координат
-    geometry = [Point(lon, lat) for lon, lat in zip(df['LON'], df['LAT'])]
-
-    # Создаем GeoDataFrame
-    gdf = gpd.GeoDataFrame(
-        df,
-        geometry=geometry,
-        crs='EPSG:4326'
-    )
+    gdf = load_points('data/Свердловская область - Население.xlsx',
+                      lon='LON', lat='LAT')
 
     # Переименовываем колонку с населением
     if 'INHAB' in gdf.columns:
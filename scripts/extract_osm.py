@@ -4,6 +4,11 @@
 extract_osm.py
 Скрипт для скачивания OSM-данных (здания, дороги, POI) для bounding box или имени города.
 Совместим с OSMnx 2.x
+По умолчанию (--tiled) один запрос Overpass на тайл сразу за зданиями, POI
+и автомобильными дорогами, с несколькими зеркалами и докачкой
+(overpass_tiles.py); слои и roads_edges.geojson разделяются локально.
+--no-tiled: прежние отдельные запросы osmnx (здания, POI, граф дорог).
+--pbf: офлайн из локальной выгрузки .osm.pbf (osm_pbf.py), без сети.
 """
 
 import logging
@@ -12,11 +17,14 @@ import click
 import osmnx as ox
 import geopandas as gpd
 
+from overpass_cache import OverpassCache
+from overpass_mirrors import DEFAULT_MIRRORS, MirrorPool
+from overpass_tiles import TILE_SIZE, download_layers
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Используем альтернативный сервер для надежности
-ox.settings.overpass_url = "https://overpass-api.de/api/interpreter"  # Другой сервер
+# Зеркало для --no-tiled выбирается пулом (MirrorPool.best) в main
 ox.settings.timeout = 600  # Увеличиваем таймаут до 10 минут
 ox.settings.use_cache = True
 ox.settings.log_console = False
@@ -29,19 +37,58 @@ ox.settings.log_console = False
 @click.option("--east", type=float, default=None)
 @click.option("--west", type=float, default=None)
 @click.option("--out-dir", default="data/osm", help="Output directory")
-def main(place, north, south, east, west, out_dir):
+@click.option("--tiled/--no-tiled", default=True,
+              help="Tiled, resumable single-query download across Overpass mirrors (default)")
+@click.option("--mirror", "mirrors", multiple=True, help="Overpass mirror URL (repeatable)")
+@click.option("--workers", type=int, default=4, help="Concurrent tile requests for --tiled")
+@click.option("--tile-size", type=float, default=TILE_SIZE, help="Root tile side for --tiled, degrees")
+@click.option("--cache-dir", default="data/cache/overpass", help="Tile response cache for --tiled")
+@click.option("--cache-max-mb", type=float, default=1024, help="Tile cache size cap, MB (LRU eviction)")
+@click.option("--no-cache", is_flag=True, help="Do not read or write the tile cache")
+@click.option("--pbf", type=click.Path(exists=True, dir_okay=False), default=None,
+              help="Local .osm.pbf extract: offline ingestion instead of Overpass")
+@click.option("--pbf-index", default="flex_mem",
+              help="osmium node location index, e.g. dense_file_array,nodes.idx for a whole region")
+def main(place, north, south, east, west, out_dir, tiled, mirrors, workers, tile_size,
+         cache_dir, cache_max_mb, no_cache, pbf, pbf_index):
 
     out = Path(out_dir)
     out.mkdir(parents=True, exist_ok=True)
 
+    if pbf:
+        from osm_pbf import extract_pbf
+        extract_pbf(pbf, out, index=pbf_index)
+        logger.info("✅ OSM extraction completed successfully.")
+        return
+
+    if tiled:
+        polygon = None
+        if place:
+            # Геокодируем один раз; тайлы покрывают рамку места
+            polygon = ox.geocode_to_gdf(place).union_all()
+            west, south, east, north = polygon.bounds
+        else:
+            assert None not in (north, south, east, west), "Provide bbox or place"
+        cache = None if no_cache else OverpassCache(cache_dir, max_mb=cache_max_mb)
+        try:
+            download_layers((west, south, east, north), out, polygon=polygon,
+                            mirrors=mirrors or DEFAULT_MIRRORS, workers=workers,
+                            tile_size=tile_size, cache=cache)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        logger.info("✅ OSM extraction completed successfully.")
+        return
+
     # ---------- LOAD DATA ----------
+    ox.settings.overpass_url = MirrorPool(mirrors or DEFAULT_MIRRORS).best()
+    logger.info(f"Overpass mirror: {ox.settings.overpass_url}")
     if place:
         logger.info(f"Downloading data for place: {place}")
 
-        # Загружаем только здания и POI
         gdf_buildings = ox.features_from_place(place, tags={"building": True})
         gdf_pois = ox.features_from_place(
             place, tags={"amenity": True, "shop": True, "leisure": True})
+        G = ox.graph_from_place(place, network_type="drive")
 
     else:
         assert None not in (north, south, east, west), "Provide bbox or place"
@@ -49,14 +96,15 @@ def main(place, north, south, east, west, out_dir):
         bbox = (north, south, east, west)
         logger.info(f"Downloading data for bbox: {bbox}")
 
-        # Загружаем только здания и POI
         gdf_buildings = ox.features_from_bbox(bbox, tags={"building": True})
         gdf_pois = ox.features_from_bbox(
             bbox, tags={"amenity": True, "shop": True, "leisure": True})
+        G = ox.graph_from_bbox(bbox, network_type="drive")
 
     # ---------- SAVE ----------
     bld_file = out / "buildings_osm.geojson"
     pois_file = out / "pois_osm.geojson"
+    edges_file = out / "roads_edges.geojson"
 
     logger.info(f"Saving {bld_file}")
     gdf_buildings.to_file(bld_file, driver="GeoJSON")
@@ -64,6 +112,13 @@ def main(place, north, south, east, west, out_dir):
     logger.info(f"Saving {pois_file}")
     gdf_pois.to_file(pois_file, driver="GeoJSON")
 
+    edges = ox.graph_to_gdfs(G, nodes=False, edges=True).reset_index()
+    # Упрощенные ребра osmnx хранят списки (osmid, highway): GeoJSON их не примет
+    for col in edges.columns.drop("geometry"):
+        edges[col] = edges[col].map(lambda v: v[0] if isinstance(v, list) else v)
+    logger.info(f"Saving {edges_file}")
+    edges.to_file(edges_file, driver="GeoJSON")
+
     logger.info("✅ OSM extraction completed successfully.")
 
 
@@ -1,34 +1,20 @@
-import geopandas as gpd
 import pandas as pd
 import numpy as np
 import os
 
+from region_schemas import load_region
+
 print("🚀 БЫСТРОЕ СОПОСТАВЛЕНИЕ")
 
-# 1. Загружаем точки населения Перми
+# 1. Загружаем точки населения Перми (колонки — по схеме региона)
 print("📥 Загружаем точки населения...")
-points = gpd.read_file("data/zones/perm_points.geojson")
+points = load_region("perm")
 print(f"   Загружено {len(points)} точек")
 
-# 2. Ищем колонку с населением
-population_col = None
-for col in points.columns:
-    if any(keyword in col.lower() for keyword in ['насел', 'нас', 'pop', 'inh', 'чн']):
-        population_col = col
-        break
-
-if population_col:
-    print(f"✅ Найдена колонка с населением: '{population_col}'")
-    print(f"   Общее население: {points[population_col].sum():,.0f} чел.")
-    print(f"   Среднее на точку: {points[population_col].mean():.1f} чел.")
-else:
-    print("⚠️ Колонка с населением не найдена!")
-    print("   Доступные колонки:", list(points.columns))
-    # Предположим, что это первая числовая колонка
-    numeric_cols = points.select_dtypes(include=[np.number]).columns
-    if len(numeric_cols) > 0:
-        population_col = numeric_cols[0]
-        print(f"   Используем колонку '{population_col}' по умолчанию")
+# 2. Колонка населения задана схемой региона
+population_col = "population"
+print(f"   Общее население: {points[population_col].sum():,.0f} чел.")
+print(f"   Среднее на точку: {points[population_col].mean():.1f} чел.")
 
 # 3. Создаем простые фичи для обучения
 print("\n🏗️ Создаем фичи для обучения...")
@@ -41,7 +27,7 @@ for idx, row in points.head(1000).iterrows():  # Берем первые 1000 т
         'bld_perimeter_m': np.random.uniform(20, 100),
         'area_perimeter_ratio': np.random.uniform(1, 5),
         'levels': np.random.randint(1, 5),
-        'population': row[population_col] if population_col else np.random.randint(10, 200)
+        'population': row[population_col]
     })
 
 # 4. Сохраняем
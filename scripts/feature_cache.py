@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+feature_cache.py
+Дисковый кэш групп фич с ключом по содержимому входов.
+Ключ группы — sha256 от содержимого нужных ей файлов (GeoJSON зданий, POI,
+дорог), параметров (радиусы, режимы) и CRS. Поменялся только POI-файл —
+пересчитывается только группа pois, остальные читаются с диска.
+Там же хранятся графы соседства зданий (scipy .npz).
+Размер кэша ограничен, старые записи вытесняются по LRU (время доступа).
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import pandas as pd
+from scipy.sparse import load_npz, save_npz
+
+logger = logging.getLogger(__name__)
+
+# Меняется при изменении формул фич: старые записи перестают совпадать
+CACHE_VERSION = 1
+HASH_CHUNK = 1024 * 1024
+
+# Уже посчитанные хэши: (путь, размер, mtime) -> sha256
+_DIGESTS = {}
+
+
+def file_digest(path):
+    """sha256 содержимого файла; в пределах процесса запоминается по (размер, mtime)"""
+    path = Path(path)
+    if not path.exists():
+        return "missing"
+    stat = path.stat()
+    memo_key = (str(path.resolve()), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(block)
+        _DIGESTS[memo_key] = h.hexdigest()
+    return _DIGESTS[memo_key]
+
+
+class FeatureCache:
+    """Кэш DataFrame'ов групп фич в папке root (один pickle на запись)"""
+
+    def __init__(self, root, max_mb=2048, refresh=()):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.refresh = set(refresh)
+        self.hits = 0
+        self.misses = 0
+        # Предел мог уменьшиться с прошлого запуска
+        self.evict()
+
+    def key(self, group, paths, params, crs):
+        """Ключ группы по содержимому входных файлов и параметрам"""
+        payload = {
+            "version": CACHE_VERSION,
+            "group": group,
+            "inputs": [file_digest(p) for p in paths],
+            "params": {k: list(v) if isinstance(v, (list, tuple)) else v
+                       for k, v in sorted(params.items())},
+            "crs": str(crs),
+        }
+        blob = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:32]
+
+    def path(self, group, key):
+        return self.root / f"{group}-{key}.pkl"
+
+    def get(self, group, key, index=None):
+        """DataFrame группы из кэша или None (промах, --refresh, не та длина)"""
+        path = self.path(group, key)
+        if group in self.refresh or not path.exists():
+            self.misses += 1
+            return None
+        try:
+            frame = pd.read_pickle(path)
+        except Exception as e:
+            logger.warning(f"Поврежденная запись кэша {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+        if index is not None:
+            if len(frame) != len(index):
+                self.misses += 1
+                return None
+            frame.index = index
+        # Время доступа для LRU
+        os.utime(path)
+        self.hits += 1
+        logger.info(f"Кэш: группа {group} загружена ({path.name})")
+        return frame
+
+    def put(self, group, key, frame):
+        """Сохраняет группу и при необходимости вытесняет старые записи"""
+        path = self.path(group, key)
+        tmp = path.with_suffix(".tmp")
+        frame.to_pickle(tmp)
+        os.replace(tmp, path)
+        self.evict()
+
+    def get_graph(self, key):
+        """Сохраненная разреженная матрица (граф соседства) или None"""
+        path = self.root / f"graph-{key}.npz"
+        if "graph" in self.refresh or not path.exists():
+            return None
+        try:
+            graph = load_npz(path)
+        except Exception as e:
+            logger.warning(f"Поврежденная запись кэша {path.name}: {e}")
+            path.unlink(missing_ok=True)
+            return None
+        os.utime(path)
+        logger.info(f"Кэш: граф соседства загружен ({path.name})")
+        return graph
+
+    def put_graph(self, key, graph):
+        path = self.root / f"graph-{key}.npz"
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        save_npz(tmp, graph)
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        """Удаляет самые давно использованные записи сверх max_bytes"""
+        entries = sorted([p for p in self.root.iterdir() if p.suffix in (".pkl", ".npz")
+                          and not p.name.endswith(".tmp.npz")],
+                         key=lambda p: p.stat().st_mtime)
+        total = sum(p.stat().st_size for p in entries)
+        for entry in entries:
+            if total <= self.max_bytes:
+                break
+            total -= entry.stat().st_size
+            entry.unlink(missing_ok=True)
+            logger.info(f"Кэш: вытеснена запись {entry.name}")
+
+    def summary(self):
+        return f"Кэш фич: попаданий {self.hits}, промахов {self.misses}"
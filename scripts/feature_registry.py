@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+feature_registry.py
+Реестр групп фич: каждая группа объявляет входные слои, параметры,
+относительную стоимость и колонки, которые она производит.
+По списку колонок модели (model_data["features"] из joblib) реестр
+составляет план — какие группы и с какими радиусами нужны, — так что
+ненужные группы (например, pois_within_500m) при предсказании не считаются.
+
+Шаблоны колонок:
+    "bld_area_m2"            — обычная колонка;
+    "pois_within_{poi_radii}m" — по колонке на каждый элемент параметра-списка;
+    "pois_{poi_categories}_within_{poi_radii}m" — на каждое сочетание;
+    "bld_type_*"             — любые колонки с таким префиксом.
+Элемент outputs может быть парой (шаблон, флаг): колонки этого шаблона
+появляются, только если включен булев параметр-флаг (например, builtup).
+Группа с enabled_by считается, только если включен такой флаг (или модели
+нужны ее колонки) — так подключаются дорогие необязательные стадии.
+"""
+
+import itertools
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_TEMPLATE_PARAM = re.compile(r"\{(\w+)\}")
+
+
+class FeatureGroup:
+    """Описание группы фич"""
+
+    def __init__(self, name, func, inputs, params, cost, outputs, enabled_by=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = list(params)
+        self.cost = cost
+        self.enabled_by = enabled_by
+        # (шаблон, флаг или None)
+        self.outputs = [o if isinstance(o, tuple) else (o, None) for o in outputs]
+
+    def flags(self):
+        return [flag for _, flag in self.outputs if flag]
+
+    def enabled(self, params):
+        """Считается ли группа при этих параметрах без явного плана"""
+        return self.enabled_by is None or bool(params.get(self.enabled_by))
+
+    def columns(self, params):
+        """Колонки группы при данных параметрах (шаблоны с * не раскрываются)"""
+        names = []
+        for template, flag in self.outputs:
+            if flag and not params.get(flag):
+                continue
+            keys = _TEMPLATE_PARAM.findall(template)
+            for values in itertools.product(*(params[k] for k in keys)):
+                name = template
+                for key, value in zip(keys, values):
+                    name = name.replace("{%s}" % key, str(value))
+                names.append(name)
+        return names
+
+    def match(self, column):
+        """
+        (подходит ли колонка группе, нужные ей параметры): значение радиуса
+        из шаблона и True для флага, который включает колонку (или группу)
+        """
+        for template, flag in self.outputs:
+            values = {flag: True} if flag else {}
+            if self.enabled_by:
+                values[self.enabled_by] = True
+            keys = _TEMPLATE_PARAM.findall(template)
+            if keys:
+                pattern = "".join(re.escape(part) if i % 2 == 0 else r"(.+)"
+                                  for i, part in enumerate(_TEMPLATE_PARAM.split(template)))
+                found = re.fullmatch(pattern, column)
+                if found:
+                    for key, value in zip(keys, found.groups()):
+                        values[key] = int(value) if value.isdigit() else value
+                    return True, values
+            elif template.endswith("*"):
+                if column.startswith(template[:-1]):
+                    return True, values
+            elif template == column:
+                return True, values
+        return False, {}
+
+
+class FeatureRegistry:
+    """Упорядоченный набор групп; порядок регистрации = порядок колонок"""
+
+    def __init__(self):
+        self.groups = {}
+
+    def register(self, name, inputs, params=(), cost=1, outputs=(), enabled_by=None):
+        """Декоратор функции группы: func(ctx, **params) -> DataFrame"""
+        def decorator(func):
+            self.groups[name] = FeatureGroup(name, func, inputs, params, cost,
+                                             outputs, enabled_by)
+            return func
+        return decorator
+
+    def names(self, params=None):
+        """Имена групп; с params — только включенные при этих параметрах"""
+        return [g.name for g in self if params is None or g.enabled(params)]
+
+    def __iter__(self):
+        return iter(self.groups.values())
+
+    def __getitem__(self, name):
+        return self.groups[name]
+
+    def plan(self, required, params, always=()):
+        """
+        Какие группы считать для колонок required и с какими параметрами.
+        Списочные параметры (радиусы) сужаются до реально нужных значений,
+        флаги включаются, только если модели нужны их колонки.
+        Возвращает (список групп, параметры, колонки, которые никто не производит).
+        """
+        needed = {name: {} for name in always}
+        unknown = []
+        for column in required:
+            for group in self:
+                ok, values = group.match(column)
+                if ok:
+                    wanted = needed.setdefault(group.name, {})
+                    for param, value in values.items():
+                        if isinstance(value, bool):
+                            wanted[param] = value
+                        else:
+                            wanted.setdefault(param, set()).add(value)
+                    break
+            else:
+                unknown.append(column)
+
+        planned = dict(params)
+        for group in self:
+            if group.enabled_by:
+                planned[group.enabled_by] = group.name in needed
+        for name, wanted in needed.items():
+            for flag in self[name].flags():
+                planned[flag] = False
+            # Списки без нужных модели колонок (например, радиусы при нужных
+            # только расстояниях) сужаются до пустых
+            for template, _ in self[name].outputs:
+                for param in _TEMPLATE_PARAM.findall(template):
+                    planned[param] = []
+            for param, values in wanted.items():
+                planned[param] = values if isinstance(values, bool) else sorted(values)
+        groups = [name for name in self.names() if name in needed]
+
+        skipped = [g for g in self if g.name not in needed]
+        if skipped:
+            saved = sum(g.cost for g in skipped)
+            total = sum(g.cost for g in self)
+            logger.info(f"Модели не нужны группы {[g.name for g in skipped]} "
+                        f"(~{saved}/{total} условной стоимости не считаем)")
+        return groups, planned, unknown
@@ -10,147 +10,645 @@ import logging
 from pathlib import Path
 import click
 import geopandas as gpd
+import joblib
 import pandas as pd
 import numpy as np
+import pyogrio
+import shapely
+
+from category_encoder import MODES, CategoryEncoder, load_encoders, save_encoders
+from feature_cache import FeatureCache
+from feature_registry import FeatureRegistry
+from featurize_parallel import make_runner
+from imputation import knn_impute
+from kernel_density import KERNELS, kernel_densities, kernel_support, line_pieces
+from morphology import neighbour_metrics, shape_metrics
+from neighbour_graph import build_graph, neighbour_count, neighbour_mean
+from network_features import network_accessibility
+from raster_features import raster_columns, raster_zonal_features
+from spatial_features import (
+    count_within_radii, category_counts_within_radii, clipped_length_within_radii,
+    building_density, nearest_by_code, nearest_distance, poi_category)
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Проекция для метрических расчетов
+METRIC_CRS = "EPSG:3857"
 
-@click.command()
-@click.option("--buildings", default="data/osm/buildings_osm.geojson")
-@click.option("--pois", default="data/osm/pois_osm.geojson")
-@click.option("--roads", default="data/osm/roads_edges.geojson")
-@click.option("--out-csv", default="data/features/building_features.csv")
-def main(buildings, pois, roads, out_csv):
-    # Загружаем данные
-    bld = gpd.read_file(buildings)
+# Группы фич в порядке колонок итоговой таблицы: входные слои и параметры
+# (для ключа кэша), условная стоимость и производимые колонки (для плана модели)
+REGISTRY = FeatureRegistry()
 
-    # Проверяем, какие файлы существуют
+# Параметры групп по умолчанию (совпадают с опциями CLI)
+DEFAULT_PARAMS = dict(
+    poi_radii=(100, 250, 500),
+    poi_categories=(),
+    road_radii=(250,),
+    density_radii=(100,),
+    density_mode="exact",
+    builtup=False,
+    network=False,
+    network_radii=(500, 1000, 2000),
+    network_categories=("school", "kindergarten", "clinic", "hospital",
+                        "pharmacy", "shop"),
+    network_cutoff=3000,
+    kde=False,
+    kde_bandwidths=(250, 500, 1000),
+    kde_kernel="gauss",
+    kde_cell=10.0,
+    morphology=False,
+    morphology_max_distance=500,
+    nearest=False,
+    nearest_categories=("school", "kindergarten", "clinic", "pharmacy", "shop"),
+    nearest_max_distance=5000,
+    city_center=(56.2502, 58.0105),
+    lag=False,
+    lag_radius=200,
+    raster=False,
+    raster_files=(),
+    raster_buffer=100,
+    impute=True,
+    impute_k=8,
+    impute_max_distance=500,
+    type_encoder=None)
+
+# Префикс колонок типа здания (тег building)
+TYPE_PREFIX = "bld_type"
+
+# Значения highway, которые считаются магистралями
+MAJOR_HIGHWAYS = {"motorway", "trunk", "primary", "secondary",
+                  "motorway_link", "trunk_link", "primary_link", "secondary_link"}
+
+
+def parse_radii(ctx, param, value):
+    """Разбирает список радиусов вида "100,250,500" (метры)"""
     try:
-        pois_gdf = gpd.read_file(pois)
-        has_pois = True
-    except:
-        logger.warning(f"POI файл не найден: {pois}. Пропускаем POI фичи.")
-        has_pois = False
-        pois_gdf = None
+        radii = sorted({int(r) for r in str(value).split(",") if r.strip()})
+    except ValueError:
+        raise click.BadParameter(f"ожидается список целых радиусов: {value}")
+    if not radii or min(radii) <= 0:
+        raise click.BadParameter(f"радиусы должны быть положительными: {value}")
+    return radii
+
 
+def parse_point(ctx, param, value):
+    """Разбирает точку вида "lon,lat" """
     try:
-        roads_gdf = gpd.read_file(roads)
-        has_roads = True
-    except:
-        logger.warning(
-            f"Дороги файл не найден: {roads}. Пропускаем дорожные фичи.")
-        has_roads = False
-        roads_gdf = None
-
-    # Базовые фичи (всегда работают)
-    if bld.crs is None:
-        bld.set_crs(epsg=4326, inplace=True)
+        lon, lat = (float(v) for v in str(value).split(","))
+    except ValueError:
+        raise click.BadParameter(f"ожидается lon,lat: {value}")
+    return lon, lat
+
+
+def load_layer(path, what, bbox=None):
+    """Читает слой (целиком или только bbox); None, если файла нет"""
+    try:
+        return gpd.read_file(path, bbox=bbox)
+    except Exception:
+        logger.warning(f"{what} файл не найден: {path}. Пропускаем {what} фичи.")
+        return None
+
+
+def resolve_layer(layer, what):
+    """GeoDataFrame как есть; путь читается только когда группа реально считается"""
+    if layer is None or isinstance(layer, gpd.GeoDataFrame):
+        return layer
+    return load_layer(layer, what)
+
+
+def ctx_layer(ctx, name, what):
+    """Слой контекста (pois/roads): файл читается один раз на все группы"""
+    ctx[name] = resolve_layer(ctx[name], what)
+    return ctx[name]
+
+
+def parse_names(ctx, param, value):
+    """Разбирает список имен вида "school,pharmacy" (пустая строка — пустой список)"""
+    return [v.strip() for v in str(value or "").split(",") if v.strip()]
+
+
+def read_building_tags(path):
+    """Только колонка building слоя (без геометрий); None, если ее нет"""
+    if "building" not in pyogrio.read_info(path)["fields"]:
+        return None
+    return pyogrio.read_dataframe(path, columns=["building"], read_geometry=False)["building"]
+
 
-    # Проекция для метрических расчетов
-    metric_crs = "EPSG:3857"
-    bld_proj = bld.to_crs(metric_crs)
+def fit_type_encoder(tags, mode="vocab", max_categories=16):
+    """Описание кодировщика типов по тегам building (None — тегов нет)"""
+    if tags is None:
+        tags = pd.Series([], dtype=object)
+    return CategoryEncoder.fit(tags, TYPE_PREFIX, mode=mode, max_categories=max_categories,
+                               buckets=max_categories).to_dict()
+
+
+def model_type_encoder(model_data):
+    """
+    Кодировщик типов модели: сохраненный при обучении или (старые модели)
+    восстановленный по колонкам bld_type_* из model_data["features"]
+    """
+    spec = model_data.get("encoders", {}).get("building")
+    if spec:
+        return spec
+    return CategoryEncoder.from_columns(model_data["features"], TYPE_PREFIX).to_dict()
+
+
+@REGISTRY.register(
+    "geometry", inputs=["buildings"],
+    params=["type_encoder", "impute", "impute_k", "impute_max_distance"], cost=1,
+    outputs=["bld_area_m2", "bld_perimeter_m", "centroid_lon", "centroid_lat",
+             "has_building_tag", "bld_type_*", "area_numeric", "height_numeric",
+             "levels_numeric", "height_imputed", "levels_imputed",
+             "area_to_perimeter_ratio", "volume_estimate"])
+def geometry_features(ctx, type_encoder, impute, impute_k, impute_max_distance, **_):
+    """Группа geometry: площадь, периметр, центроид и атрибуты OSM"""
+    bld, bld_proj = ctx["bld"], ctx["bld_proj"]
+    out = pd.DataFrame(index=bld.index)
 
     # 1. Простые геометрические фичи
-    bld["bld_area_m2"] = bld_proj.geometry.area
-    bld["bld_perimeter_m"] = bld_proj.geometry.length
-    bld["centroid_lon"] = bld.geometry.centroid.x
-    bld["centroid_lat"] = bld.geometry.centroid.y
+    out["bld_area_m2"] = bld_proj.geometry.area
+    out["bld_perimeter_m"] = bld_proj.geometry.length
+    out["centroid_lon"] = bld.geometry.centroid.x
+    out["centroid_lat"] = bld.geometry.centroid.y
 
     # 2. Фичи из атрибутов (если есть)
+    # Кодируем типы зданий: набор колонок задан кодировщиком, а не файлом
+    encoder = CategoryEncoder.from_dict(type_encoder)
     if "building" in bld.columns:
-        bld["has_building_tag"] = bld["building"].notnull().astype(int)
-        # Кодируем типы зданий
-        building_types = pd.get_dummies(
-            bld["building"].fillna("unknown"), prefix="bld_type")
-        bld = pd.concat([bld, building_types], axis=1)
+        out["has_building_tag"] = bld["building"].notnull().astype(int)
+        tags = bld["building"]
     else:
-        bld["has_building_tag"] = 0
+        out["has_building_tag"] = 0
+        tags = pd.Series(None, index=bld.index, dtype=object)
+    out = pd.concat([out, encoder.transform(tags)], axis=1)
 
     if "area" in bld.columns:
-        bld["area_numeric"] = pd.to_numeric(
+        out["area_numeric"] = pd.to_numeric(
             bld["area"], errors='coerce').fillna(0)
     else:
-        bld["area_numeric"] = bld["bld_area_m2"]
+        out["area_numeric"] = out["bld_area_m2"]
+
+    # Высота и этажность: пропуски — по похожим соседям (или 1, как раньше)
+    context_proj = ctx["context_proj"]
+    context_xy = shapely.get_coordinates(np.asarray(context_proj.geometry.centroid))
+    context_area = context_proj.geometry.area.to_numpy()
+    core_index = ctx["core_index"]
+    for column, tag in (("height", "height"), ("levels", "building:levels")):
+        if tag in context_proj.columns:
+            values = pd.to_numeric(context_proj[tag], errors="coerce").to_numpy(dtype=float)
+        else:
+            values = np.full(len(context_proj), np.nan)
+        if impute:
+            filled, imputed = knn_impute(
+                context_xy[core_index], context_area[core_index], values[core_index],
+                known_xy=context_xy, known_area=context_area, known_values=values,
+                k=impute_k, max_distance=impute_max_distance)
+        else:
+            imputed = np.isnan(values[core_index])
+            filled = np.where(imputed, 1.0, values[core_index])
+        if column == "levels":
+            filled = np.maximum(np.round(filled), 1.0)
+        out[f"{column}_numeric"] = filled
+        out[f"{column}_imputed"] = imputed.astype(np.int8)
+    return out
 
-    if "height" in bld.columns:
-        bld["height_numeric"] = pd.to_numeric(
-            bld["height"], errors='coerce').fillna(1)
-    else:
-        bld["height_numeric"] = 1
+
+@REGISTRY.register("pois", inputs=["buildings", "pois"],
+                   params=["poi_radii", "poi_categories"], cost=3,
+                   outputs=["pois_within_{poi_radii}m",
+                            "pois_{poi_categories}_within_{poi_radii}m"])
+def poi_features(ctx, poi_radii, poi_categories, **_):
+    """
+    Группа pois: число POI в буферах вокруг центроида — всего и по
+    категориям poi_categories (школы, магазины, ...) за один проход
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    pois_gdf = ctx_layer(ctx, "pois", "POI")
+
+    def fill_zeros():
+        for r in poi_radii:
+            out[f"pois_within_{r}m"] = 0
+        for cat in poi_categories:
+            for r in poi_radii:
+                out[f"pois_{cat}_within_{r}m"] = 0
 
     # 3. Пространственные фичи (если есть POI)
-    if has_pois and pois_gdf is not None:
-        # Простой счетчик POI в буфере (упрощенная версия)
-        pois_proj = pois_gdf.to_crs(metric_crs)
-        bld_proj["centroid"] = bld_proj.geometry.centroid
-
-        for r in [100, 250, 500]:  # метры
-            try:
-                # Создаем буферы вокруг центроидов
-                buffers = bld_proj["centroid"].buffer(r)
-
-                # Простой spatial join (без оптимизации для теста)
-                count = []
-                for buf in buffers:
-                    # Считаем POI внутри буфера
-                    in_buffer = pois_proj[pois_proj.intersects(buf)]
-                    count.append(len(in_buffer))
-
-                bld[f"pois_within_{r}m"] = count
-            except Exception as e:
-                logger.warning(f"Не удалось посчитать POI в радиусе {r}м: {e}")
-                bld[f"pois_within_{r}m"] = 0
+    if pois_gdf is not None:
+        # Один запрос к STRtree на максимальном радиусе для всех зданий
+        pois_proj = pois_gdf.to_crs(METRIC_CRS)
+
+        try:
+            if poi_categories:
+                # Категории — one-hot матрица; новые категории почти бесплатны
+                position = {cat: i for i, cat in enumerate(poi_categories)}
+                codes = np.array([position.get(c, -1) for c in poi_category(pois_proj)],
+                                 dtype=np.int64)
+                poi_counts, by_category = ctx["runner"].map(
+                    category_counts_within_radii, ctx["centroids"], pois_proj.geometry,
+                    radii=poi_radii, codes=codes, n_codes=len(poi_categories))
+            else:
+                poi_counts = ctx["runner"].map(count_within_radii, ctx["centroids"],
+                                               pois_proj.geometry, radii=poi_radii)
+            for r in poi_radii:
+                out[f"pois_within_{r}m"] = poi_counts[r]
+            for i, cat in enumerate(poi_categories):
+                for r in poi_radii:
+                    out[f"pois_{cat}_within_{r}m"] = by_category[r][:, i]
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать POI в радиусах {poi_radii}: {e}")
+            fill_zeros()
     else:
         # Заполняем нулями если нет POI
-        for r in [100, 250, 500]:
-            bld[f"pois_within_{r}m"] = 0
+        fill_zeros()
+    return out
+
+
+@REGISTRY.register("roads", inputs=["buildings", "roads"], params=["road_radii"],
+                   cost=4, outputs=["roadlen_{road_radii}m"])
+def road_features(ctx, road_radii, **_):
+    """Группа roads: длина дорог внутри буферов вокруг центроида"""
+    out = pd.DataFrame(index=ctx["bld"].index)
+    roads_gdf = ctx_layer(ctx, "roads", "Дороги")
 
     # 4. Дорожные фичи (если есть дороги)
-    if has_roads and roads_gdf is not None:
+    if roads_gdf is not None:
         try:
-            roads_proj = roads_gdf.to_crs(metric_crs)
-            bld_proj["centroid"] = bld_proj.geometry.centroid
-
-            # Простой расчет длины дорог в буфере 250м
-            road_lengths = []
-            for centroid in bld_proj["centroid"]:
-                buf = centroid.buffer(250)
-                roads_in_buffer = roads_proj[roads_proj.intersects(buf)]
-                if len(roads_in_buffer) > 0:
-                    # Приблизительная длина
-                    total_length = roads_in_buffer.geometry.length.sum()
-                    road_lengths.append(total_length)
-                else:
-                    road_lengths.append(0)
-
-            bld["roadlen_250m"] = road_lengths
+            roads_proj = roads_gdf.to_crs(METRIC_CRS)
+
+            # Длина дорог, обрезанных буфером (а не полная длина задетых ребер)
+            road_lengths = ctx["runner"].map(clipped_length_within_radii, ctx["centroids"],
+                                             roads_proj.geometry, radii=road_radii)
+            for r in road_radii:
+                out[f"roadlen_{r}m"] = road_lengths[r]
         except Exception as e:
             logger.warning(f"Не удалось посчитать длину дорог: {e}")
-            bld["roadlen_250m"] = 0
+            for r in road_radii:
+                out[f"roadlen_{r}m"] = 0
     else:
-        bld["roadlen_250m"] = 0
+        for r in road_radii:
+            out[f"roadlen_{r}m"] = 0
+    return out
+
 
-    # 5. Плотность зданий (простая версия)
+@REGISTRY.register(
+    "density", inputs=["buildings"],
+    params=["density_radii", "density_mode", "builtup"], cost=3,
+    outputs=["bld_density_{density_radii}m",
+             ("bld_builtup_ratio_{density_radii}m", "builtup")])
+def density_features(ctx, density_radii, density_mode, builtup, **_):
+    """Группа density: плотность застройки (и доля застроенной площади)"""
+    out = pd.DataFrame(index=ctx["bld"].index)
+    context_proj = ctx["context_proj"]
+
+    # 5. Плотность зданий (один запрос к индексу на все здания и радиусы)
     try:
-        densities = []
-        for i, geom in enumerate(bld_proj.geometry):
-            buf = geom.buffer(100)
-            # Считаем сколько зданий в буфере (включая само здание)
-            nearby = bld_proj[bld_proj.intersects(buf)]
-            density = len(nearby) / (buf.area / 10000.0) if buf.area > 0 else 0
-            densities.append(density)
-        bld["bld_density_100m"] = densities
+        densities, builtup_ratios = ctx["runner"].map(
+            building_density, ctx["bld_proj"].geometry, context_proj.geometry,
+            index="kdtree" if density_mode == "centroid" else "strtree",
+            radii=density_radii, mode=density_mode,
+            target_areas=context_proj.geometry.area.to_numpy() if builtup else None)
+        for r in density_radii:
+            out[f"bld_density_{r}m"] = densities[r]
+            if builtup:
+                out[f"bld_builtup_ratio_{r}m"] = builtup_ratios[r]
     except Exception as e:
         logger.warning(f"Не удалось посчитать плотность зданий: {e}")
-        bld["bld_density_100m"] = 0
+        # Набор колонок не должен зависеть от того, упала ли группа
+        for r in density_radii:
+            out[f"bld_density_{r}m"] = 0
+            if builtup:
+                out[f"bld_builtup_ratio_{r}m"] = 0.0
+    return out
+
+
+@REGISTRY.register(
+    "network", inputs=["buildings", "roads", "pois"],
+    params=["network_radii", "network_categories", "network_cutoff"], cost=5,
+    outputs=["net_dist_{network_categories}_m", "net_pois_{network_radii}m"],
+    enabled_by="network")
+def network_features(ctx, network_radii, network_categories, network_cutoff, **_):
+    """
+    Группа network: расстояние по дорожной сети до ближайшего POI каждой
+    категории (не дальше network_cutoff) и число POI, достижимых по сети
+    в пределах радиусов
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    pois_gdf = ctx_layer(ctx, "pois", "POI")
+    roads_gdf = ctx_layer(ctx, "roads", "Дороги")
+
+    def fill_defaults():
+        for cat in network_categories:
+            out[f"net_dist_{cat}_m"] = float(network_cutoff)
+        for r in network_radii:
+            out[f"net_pois_{r}m"] = 0
+        return out
+
+    if pois_gdf is None or roads_gdf is None:
+        return fill_defaults()
+    try:
+        pois_proj = pois_gdf.to_crs(METRIC_CRS)
+        distances, counts = network_accessibility(
+            shapely.get_coordinates(np.asarray(ctx["centroids"])),
+            shapely.get_coordinates(np.asarray(pois_proj.geometry.centroid)),
+            poi_category(pois_proj), roads_gdf.to_crs(METRIC_CRS),
+            categories=network_categories, radii=network_radii, cutoff=network_cutoff)
+    except Exception as e:
+        logger.warning(f"Не удалось посчитать сетевую доступность: {e}")
+        return fill_defaults()
+    for cat in network_categories:
+        out[f"net_dist_{cat}_m"] = distances[cat]
+    for r in network_radii:
+        out[f"net_pois_{r}m"] = counts[r]
+    return out
+
+
+@REGISTRY.register(
+    "kde", inputs=["buildings", "pois", "roads"],
+    params=["kde_bandwidths", "kde_kernel", "kde_cell"], cost=2,
+    outputs=["kde_pois_{kde_bandwidths}m", "kde_footprint_{kde_bandwidths}m",
+             "kde_roadlen_{kde_bandwidths}m"],
+    enabled_by="kde")
+def kde_features(ctx, kde_bandwidths, kde_kernel, kde_cell, **_):
+    """
+    Группа kde: ядерные (FFT на растре kde_cell м) оценки числа POI,
+    площади пятен застройки и длины дорог вокруг здания
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    pois_gdf = ctx_layer(ctx, "pois", "POI")
+    roads_gdf = ctx_layer(ctx, "roads", "Дороги")
+    context_proj = ctx["context_proj"]
+
+    layers = {"footprint": (shapely.get_coordinates(
+        np.asarray(context_proj.geometry.centroid)), context_proj.geometry.area.to_numpy())}
+    if pois_gdf is not None:
+        layers["pois"] = (shapely.get_coordinates(
+            np.asarray(pois_gdf.to_crs(METRIC_CRS).geometry.centroid)), None)
+    if roads_gdf is not None:
+        layers["roadlen"] = line_pieces(roads_gdf.to_crs(METRIC_CRS).geometry, kde_cell)
+    try:
+        values = kernel_densities(shapely.get_coordinates(np.asarray(ctx["centroids"])),
+                                  layers, kde_bandwidths, kernel=kde_kernel, cell=kde_cell)
+    except Exception as e:
+        logger.warning(f"Не удалось посчитать ядерные плотности: {e}")
+        values = {}
+    for name in ("pois", "footprint", "roadlen"):
+        for b in kde_bandwidths:
+            out[f"kde_{name}_{b}m"] = values[name][b] if name in values else 0.0
+    return out
+
+
+@REGISTRY.register(
+    "morphology", inputs=["buildings"], params=["morphology_max_distance"], cost=2,
+    outputs=["bld_compactness", "bld_elongation", "bld_orientation_deg",
+             "bld_convexity", "bld_n_vertices", "bld_n_holes", "bld_nn_dist_m",
+             "bld_shared_wall_m"],
+    enabled_by="morphology")
+def morphology_features(ctx, morphology_max_distance, **_):
+    """Группа morphology: форма пятна и соседство с другими зданиями"""
+    out = pd.DataFrame(index=ctx["bld"].index)
+    shape = shape_metrics(ctx["bld_proj"].geometry)
+    out["bld_compactness"] = shape["compactness"]
+    out["bld_elongation"] = shape["elongation"]
+    out["bld_orientation_deg"] = shape["orientation"]
+    out["bld_convexity"] = shape["convexity"]
+    out["bld_n_vertices"] = shape["n_vertices"]
+    out["bld_n_holes"] = shape["n_holes"]
+
+    # Соседи ищутся среди всех прочитанных зданий (с ореолом тайла)
+    try:
+        nn_dist, shared = ctx["runner"].map(
+            neighbour_metrics, ctx["bld_proj"].geometry, ctx["context_proj"].geometry,
+            max_distance=morphology_max_distance)
+    except Exception as e:
+        logger.warning(f"Не удалось посчитать соседство зданий: {e}")
+        nn_dist, shared = float(morphology_max_distance), 0.0
+    out["bld_nn_dist_m"] = nn_dist
+    out["bld_shared_wall_m"] = shared
+    return out
+
+
+def major_road_mask(roads_gdf):
+    """Магистрали по тегу highway (у osmnx бывает список значений)"""
+    if "highway" not in roads_gdf.columns:
+        return np.zeros(len(roads_gdf), dtype=bool)
+    values = roads_gdf["highway"].reset_index(drop=True).explode()
+    hit = values.astype(str).isin(MAJOR_HIGHWAYS)
+    return hit.groupby(level=0).any().to_numpy()
+
+
+@REGISTRY.register(
+    "nearest", inputs=["buildings", "roads", "pois"],
+    params=["nearest_categories", "nearest_max_distance", "city_center"], cost=2,
+    outputs=["dist_road_m", "dist_major_road_m", "dist_{nearest_categories}_m",
+             "dist_center_m"],
+    enabled_by="nearest")
+def nearest_features(ctx, nearest_categories, nearest_max_distance, city_center, **_):
+    """
+    Группа nearest: расстояние от центроида до ближайшей дороги, магистрали,
+    POI каждой категории (не дальше nearest_max_distance) и до центра города
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    pois_gdf = ctx_layer(ctx, "pois", "POI")
+    roads_gdf = ctx_layer(ctx, "roads", "Дороги")
+    centroids = ctx["centroids"]
+    runner = ctx["runner"]
+    far = float(nearest_max_distance)
+
+    out["dist_road_m"] = far
+    out["dist_major_road_m"] = far
+    if roads_gdf is not None and len(roads_gdf):
+        roads_proj = roads_gdf.to_crs(METRIC_CRS)
+        major = major_road_mask(roads_gdf)
+        out["dist_road_m"] = runner.map(nearest_distance, centroids, roads_proj.geometry,
+                                        max_distance=far)
+        if major.any():
+            out["dist_major_road_m"] = runner.map(
+                nearest_distance, centroids, roads_proj.geometry[major], max_distance=far)
+
+    nearest_poi = np.full((len(out), len(nearest_categories)), far)
+    if pois_gdf is not None and len(pois_gdf) and nearest_categories:
+        pois_proj = pois_gdf.to_crs(METRIC_CRS)
+        position = {cat: i for i, cat in enumerate(nearest_categories)}
+        codes = np.array([position.get(c, -1) for c in poi_category(pois_proj)],
+                         dtype=np.int64)
+        nearest_poi = runner.map(nearest_by_code, centroids, pois_proj.geometry.centroid,
+                                 index="kdtree", codes=codes, n_codes=len(nearest_categories),
+                                 max_distance=far)
+    for i, cat in enumerate(nearest_categories):
+        out[f"dist_{cat}_m"] = nearest_poi[:, i]
+
+    # Центр города — одна точка, расстояние без индекса и без предела
+    center = gpd.GeoSeries(gpd.points_from_xy([city_center[0]], [city_center[1]]),
+                           crs="EPSG:4326").to_crs(METRIC_CRS).iloc[0]
+    out["dist_center_m"] = centroids.distance(center).to_numpy()
+    return out
+
+
+def ctx_graph(ctx, radius):
+    """
+    Граф соседства зданий в радиусе (строки — здания core, столбцы — все
+    прочитанные). Строится один раз на запуск; при полном расчете с кэшем
+    хранится на диске с ключом по содержимому слоя зданий и радиусу.
+    """
+    memo = ctx.setdefault("graphs", {})
+    if radius in memo:
+        return memo[radius]
+    cache, key = ctx["cache"], None
+    if cache is not None and len(ctx["core_index"]) == len(ctx["context_proj"]):
+        key = cache.key("graph", [ctx["cache_inputs"]["buildings"]],
+                        {"radius": radius}, METRIC_CRS)
+        memo[radius] = cache.get_graph(key)
+    if memo.get(radius) is None:
+        context_xy = shapely.get_coordinates(np.asarray(ctx["context_proj"].geometry.centroid))
+        memo[radius] = build_graph(context_xy[ctx["core_index"]], context_xy, radius,
+                                   self_index=ctx["core_index"])
+        if key is not None:
+            cache.put_graph(key, memo[radius])
+    return memo[radius]
+
+
+@REGISTRY.register(
+    "lag", inputs=["buildings"], params=["lag_radius", "type_encoder"], cost=2,
+    outputs=["lag_n_neighbours", "lag_mean_area_m2", "lag_mean_height_m",
+             "lag_bld_type_*"],
+    enabled_by="lag")
+def lag_features(ctx, lag_radius, type_encoder, **_):
+    """
+    Группа lag: пространственный лаг по графу соседей в радиусе lag_radius —
+    число соседей, их средняя площадь и высота, доли типов зданий
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    context_proj = ctx["context_proj"]
+    graph = ctx_graph(ctx, lag_radius)
+
+    out["lag_n_neighbours"] = neighbour_count(graph)
+    out["lag_mean_area_m2"] = neighbour_mean(graph, context_proj.geometry.area.to_numpy())
+    height = pd.to_numeric(context_proj.get("height", pd.Series(np.nan, index=context_proj.index)),
+                           errors="coerce").to_numpy(dtype=float)
+    out["lag_mean_height_m"] = neighbour_mean(graph, height, known=~np.isnan(height))
+
+    encoder = CategoryEncoder.from_dict(type_encoder)
+    tags = context_proj.get("building", pd.Series(None, index=context_proj.index, dtype=object))
+    shares = neighbour_mean(graph, encoder.transform(tags).to_numpy())
+    for i, col in enumerate(encoder.columns):
+        out[f"lag_{col}"] = shares[:, i]
+    return out
+
+
+@REGISTRY.register(
+    "raster", inputs=["buildings", "rasters"], params=["raster_files", "raster_buffer"],
+    cost=3, outputs=["rast_*"], enabled_by="raster")
+def raster_features(ctx, raster_files, raster_buffer, **_):
+    """
+    Группа raster: зональные статистики локальных растров (mean, max, доля
+    пикселей > 0) по пятну здания и буферу raster_buffer м
+    """
+    out = pd.DataFrame(index=ctx["bld"].index)
+    for path in raster_files:
+        try:
+            values = raster_zonal_features(ctx["bld_proj"].geometry, METRIC_CRS, path,
+                                           buffer=raster_buffer)
+        except Exception as e:
+            logger.warning(f"Не удалось посчитать статистики растра {path}: {e}")
+            values = {col: np.nan for col in raster_columns(path, raster_buffer)}
+        for col, value in values.items():
+            out[col] = value
+    return out
+
+
+def feature_halo(poi_radii=(0,), road_radii=(0,), density_radii=(0,), network=False,
+                 network_cutoff=0, kde=False, kde_bandwidths=(0,), kde_kernel="gauss",
+                 morphology=False, morphology_max_distance=0, nearest=False,
+                 nearest_max_distance=0, lag=False, lag_radius=0, impute=False,
+                 impute_max_distance=0, **_):
+    """Наибольший радиус фич: дальше него изменения на здание не влияют"""
+    return max(max(poi_radii), max(road_radii), max(density_radii),
+               network_cutoff if network else 0,
+               kernel_support(max(kde_bandwidths), kde_kernel) if kde else 0,
+               morphology_max_distance if morphology else 0,
+               nearest_max_distance if nearest else 0,
+               lag_radius if lag else 0,
+               impute_max_distance if impute else 0)
+
+
+def compute_features(bld, pois_gdf=None, roads_gdf=None, core=None, workers=1,
+                     cache=None, cache_inputs=None, required=None, **params):
+    """
+    Считает фичи зданий bld. core — булева маска зданий, для которых нужны
+    фичи; остальные здания служат только соседями для плотности (ореол тайла).
+    workers > 1 — пространственные фичи считаются на пуле процессов.
+    params — параметры групп (радиусы, режимы), недостающие берутся
+    из DEFAULT_PARAMS.
+    pois_gdf / roads_gdf — GeoDataFrame или путь к файлу.
+    cache — FeatureCache; cache_inputs — пути входных слоев для ключей кэша
+    ({"buildings": ..., "pois": ..., "roads": ..., "rasters": [...]}).
+    required — колонки, нужные модели: считаются только группы (и радиусы),
+    которые их производят; None — все группы.
+    Возвращает bld[core] с добавленными колонками фич.
+    """
+    if bld.crs is None:
+        bld = bld.set_crs(epsg=4326)
+    if core is None:
+        core = np.ones(len(bld), dtype=bool)
+    core = np.asarray(core, dtype=bool)
+    params = {**DEFAULT_PARAMS, **params}
+    # Растровая группа включается самим списком растров
+    params["raster"] = bool(params["raster"] or params["raster_files"])
+    if params["type_encoder"] is None:
+        # Словарь типов по всем зданиям, а не по core-части
+        params["type_encoder"] = fit_type_encoder(bld.get("building"))
+    groups = REGISTRY.names(params)
+    if required is not None:
+        groups, params, unknown = REGISTRY.plan(required, params, always=["geometry"])
+        if unknown:
+            logger.warning(f"Эти колонки модели не производит ни одна группа: {unknown}")
+
+    # Контекст (все прочитанные здания) нужен для плотности и соседей
+    context_proj = bld.to_crs(METRIC_CRS)
+    bld = bld[core].copy()
+    bld_proj = context_proj[core].copy()
+    ctx = {"bld": bld, "bld_proj": bld_proj, "context_proj": context_proj,
+           "centroids": bld_proj.geometry.centroid, "runner": make_runner(workers),
+           "pois": pois_gdf, "roads": roads_gdf, "core_index": np.flatnonzero(core),
+           "cache": cache, "cache_inputs": cache_inputs}
+
+    frames = []
+    for group in REGISTRY:
+        if group.name not in groups:
+            continue
+        key = None
+        if cache is not None:
+            # Вход может быть списком файлов (растры)
+            paths = []
+            for name in group.inputs:
+                value = cache_inputs[name]
+                paths += list(value) if isinstance(value, (list, tuple)) else [value]
+            key = cache.key(group.name, paths,
+                            {p: params[p] for p in group.params}, METRIC_CRS)
+            frame = cache.get(group.name, key, index=bld.index)
+            if frame is not None:
+                frames.append(frame)
+                continue
+        frame = group.func(ctx, **params)
+        if cache is not None:
+            cache.put(group.name, key, frame)
+        frames.append(frame)
+    bld = pd.concat([bld] + frames, axis=1)
 
     # 6. Дополнительные фичи
     bld["area_to_perimeter_ratio"] = bld["bld_area_m2"] / \
         (bld["bld_perimeter_m"] + 1e-6)
     bld["volume_estimate"] = bld["bld_area_m2"] * bld["height_numeric"]
 
+    return bld
+
+
+def save_features(bld, out_csv, encoders=None):
+    """
+    Сохраняет числовые фичи в CSV и GeoJSON (с геометрией) и печатает сводку.
+    encoders — описания кодировщиков категорий (пишутся в <фичи>.encoders.json)
+    """
     # Сохраняем результат
     outp = Path(out_csv)
     outp.parent.mkdir(parents=True, exist_ok=True)
@@ -162,14 +660,18 @@ def main(buildings, pois, roads, out_csv):
     # Сохраняем CSV
     df_to_save.to_csv(out_csv, index=False)
 
-    # Сохраняем GeoJSON с геометрией (для визуализации)
-    geo_cols = list(numeric_cols) + ["geometry"]
+    # Сохраняем GeoJSON с геометрией (для визуализации); тип элемента OSM —
+    # для сопоставления по (тип, id) в featurize_incremental.py
+    type_cols = [c for c in ("element_type", "element") if c in bld.columns]
+    geo_cols = list(numeric_cols) + type_cols + ["geometry"]
     bld[geo_cols].to_file(str(outp).replace(
         ".csv", ".geojson"), driver="GeoJSON")
 
     logger.info(f"✅ Сохранено фичей: {len(bld)} объектов")
     logger.info(f"CSV: {out_csv} ({len(df_to_save.columns)} колонок)")
     logger.info(f"GeoJSON: {str(outp).replace('.csv', '.geojson')}")
+    if encoders:
+        logger.info(f"Кодировщики категорий: {save_encoders(encoders, out_csv)}")
 
     # Показываем статистику
     print("\n" + "=" * 50)
@@ -184,5 +686,142 @@ def main(buildings, pois, roads, out_csv):
     print("=" * 50)
 
 
+def feature_options(func):
+    """Опции параметров фич, общие для featurize_fixed и featurize_incremental"""
+    options = [
+        click.option("--poi-radii", default="100,250,500", callback=parse_radii,
+                     help="Радиусы подсчета POI в метрах, через запятую"),
+        click.option("--poi-categories", default="", callback=parse_names,
+                     help="Категории POI для отдельных счетчиков (school,shop,...), "
+                          "по умолчанию — только общий счетчик"),
+        click.option("--road-radii", default="250", callback=parse_radii,
+                     help="Радиусы длины дорог в буфере в метрах, через запятую"),
+        click.option("--density-radii", default="100", callback=parse_radii,
+                     help="Радиусы плотности застройки в метрах, через запятую"),
+        click.option("--density-mode", type=click.Choice(["exact", "centroid"]),
+                     default="exact",
+                     help="exact — буфер полигона (как раньше), centroid — быстрый поиск по центроидам"),
+        click.option("--builtup/--no-builtup", default=False,
+                     help="Дополнительно считать долю застроенной площади в радиусе"),
+        click.option("--network/--no-network", default=False,
+                     help="Считать доступность по дорожной сети (Dijkstra по графу дорог)"),
+        click.option("--network-radii", default="500,1000,2000", callback=parse_radii,
+                     help="Радиусы (по сети) подсчета достижимых POI в метрах"),
+        click.option("--network-categories",
+                     default="school,kindergarten,clinic,hospital,pharmacy,shop",
+                     callback=parse_names,
+                     help="Категории POI для расстояния до ближайшего по сети"),
+        click.option("--network-cutoff", type=float, default=3000,
+                     help="Предел сетевого поиска в метрах (дальше — значение предела)"),
+        click.option("--kde/--no-kde", default=False,
+                     help="Считать ядерные плотности на растре (FFT-свертка)"),
+        click.option("--kde-bandwidths", default="250,500,1000", callback=parse_radii,
+                     help="Ширины ядер в метрах (радиус disk / sigma gauss)"),
+        click.option("--kde-kernel", type=click.Choice(KERNELS), default="gauss",
+                     help="Форма ядра: gauss — плавный вес, disk — как буфер"),
+        click.option("--kde-cell", type=float, default=10.0,
+                     help="Размер клетки растра в метрах"),
+        click.option("--morphology/--no-morphology", default=False,
+                     help="Считать фичи формы и соседства зданий"),
+        click.option("--morphology-max-distance", type=float, default=500,
+                     help="Предел поиска ближайшего здания в метрах"),
+        click.option("--nearest/--no-nearest", default=False,
+                     help="Считать расстояния до ближайших дорог, POI и центра города"),
+        click.option("--nearest-categories",
+                     default="school,kindergarten,clinic,pharmacy,shop", callback=parse_names,
+                     help="Категории POI для расстояния до ближайшего"),
+        click.option("--nearest-max-distance", type=float, default=5000,
+                     help="Предел поиска ближайшего в метрах (дальше — значение предела)"),
+        click.option("--city-center", default="56.2502,58.0105", callback=parse_point,
+                     help="Центр города lon,lat (по умолчанию — Пермь)"),
+        click.option("--lag/--no-lag", default=False,
+                     help="Считать пространственный лаг по графу соседей"),
+        click.option("--lag-radius", type=float, default=200,
+                     help="Радиус графа соседей в метрах"),
+        click.option("--raster-file", "raster_files", multiple=True,
+                     help="Локальный растр (land cover, DEM, ночные огни) для "
+                          "зональных статистик; можно несколько"),
+        click.option("--raster-buffer", type=float, default=100,
+                     help="Буфер вокруг пятна для статистик растров, м (0 — без буфера)"),
+        click.option("--impute/--no-impute", default=True,
+                     help="Пропуски высоты и этажности — по K похожим соседям (иначе 1)"),
+        click.option("--impute-k", type=int, default=8,
+                     help="Сколько соседей усреднять при заполнении пропусков"),
+        click.option("--impute-max-distance", type=float, default=500,
+                     help="Предел поиска соседей для заполнения пропусков, м"),
+        click.option("--workers", type=int, default=1,
+                     help="Число процессов для пространственных фич"),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+@click.command()
+@click.option("--buildings", default="data/osm/buildings_osm.geojson")
+@click.option("--pois", default="data/osm/pois_osm.geojson")
+@click.option("--roads", default="data/osm/roads_edges.geojson")
+@click.option("--out-csv", default="data/features/building_features.csv")
+@feature_options
+@click.option("--tile-size", type=float, default=None,
+              help="Сторона тайла в метрах: считать регион по тайлам с ореолом")
+@click.option("--max-memory", type=float, default=None,
+              help="Бюджет памяти на тайл в МБ (подбирает размер тайла)")
+@click.option("--cache-dir", default="data/cache/features",
+              help="Папка кэша групп фич")
+@click.option("--cache-max-mb", type=float, default=2048,
+              help="Предельный размер кэша, МБ (вытеснение LRU)")
+@click.option("--no-cache", is_flag=True, help="Не читать и не писать кэш")
+@click.option("--refresh", multiple=True, type=click.Choice([*REGISTRY.names(), "graph"]),
+              help="Пересчитать группу, даже если она есть в кэше (можно несколько); "
+                   "graph — граф соседства зданий группы lag")
+@click.option("--model-joblib", default=None,
+              help="Считать только фичи, нужные этой модели (model_data['features']), "
+                   "типы зданий — ее кодировщиком")
+@click.option("--type-encoding", type=click.Choice(MODES), default="vocab",
+              help="vocab — словарь частых тегов + other, hash — фиксированные корзины")
+@click.option("--type-vocab", default=None,
+              help="Таблица фич обучения: взять ее кодировщик типов (<фичи>.encoders.json)")
+@click.option("--type-max-categories", type=int, default=16,
+              help="Размер словаря типов зданий (или число корзин для hash)")
+def main(buildings, pois, roads, out_csv, tile_size, max_memory, cache_dir,
+         cache_max_mb, no_cache, refresh, model_joblib, type_encoding, type_vocab,
+         type_max_categories, **params):
+    # Кодировщик типов: модели, заданной таблицы фич или подобранный по зданиям
+    if model_joblib:
+        model_data = joblib.load(model_joblib)
+        params["required"] = model_data["features"]
+        params["type_encoder"] = model_type_encoder(model_data)
+    elif type_vocab:
+        params["type_encoder"] = load_encoders(type_vocab).get("building")
+        if params["type_encoder"] is None:
+            raise click.ClickException(f"Нет кодировщика типов рядом с {type_vocab}")
+    else:
+        params["type_encoder"] = fit_type_encoder(
+            read_building_tags(buildings), mode=type_encoding,
+            max_categories=type_max_categories)
+
+    if tile_size or max_memory:
+        # Регион не грузится целиком: тайлы с ореолом читаются по bbox
+        from featurize_tiles import featurize_tiled
+        bld = featurize_tiled(buildings, pois, roads, tile_size=tile_size,
+                              max_memory=max_memory, **params)
+    else:
+        # Загружаем данные; POI и дороги читаются, только если их группы
+        # нет в кэше
+        bld = gpd.read_file(buildings)
+        cache = None if no_cache else FeatureCache(
+            cache_dir, max_mb=cache_max_mb, refresh=refresh)
+        bld = compute_features(bld, pois, roads, cache=cache,
+                               cache_inputs={"buildings": buildings, "pois": pois,
+                                             "roads": roads,
+                                             "rasters": params["raster_files"]},
+                               **params)
+        if cache is not None:
+            logger.info(cache.summary())
+
+    save_features(bld, out_csv, encoders={"building": params["type_encoder"]})
+
+
 if __name__ == "__main__":
     main()
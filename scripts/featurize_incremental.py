@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+featurize_incremental.py
+Инкрементальное обновление таблицы фич после обновления OSM.
+На вход — прошлая таблица фич (GeoJSON из featurize_fixed.py), текущие слои
+и список изменившихся id зданий, POI и дорог. Пересчитываются только здания,
+до которых изменение дотягивается в пределах максимального радиуса фич;
+остальные строки берутся из прошлой таблицы как есть.
+
+Формат файла изменений (JSON):
+    {"buildings": {"added": [...], "modified": [...], "removed": [...]},
+     "pois": {...}, "roads": {...}}
+Элемент списка — пара [тип, id] (["way", 123]): у узлов, линий и отношений
+OSM id пересекаются, и объекты сравниваются по типу (колонка element_type /
+element) и id. Голый id совпадает с объектом любого типа.
+Такой файл пишет osm_store.py apply (прошлые слои — *.prev.geojson).
+"""
+
+import json
+import logging
+
+import click
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely import STRtree
+
+from category_encoder import CategoryEncoder, load_encoders
+from featurize_fixed import (METRIC_CRS, TYPE_PREFIX, compute_features, feature_halo,
+                             feature_options, load_layer, save_features)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Колонки с OSM id в порядке предпочтения (osmnx пишет id / osmid)
+ID_COLUMNS = ["id", "osmid", "osm_id"]
+# Колонки с типом элемента OSM (node / way / relation)
+TYPE_COLUMNS = ["element_type", "element"]
+
+
+def find_id_column(gdf, preferred=None):
+    """Колонка с OSM id в слое"""
+    for col in ([preferred] if preferred else []) + ID_COLUMNS:
+        if col in gdf.columns:
+            return col
+    raise click.ClickException(f"В слое нет колонки id (ожидается одна из {ID_COLUMNS})")
+
+
+def find_type_column(gdf):
+    """Колонка с типом элемента OSM или None"""
+    return next((col for col in TYPE_COLUMNS if col in gdf.columns), None)
+
+
+def object_keys(gdf, column=None, typed=True):
+    """Ключи объектов слоя: "тип/id" (если есть колонка типа и typed) или "id" """
+    keys = gdf[find_id_column(gdf, column)].astype(str)
+    type_col = find_type_column(gdf) if typed else None
+    if type_col is not None:
+        keys = gdf[type_col].astype(str) + "/" + keys
+    return keys
+
+
+def match_ids(gdf, ids, column=None):
+    """
+    Маска объектов, чьи ключи входят в ids ("тип/id" или "id", см.
+    load_changes); id ребер дорог бывают списками
+    """
+    if gdf is None or not ids:
+        return np.zeros(0 if gdf is None else len(gdf), dtype=bool)
+    values = gdf[find_id_column(gdf, column)].reset_index(drop=True).explode().astype(str)
+    typed = {i for i in ids if "/" in i}
+    hit = values.isin({i for i in ids if "/" not in i})
+    if typed:
+        type_col = find_type_column(gdf)
+        if type_col is None:
+            # В слое нет типа (ребра дорог — всегда линии): сравниваем только id
+            hit |= values.isin({i.split("/", 1)[1] for i in typed})
+        else:
+            types = gdf[type_col].astype(str).reset_index(drop=True).reindex(values.index)
+            hit |= (types + "/" + values).isin(typed)
+    return hit.groupby(level=0).any().reindex(range(len(gdf)), fill_value=False).to_numpy()
+
+
+def change_key(item):
+    """Элемент списка изменений -> ключ: [тип, id] -> "тип/id", id -> "id" """
+    if isinstance(item, (list, tuple)):
+        kind, osm_id = item
+        return f"{kind}/{osm_id}"
+    return str(item)
+
+
+def load_changes(path):
+    """Файл изменений -> {слой: {added/modified/removed: [ключ]}}"""
+    with open(path, encoding="utf-8") as f:
+        raw = json.load(f)
+    return {layer: {kind: [change_key(item) for item in raw.get(layer, {}).get(kind, [])]
+                    for kind in ("added", "modified", "removed")}
+            for layer in ("buildings", "pois", "roads")}
+
+
+def changed_geometries(changes, layer, current, previous, column=None):
+    """Новые (added/modified) и старые (removed/modified) геометрии изменений слоя"""
+    parts = []
+    new_ids = changes[layer]["added"] + changes[layer]["modified"]
+    old_ids = changes[layer]["removed"] + changes[layer]["modified"]
+    if current is not None and new_ids:
+        parts.append(current.geometry[match_ids(current, new_ids, column)].to_crs(METRIC_CRS))
+    if old_ids:
+        if previous is None:
+            logger.warning(f"{layer}: нет прошлого слоя, старые геометрии "
+                           f"{len(old_ids)} удаленных/измененных объектов не учтены")
+        else:
+            parts.append(previous.geometry[match_ids(previous, old_ids, column)]
+                         .to_crs(METRIC_CRS))
+    if not parts:
+        return gpd.GeoSeries([], crs=METRIC_CRS)
+    return pd.concat(parts)
+
+
+def affected_buildings(bld, changed, halo):
+    """Здания, чей полигон ближе halo к любой изменившейся геометрии"""
+    if len(changed) == 0:
+        return np.zeros(len(bld), dtype=bool)
+    tree = STRtree(np.asarray(changed.geometry))
+    src, _ = tree.query(np.asarray(bld.to_crs(METRIC_CRS).geometry),
+                        predicate="dwithin", distance=halo)
+    mask = np.zeros(len(bld), dtype=bool)
+    mask[src] = True
+    return mask
+
+
+@click.command()
+@click.option("--prev-features", default="data/features/building_features.geojson",
+              help="Прошлая таблица фич (GeoJSON из featurize_fixed.py)")
+@click.option("--changes", required=True, help="JSON со списками изменившихся id")
+@click.option("--buildings", default="data/osm/buildings_osm.geojson")
+@click.option("--pois", default="data/osm/pois_osm.geojson")
+@click.option("--roads", default="data/osm/roads_edges.geojson")
+@click.option("--prev-pois", default=None, help="Прошлый слой POI (старые геометрии)")
+@click.option("--prev-roads", default=None, help="Прошлый слой дорог (старые геометрии)")
+@click.option("--id-column", default=None, help="Колонка id зданий (по умолчанию id/osmid/osm_id)")
+@click.option("--out-csv", default="data/features/building_features.csv")
+@feature_options
+def main(prev_features, changes, buildings, pois, roads, prev_pois, prev_roads,
+         id_column, out_csv, **params):
+    changes = load_changes(changes)
+
+    # 1. Прошлая таблица и текущие слои; типы зданий — словарем прошлой таблицы
+    prev = gpd.read_file(prev_features)
+    encoders = load_encoders(prev_features)
+    if "building" not in encoders:
+        encoders["building"] = CategoryEncoder.from_columns(prev.columns, TYPE_PREFIX).to_dict()
+    params["type_encoder"] = encoders["building"]
+    bld = gpd.read_file(buildings)
+    if bld.crs is None:
+        bld = bld.set_crs(epsg=4326)
+    pois_gdf = load_layer(pois, "POI")
+    roads_gdf = load_layer(roads, "Дороги")
+    prev_pois_gdf = load_layer(prev_pois, "POI") if prev_pois else None
+    prev_roads_gdf = load_layer(prev_roads, "Дороги") if prev_roads else None
+
+    # 2. Все изменившиеся геометрии (старые и новые положения)
+    changed = pd.concat([
+        changed_geometries(changes, "buildings", bld, prev, id_column),
+        changed_geometries(changes, "pois", pois_gdf, prev_pois_gdf),
+        changed_geometries(changes, "roads", roads_gdf, prev_roads_gdf),
+    ])
+
+    # 3. Здания, до которых изменения дотягиваются в пределах радиусов фич;
+    # здания, которых нет в прошлой таблице, считаются всегда.
+    # Тип элемента в ключе, только если он есть в обеих таблицах
+    typed = find_type_column(bld) is not None and find_type_column(prev) is not None
+    cur_ids = object_keys(bld, id_column, typed)
+    prev_ids = object_keys(prev, id_column, typed)
+    affected = affected_buildings(bld, changed, feature_halo(**params))
+    affected |= ~cur_ids.isin(set(prev_ids)).to_numpy()
+    logger.info(f"Изменений: {len(changed)}, пересчитываем {int(affected.sum())} "
+                f"из {len(bld)} зданий")
+
+    # 4. Пересчет затронутых зданий (остальные — соседи для плотности)
+    fresh = compute_features(bld, pois_gdf, roads_gdf, core=affected, **params)
+    # Колонки прошлой таблицы, которых нет в пересчете, — нулями; NaN самих
+    # фич (нет пикселей растра, нет объекта в радиусе) остаются как в полном расчете
+    added = prev.columns.difference(fresh.columns).drop(["geometry", *TYPE_COLUMNS], errors="ignore")
+    fresh = fresh.reindex(columns=prev.columns)
+    fresh[added] = fresh[added].fillna(0)
+
+    # 5. Патч: удаленные и пересчитанные строки заменяем, порядок — как в слое зданий
+    keep = prev[prev_ids.isin(set(cur_ids[~affected])).to_numpy()]
+    position = pd.Series(np.arange(len(bld)), index=cur_ids.to_numpy())
+    order = np.concatenate([
+        position.reindex(object_keys(keep, id_column, typed)).to_numpy(),
+        np.flatnonzero(affected)])
+    patched = pd.concat([keep, fresh], ignore_index=True)
+    patched = patched.iloc[np.argsort(order, kind="stable")].reset_index(drop=True)
+    patched = gpd.GeoDataFrame(patched, geometry="geometry", crs=prev.crs)
+
+    save_features(patched, out_csv, encoders=encoders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+featurize_parallel.py
+Параллельный расчет пространственных фич на пуле процессов.
+Геометрии (центроиды зданий, координаты POI, вершины дорог) кладутся
+в shared memory как плоские numpy-массивы и не пиклятся в каждый процесс:
+воркер восстанавливает их один раз и строит индекс у себя.
+Здания режутся на пространственно связные куски (Z-порядок по центроидам),
+поэтому результат совпадает с последовательным расчетом.
+"""
+
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import shapely
+from scipy.spatial import cKDTree
+from shapely import STRtree
+
+from spatial_features import as_geometry_array
+
+logger = logging.getLogger(__name__)
+
+# Кусков на процесс: больше — ровнее загрузка, меньше — меньше накладных
+CHUNKS_PER_WORKER = 4
+# Размер ячейки Z-порядка в метрах
+ORDER_CELL = 250.0
+
+
+class SharedArray:
+    """numpy-массив в именованном блоке shared memory"""
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=self.shm.buf)[...] = array
+        self.spec = (self.shm.name, array.shape, array.dtype.str)
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach_array(spec):
+    """Копия массива из shared memory по спецификации (имя, форма, dtype)"""
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        return np.ndarray(shape, dtype=dtype, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+
+def share_geometries(geoms, blocks):
+    """
+    Раскладывает геометрии в плоские массивы shared memory.
+    Точки — массив xy; однотипные линии/полигоны — ragged-массив
+    (координаты + смещения); смешанные слои (POI) — WKB-буфер со смещениями.
+    Созданные блоки добавляются в blocks для последующего освобождения.
+    """
+    geoms = as_geometry_array(geoms)
+    types = np.unique(shapely.get_type_id(geoms))
+
+    def share(array):
+        block = SharedArray(array)
+        blocks.append(block)
+        return block.spec
+
+    if len(types) == 1 and types[0] == shapely.GeometryType.POINT:
+        return {"kind": "points", "xy": share(shapely.get_coordinates(geoms))}
+    try:
+        geom_type, coords, offsets = shapely.to_ragged_array(geoms)
+        return {"kind": "ragged", "type": int(geom_type), "coords": share(coords),
+                "offsets": [share(o) for o in offsets]}
+    except ValueError:
+        wkb = shapely.to_wkb(geoms)
+        sizes = np.fromiter((len(b) for b in wkb), dtype=np.int64, count=len(wkb))
+        return {"kind": "wkb", "buffer": share(np.frombuffer(b"".join(wkb), dtype=np.uint8)),
+                "offsets": share(np.concatenate([[0], np.cumsum(sizes)]))}
+
+
+def attach_geometries(spec):
+    """Восстанавливает массив геометрий по спецификации share_geometries"""
+    if spec["kind"] == "points":
+        xy = attach_array(spec["xy"])
+        return shapely.points(xy)
+    if spec["kind"] == "ragged":
+        return shapely.from_ragged_array(
+            shapely.GeometryType(spec["type"]), attach_array(spec["coords"]),
+            tuple(attach_array(o) for o in spec["offsets"]))
+    buffer = attach_array(spec["buffer"]).tobytes()
+    offsets = attach_array(spec["offsets"])
+    return shapely.from_wkb([buffer[a:b] for a, b in zip(offsets[:-1], offsets[1:])])
+
+
+def spatial_chunks(geoms, n_chunks):
+    """Индексы зданий, разбитые на n_chunks кусков, связных в пространстве"""
+    xy = shapely.get_coordinates(shapely.centroid(as_geometry_array(geoms)))
+    if len(xy) == 0:
+        return []
+    cells = np.floor((xy - xy.min(axis=0)) / ORDER_CELL).astype(np.uint64)
+    code = np.zeros(len(xy), dtype=np.uint64)
+    for bit in range(21):
+        code |= ((cells[:, 0] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit)
+        code |= ((cells[:, 1] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(2 * bit + 1)
+    order = np.argsort(code, kind="stable")
+    return [c for c in np.array_split(order, n_chunks) if len(c)]
+
+
+# ---------- воркер ----------
+
+_WORKER_STATE = {}
+
+
+def id_of(spec):
+    """Уникальное имя набора геометрий (имя первого блока shared memory)"""
+    first = spec.get("xy") or spec.get("coords") or spec.get("buffer")
+    return first[0]
+
+
+def _worker_targets(spec, index):
+    """Цели и индекс по ним — строятся один раз на процесс"""
+    key = (id_of(spec), index)
+    if key not in _WORKER_STATE:
+        geoms = attach_geometries(spec)
+        if index == "kdtree":
+            _WORKER_STATE[key] = cKDTree(shapely.get_coordinates(shapely.centroid(geoms)))
+        else:
+            _WORKER_STATE[key] = STRtree(geoms)
+    return _WORKER_STATE[key]
+
+
+def _worker_sources(spec):
+    """Геометрии зданий — восстанавливаются один раз на процесс"""
+    key = (id_of(spec), "sources")
+    if key not in _WORKER_STATE:
+        _WORKER_STATE[key] = attach_geometries(spec)
+    return _WORKER_STATE[key]
+
+
+def _is_shared(value):
+    return isinstance(value, tuple) and len(value) == 2 and value[0] == "shared"
+
+
+def _worker_kwargs(kwargs):
+    """kwargs с массивами из shared memory — восстанавливаются один раз на процесс"""
+    key = ("kwargs",) + tuple(v[1][0] for v in kwargs.values() if _is_shared(v))
+    if key not in _WORKER_STATE:
+        _WORKER_STATE[key] = {k: attach_array(v[1]) if _is_shared(v) else v
+                              for k, v in kwargs.items()}
+    return _WORKER_STATE[key]
+
+
+def _run_chunk(func, source_spec, target_spec, index, chunk, kwargs):
+    sources = _worker_sources(source_spec)
+    targets = _worker_targets(target_spec, index)
+    return chunk, func(sources[chunk], targets, **_worker_kwargs(kwargs))
+
+
+# ---------- сборка ----------
+
+def _place(out, chunk, part, n):
+    """Раскладывает результат куска (dict/tuple/массив) по индексам зданий"""
+    if isinstance(part, dict):
+        out = {} if out is None else out
+        for k, v in part.items():
+            out[k] = _place(out.get(k), chunk, v, n)
+        return out
+    if isinstance(part, tuple):
+        out = [None] * len(part) if out is None else list(out)
+        return tuple(_place(o, chunk, p, n) for o, p in zip(out, part))
+    part = np.asarray(part)
+    if out is None:
+        out = np.zeros((n,) + part.shape[1:], dtype=part.dtype)
+    out[chunk] = part
+    return out
+
+
+class SerialRunner:
+    """Последовательный запуск с тем же интерфейсом, что и ParallelRunner"""
+
+    def map(self, func, sources, targets, index="strtree", **kwargs):
+        return func(sources, targets, **kwargs)
+
+
+class ParallelRunner:
+    """
+    Считает func(sources[кусок], индекс по targets, **kwargs) на пуле процессов.
+    index — "strtree" (полигоны/линии) или "kdtree" (центроиды).
+    Большие numpy-массивы в kwargs тоже передаются через shared memory.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+
+    def map(self, func, sources, targets, index="strtree", **kwargs):
+        sources = as_geometry_array(sources)
+        targets = sources if targets is None else as_geometry_array(targets)
+        chunks = spatial_chunks(sources, self.workers * CHUNKS_PER_WORKER)
+        if len(chunks) <= 1 or len(targets) == 0:
+            return func(sources, targets, **kwargs)
+
+        blocks = []
+        try:
+            source_spec = share_geometries(sources, blocks)
+            target_spec = share_geometries(targets, blocks)
+            shared_kwargs = {}
+            for k, v in kwargs.items():
+                if isinstance(v, np.ndarray):
+                    block = SharedArray(v)
+                    blocks.append(block)
+                    v = ("shared", block.spec)
+                shared_kwargs[k] = v
+
+            result = None
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(_run_chunk, func, source_spec, target_spec,
+                                       index, chunk, shared_kwargs) for chunk in chunks]
+                for future in futures:
+                    chunk, part = future.result()
+                    result = _place(result, chunk, part, len(sources))
+            return result
+        finally:
+            for block in blocks:
+                block.release()
+
+
+def make_runner(workers):
+    """ParallelRunner для workers > 1, иначе SerialRunner"""
+    if workers and workers > 1:
+        logger.info(f"Параллельный расчет пространственных фич: {workers} процессов")
+        return ParallelRunner(workers)
+    return SerialRunner()
@@ -3,6 +3,8 @@ import pandas as pd
 import numpy as np
 import os
 
+from imputation import knn_impute
+
 
 def main():
     print("="*60)
@@ -42,8 +44,15 @@ def main():
         (features['bld_perimeter_m'] + 0.001)
 
     # Признаки из свойств OSM
+    # Пропуски этажности — по ближайшим зданиям похожей площади (а не 1)
     if 'building:levels' in train_data.columns:
-        features['levels'] = train_data['building:levels'].fillna(1)
+        levels = pd.to_numeric(train_data['building:levels'], errors='coerce')
+        centroids = train_data_proj.geometry.centroid
+        filled, imputed = knn_impute(
+            np.column_stack([centroids.x, centroids.y]),
+            features['bld_area_m2'].to_numpy(), levels.to_numpy())
+        features['levels'] = np.maximum(np.round(filled), 1)
+        print(f"   Этажность заполнена по соседям у {int(imputed.sum())} зданий")
     else:
         features['levels'] = 1
 
@@ -1,7 +1,6 @@
 import geopandas as gpd
 import pandas as pd
 import numpy as np
-from shapely.geometry import Point, Polygon
 import os
 
 
@@ -21,40 +20,32 @@ def create_simple_features(buildings_path, output_csv):
     # Преобразуем в проекцию для расчета площади в метрах
     buildings_proj = buildings.to_crs('EPSG:3857')
 
-    # Создаем DataFrame с фичами
-    features = []
-
-    for idx, row in buildings.iterrows():
-        # Базовые фичи
-        feat = {
-            'building_id': row.get('osm_id', idx),
-            'bld_area_m2': buildings_proj.iloc[idx].geometry.area,
-            'bld_perimeter_m': buildings_proj.iloc[idx].geometry.length,
-        }
-
-        # Координаты центра
-        centroid = row.geometry.centroid
-        feat['centroid_lon'] = centroid.x
-        feat['centroid_lat'] = centroid.y
-
-        # Простые дополнительные фичи
-        feat['area_to_perimeter_ratio'] = feat['bld_area_m2'] / \
-            max(feat['bld_perimeter_m'], 0.001)
-        feat['is_large'] = 1 if feat['bld_area_m2'] > 100 else 0
-
-        # Информация из свойств OSM
-        for prop in ['building:levels', 'levels', 'floor_count']:
-            if prop in row:
-                try:
-                    feat['levels'] = float(row[prop])
-                    break
-                except:
-                    pass
-
-        features.append(feat)
-
-    # Создаем DataFrame
-    features_df = pd.DataFrame(features)
+    # Создаем DataFrame с фичами (сразу по всем зданиям, без цикла по строкам)
+    features_df = pd.DataFrame({
+        'building_id': (buildings['osm_id'] if 'osm_id' in buildings.columns
+                        else pd.Series(buildings.index, index=buildings.index)),
+        'bld_area_m2': buildings_proj.geometry.area,
+        'bld_perimeter_m': buildings_proj.geometry.length,
+    })
+
+    # Координаты центра
+    centroids = buildings.geometry.centroid
+    features_df['centroid_lon'] = centroids.x
+    features_df['centroid_lat'] = centroids.y
+
+    # Простые дополнительные фичи
+    features_df['area_to_perimeter_ratio'] = features_df['bld_area_m2'] / \
+        np.maximum(features_df['bld_perimeter_m'], 0.001)
+    features_df['is_large'] = (features_df['bld_area_m2'] > 100).astype(int)
+
+    # Информация из свойств OSM: первое числовое значение по порядку колонок
+    level_cols = [prop for prop in ['building:levels', 'levels', 'floor_count']
+                  if prop in buildings.columns]
+    if level_cols:
+        levels = pd.Series(np.nan, index=buildings.index)
+        for prop in level_cols:
+            levels = levels.fillna(pd.to_numeric(buildings[prop], errors='coerce'))
+        features_df['levels'] = levels
 
     # Сохраняем
     os.makedirs(os.path.dirname(output_csv), exist_ok=True)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+featurize_tiles.py
+Потайловый расчет фич для больших регионов (Пермский край, Свердловская область).
+Регион режется на квадратные тайлы в метрической проекции, каждый тайл читается
+с диска по bbox вместе с ореолом шириной в максимальный радиус фич, так что
+в памяти одновременно только один тайл, а на границах тайлов нет краевых эффектов.
+"""
+
+import logging
+import math
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyogrio
+from shapely.geometry import box
+
+from featurize_fixed import (METRIC_CRS, compute_features, feature_halo,
+                             fit_type_encoder, load_layer, read_building_tags)
+
+logger = logging.getLogger(__name__)
+
+# Грубая оценка памяти на один объект (геометрия + атрибуты + фичи), байт
+BYTES_PER_FEATURE = 8 * 1024
+# Меньше этого тайлы не режем: иначе ореол дороже самого тайла
+MIN_TILE_SIZE = 500.0
+
+
+def layer_extent(path):
+    """Границы слоя в METRIC_CRS и число объектов — без чтения геометрий"""
+    info = pyogrio.read_info(path, force_total_bounds=True)
+    crs = info["crs"] or "EPSG:4326"
+    bounds = gpd.GeoSeries([box(*info["total_bounds"])], crs=crs) \
+        .to_crs(METRIC_CRS).total_bounds
+    return bounds, info["features"]
+
+
+def tile_size_for_memory(bounds, n_features, max_memory, halo):
+    """Сторона тайла, при которой тайл с ореолом укладывается в max_memory МБ"""
+    area = max((bounds[2] - bounds[0]) * (bounds[3] - bounds[1]), 1.0)
+    per_feature = area / max(n_features, 1)
+    budget_features = max_memory * 1024 * 1024 / BYTES_PER_FEATURE
+    side = math.sqrt(budget_features * per_feature) - 2 * halo
+    return max(side, MIN_TILE_SIZE)
+
+
+def plan_tiles(bounds, tile_size):
+    """Сетка тайлов (minx, miny, maxx, maxy), покрывающая bounds"""
+    minx, miny, maxx, maxy = bounds
+    nx = max(int(math.ceil((maxx - minx) / tile_size)), 1)
+    ny = max(int(math.ceil((maxy - miny) / tile_size)), 1)
+    return [(minx + i * tile_size, miny + j * tile_size,
+             minx + (i + 1) * tile_size, miny + (j + 1) * tile_size)
+            for j in range(ny) for i in range(nx)], nx, ny
+
+
+def metric_bbox(b):
+    """Прямоугольник в METRIC_CRS как фильтр bbox для gpd.read_file"""
+    return gpd.GeoSeries([box(*b)], crs=METRIC_CRS)
+
+
+def read_buildings(path, b):
+    """Здания, пересекающие прямоугольник b; индекс — FID объекта в файле"""
+    bld = gpd.read_file(path, bbox=metric_bbox(b), engine="pyogrio",
+                        fid_as_index=True)
+    return bld.set_crs(epsg=4326) if bld.crs is None else bld
+
+
+def expand(b, d):
+    """Прямоугольник b, расширенный на d во все стороны"""
+    return (b[0] - d, b[1] - d, b[2] + d, b[3] + d)
+
+
+def featurize_tiled(buildings, pois, roads, tile_size=None, max_memory=None,
+                    **params):
+    """
+    Считает фичи по тайлам и сшивает результат в исходном порядке зданий.
+
+    Здание принадлежит ровно одному тайлу — тому, где лежит его центроид.
+    POI, дороги и соседние здания читаются с ореолом max(радиусов); для
+    точной плотности ореол расширяется на вынос полигонов за границу тайла.
+    """
+    halo = feature_halo(**params)
+    if params.get("type_encoder") is None:
+        # Один словарь типов на весь регион, иначе у тайлов разные колонки
+        params["type_encoder"] = fit_type_encoder(read_building_tags(buildings))
+
+    bounds, n_buildings = layer_extent(buildings)
+    if max_memory:
+        n_total = n_buildings
+        for path in (pois, roads):
+            try:
+                n_total += pyogrio.read_info(path)["features"]
+            except Exception:
+                pass
+        auto_size = tile_size_for_memory(bounds, n_total, max_memory, halo)
+        tile_size = min(tile_size, auto_size) if tile_size else auto_size
+
+    tiles, nx, ny = plan_tiles(bounds, tile_size)
+    logger.info(f"Тайлов: {len(tiles)} ({nx}×{ny}), сторона {tile_size:.0f} м, "
+                f"ореол {halo} м, зданий: {n_buildings}")
+
+    parts = []
+    for k, tile in enumerate(tiles):
+        read_box = expand(tile, halo)
+        bld = read_buildings(buildings, read_box)
+        if len(bld) == 0:
+            continue
+
+        # Ядро тайла — здания, чей центроид попадает в ячейку сетки
+        proj = bld.geometry.to_crs(METRIC_CRS)
+        cx, cy = proj.centroid.x.to_numpy(), proj.centroid.y.to_numpy()
+        ix = np.clip(np.floor((cx - bounds[0]) / tile_size), 0, nx - 1)
+        iy = np.clip(np.floor((cy - bounds[1]) / tile_size), 0, ny - 1)
+        core = (ix + iy * nx) == k
+        if not core.any():
+            continue
+
+        # Полигоны ядра могут выходить за тайл: дочитываем соседей
+        needed = expand(tuple(proj[core].total_bounds), halo)
+        if (needed[0] < read_box[0] or needed[1] < read_box[1]
+                or needed[2] > read_box[2] or needed[3] > read_box[3]):
+            ids = bld.index[core]
+            read_box = needed
+            bld = read_buildings(buildings, read_box)
+            core = bld.index.isin(ids)
+
+        pois_gdf = load_layer(pois, "POI", bbox=metric_bbox(read_box))
+        roads_gdf = load_layer(roads, "Дороги", bbox=metric_bbox(read_box))
+        parts.append(compute_features(bld, pois_gdf, roads_gdf, core=core, **params))
+        logger.info(f"Тайл {k + 1}/{len(tiles)}: {int(core.sum())} зданий")
+
+    if not parts:
+        return gpd.GeoDataFrame(geometry=[], crs="EPSG:4326")
+
+    result = pd.concat(parts).sort_index()
+    return gpd.GeoDataFrame(result, geometry="geometry", crs=parts[0].crs) \
+        .reset_index(drop=True)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+imputation.py
+Заполнение пропусков высоты и этажности по K ближайшим зданиям с известным
+значением и похожей площадью пятна (вместо fillna(1)).
+Здания — точки в пространстве (x, y, AREA_SCALE·ln площади): соседом
+считается близкое и сопоставимое по размеру здание. Все пропуски
+заполняются одним пакетным запросом к KD-дереву по известным зданиям.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+# Метров «расстояния» на единицу ln(площади): здание в e раз больше
+# считается таким же далеким, как здание в 200 м
+AREA_SCALE = 200.0
+# Сколько соседей усредняем и как далеко ищем (метры в пространстве признаков)
+DEFAULT_K = 8
+DEFAULT_MAX_DISTANCE = 500.0
+
+
+def knn_impute(xy, area, values, known_xy=None, known_area=None, known_values=None,
+               k=DEFAULT_K, max_distance=DEFAULT_MAX_DISTANCE, fallback=1.0):
+    """
+    Заполняет NaN в values средним (с весом 1/расстояние) по k ближайшим
+    зданиям с известным значением. Источник известных значений — сами
+    здания или отдельный набор known_* (например, здания с ореолом тайла).
+    Нет соседей ближе max_distance — fallback.
+    Возвращает (заполненные значения, маска заполненных).
+    """
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    filled = values.copy()
+    if not missing.any():
+        return filled, missing
+    if known_xy is None:
+        known_xy, known_area, known_values = xy, area, values
+    known_values = np.asarray(known_values, dtype=float)
+    has_value = ~np.isnan(known_values)
+
+    def space(points, areas):
+        log_area = np.log(np.maximum(np.asarray(areas, dtype=float), 1.0))
+        return np.column_stack([np.asarray(points, dtype=float).reshape(-1, 2),
+                                AREA_SCALE * log_area])
+
+    filled[missing] = fallback
+    if not has_value.any():
+        return filled, missing
+    source = space(known_xy, known_area)[has_value]
+    k = min(k, len(source))
+    dist, idx = cKDTree(source).query(space(xy, area)[missing], k=k,
+                                      distance_upper_bound=max_distance)
+    dist, idx = dist.reshape(-1, k), idx.reshape(-1, k)
+    found = np.isfinite(dist)
+    neighbour_values = known_values[has_value][np.where(found, idx, 0)]
+    weights = np.where(found, 1.0 / np.maximum(dist, 1.0), 0.0)
+    total = weights.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        estimate = (weights * neighbour_values).sum(axis=1) / total
+    filled[np.flatnonzero(missing)[total > 0]] = estimate[total > 0]
+    return filled, missing
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+kernel_density.py
+Растровые фичи плотности: POI, площадь пятен застройки и длина дорог
+раскладываются по метрической сетке (по умолчанию 10 м), сетка сворачивается
+с ядром нужной ширины через FFT, значения берутся в клетках центроидов зданий.
+Стоимость ~ число клеток · log, от радиуса не зависит — широкие радиусы
+контекста так же дешевы, как узкие.
+
+Ядра нормированы на пик 1: disk радиуса r дает (с точностью до клетки)
+то же, что подсчет в буфере r (число POI, длина дорог, площадь зданий);
+gauss с sigma = r — та же сумма с плавно убывающим весом.
+"""
+
+import numpy as np
+import shapely
+from scipy.signal import fftconvolve
+
+KERNELS = ("gauss", "disk")
+# Ядро gauss обрезается на стольких sigma
+GAUSS_TRUNCATE = 3.0
+
+
+def kernel_support(bandwidth, kernel):
+    """Радиус, дальше которого ядро равно нулю (метры)"""
+    return bandwidth * GAUSS_TRUNCATE if kernel == "gauss" else bandwidth
+
+
+class Grid:
+    """Регулярная сетка: левый нижний угол, размер клетки, число клеток"""
+
+    def __init__(self, bounds, cell):
+        minx, miny, maxx, maxy = bounds
+        self.x0, self.y0, self.cell = minx, miny, float(cell)
+        self.nx = max(int(np.ceil((maxx - minx) / cell)), 1)
+        self.ny = max(int(np.ceil((maxy - miny) / cell)), 1)
+
+    def cells(self, xy):
+        """(строка, столбец, внутри ли сетки) для точек xy"""
+        col = np.floor((xy[:, 0] - self.x0) / self.cell).astype(np.int64)
+        row = np.floor((xy[:, 1] - self.y0) / self.cell).astype(np.int64)
+        inside = (col >= 0) & (col < self.nx) & (row >= 0) & (row < self.ny)
+        return row, col, inside
+
+    def bin(self, xy, weights=None):
+        """Сумма весов точек по клеткам (точки вне сетки отбрасываются)"""
+        row, col, inside = self.cells(np.asarray(xy, dtype=float).reshape(-1, 2))
+        weights = np.ones(len(row)) if weights is None else np.asarray(weights, dtype=float)
+        flat = np.bincount(row[inside] * self.nx + col[inside], weights=weights[inside],
+                           minlength=self.nx * self.ny)
+        return flat.reshape(self.ny, self.nx)
+
+    def sample(self, raster, xy):
+        """Значения растра в клетках точек xy (вне сетки — 0)"""
+        row, col, inside = self.cells(np.asarray(xy, dtype=float).reshape(-1, 2))
+        out = np.zeros(len(row))
+        out[inside] = raster[row[inside], col[inside]]
+        return out
+
+
+def make_kernel(bandwidth, kernel, cell):
+    """Ядро на сетке с шагом cell, пик = 1"""
+    half = int(np.ceil(kernel_support(bandwidth, kernel) / cell))
+    offsets = np.arange(-half, half + 1) * cell
+    d2 = offsets[None, :] ** 2 + offsets[:, None] ** 2
+    if kernel == "gauss":
+        values = np.exp(-d2 / (2.0 * bandwidth ** 2))
+        values[d2 > kernel_support(bandwidth, kernel) ** 2] = 0.0
+        return values
+    return (d2 <= bandwidth ** 2).astype(float)
+
+
+def line_pieces(lines, cell):
+    """Середины и длины кусков линий не длиннее половины клетки"""
+    # Части MultiLineString — отдельные линии: иначе конец одной части
+    # соединился бы отрезком с началом следующей
+    lines = shapely.get_parts(np.asarray(lines, dtype=object))
+    lines = shapely.segmentize(lines, cell / 2.0)
+    coords, index = shapely.get_coordinates(lines, return_index=True)
+    same = index[1:] == index[:-1]
+    start, end = coords[:-1][same], coords[1:][same]
+    return (start + end) / 2.0, np.hypot(*(end - start).T)
+
+
+def kernel_densities(points_xy, layers, bandwidths, kernel="gauss", cell=10.0):
+    """
+    Свертки слоев в точках points_xy.
+    layers — {имя: (xy, веса или None)} в метрической проекции.
+    Сетка покрывает точки с запасом на радиус ядра; объекты дальше не влияют.
+    Возвращает {имя: {bandwidth: массив}}.
+    """
+    points_xy = np.asarray(points_xy, dtype=float).reshape(-1, 2)
+    out = {name: {} for name in layers}
+    if len(points_xy) == 0:
+        return {name: {b: np.zeros(0) for b in bandwidths} for name in layers}
+
+    # Начало сетки кратно клетке: у тайлов одного региона клетки совпадают
+    pad = max(kernel_support(b, kernel) for b in bandwidths) + cell
+    x0 = np.floor((points_xy[:, 0].min() - pad) / cell) * cell
+    y0 = np.floor((points_xy[:, 1].min() - pad) / cell) * cell
+    grid = Grid((x0, y0, points_xy[:, 0].max() + pad, points_xy[:, 1].max() + pad), cell)
+    kernels = {b: make_kernel(b, kernel, cell) for b in bandwidths}
+    for name, (xy, weights) in layers.items():
+        raster = grid.bin(xy, weights)
+        for b in bandwidths:
+            if not raster.any():
+                out[name][b] = np.zeros(len(points_xy))
+                continue
+            smooth = fftconvolve(raster, kernels[b], mode="same")
+            # Шум FFT вокруг нуля
+            out[name][b] = np.maximum(grid.sample(smooth, points_xy), 0.0)
+    return out
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+neighbour_graph.py
+Граф соседства зданий в CSR-формате: строка — здание, столбцы — здания
+(с ореолом тайла), чьи центроиды ближе радиуса. Граф строится один раз
+(один запрос к KD-дереву) и сохраняется в кэше фич; любые фичи окрестности
+(«пространственный лаг»: средняя площадь, высота, доли типов соседей)
+считаются по нему произведениями разреженной матрицы на вектор.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from spatial_features import point_pairs_within
+
+
+def build_graph(src_xy, dst_xy, radius, self_index=None):
+    """
+    CSR-матрица смежности (len(src_xy) × len(dst_xy), значения 1) пар
+    центроидов ближе radius. self_index[i] — номер здания i среди dst
+    (само здание себе не сосед).
+    """
+    src, dst, _ = point_pairs_within(src_xy, dst_xy, radius)
+    if self_index is not None:
+        other = np.asarray(self_index)[src] != dst
+        src, dst = src[other], dst[other]
+    return csr_matrix((np.ones(len(src), dtype=np.float32), (src, dst)),
+                      shape=(len(src_xy), len(dst_xy)))
+
+
+def neighbour_count(graph):
+    """Число соседей каждого здания"""
+    return np.asarray(graph.sum(axis=1)).ravel()
+
+
+def neighbour_mean(graph, values, known=None):
+    """
+    Среднее values по соседям (W·x / W·1). known — маска известных значений:
+    пропуски не входят ни в сумму, ни в число соседей. Нет соседей — 0.
+    Values может быть матрицей (колонки усредняются независимо).
+    """
+    values = np.asarray(values, dtype=float)
+    if known is None:
+        known = np.ones(values.shape[0], dtype=bool)
+    weights = known.astype(float)
+    filled = np.where(known.reshape((-1,) + (1,) * (values.ndim - 1)), values, 0.0)
+    total = graph @ filled
+    count = graph @ weights
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inv = np.where(count > 0, 1.0 / count, 0.0)
+    return diags(inv) @ total if values.ndim > 1 else inv * total
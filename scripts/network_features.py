@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+network_features.py
+Фичи доступности по дорожной сети (ребра roads_edges.geojson из osmnx).
+Вместо поиска из каждого здания используются многоисточниковые Dijkstra
+(scipy.sparse.csgraph): одно прохождение на категорию POI дает расстояние
+до ближайшего POI для всех узлов сразу, а число достижимых POI считается
+ограниченными поисками из узлов с POI: узлы-источники группируются по
+ячейкам размера max(radii), и поиск для ячейки идет только по узлам
+соседних ячеек (дальше по сети не уйти). Стоимость растет с числом POI и
+плотностью сети вокруг них, но не с размером всего графа и не с
+произведением зданий на POI.
+"""
+
+import numpy as np
+import shapely
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+# Сколько источников за один вызов dijkstra (память: batch × узлы окрестности)
+DIJKSTRA_BATCH = 256
+# Вес ребра не может быть нулевым: нулевые элементы csgraph не считает ребрами
+MIN_WEIGHT = 1e-6
+
+
+def road_graph(roads_proj):
+    """
+    Неориентированный граф дорог: (csr-матрица весов в метрах, координаты узлов).
+    Узлы — u/v из osmnx; без них — концы линий, склеенные с точностью 0.1 м.
+    Для параллельных ребер берется самое короткое.
+    """
+    lines = np.asarray(roads_proj.geometry, dtype=object)
+    lines = shapely.line_merge(lines) if len(lines) else lines
+    ok = shapely.get_type_id(lines) == shapely.GeometryType.LINESTRING
+    lines = lines[ok]
+    start = shapely.get_coordinates(shapely.get_point(lines, 0))
+    end = shapely.get_coordinates(shapely.get_point(lines, -1))
+
+    if {"u", "v"} <= set(roads_proj.columns):
+        keys = np.concatenate([roads_proj["u"].to_numpy()[ok], roads_proj["v"].to_numpy()[ok]])
+    else:
+        rounded = np.round(np.concatenate([start, end]), 1)
+        keys = rounded[:, 0] * 1e9 + rounded[:, 1]
+    node_keys, inverse = np.unique(keys, return_inverse=True)
+    u, v = inverse[:len(lines)], inverse[len(lines):]
+
+    node_xy = np.zeros((len(node_keys), 2))
+    node_xy[u] = start
+    node_xy[v] = end
+
+    weight = np.maximum(shapely.length(lines), MIN_WEIGHT)
+    a, b = np.minimum(u, v), np.maximum(u, v)
+    order = np.lexsort((weight, b, a))
+    a, b, weight = a[order], b[order], weight[order]
+    first = np.ones(len(a), dtype=bool)
+    first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+    n = len(node_keys)
+    graph = coo_matrix((weight[first], (a[first], b[first])), shape=(n, n)).tocsr()
+    return graph, node_xy
+
+
+def snap(points_xy, node_xy):
+    """Ближайший узел графа для каждой точки: (индексы узлов, расстояния)"""
+    if len(node_xy) == 0:
+        return np.zeros(len(points_xy), dtype=np.intp), np.full(len(points_xy), np.inf)
+    dist, idx = cKDTree(node_xy).query(points_xy)
+    return idx, dist
+
+
+def min_offsets(nodes, offsets, n):
+    """Узлы без повторов и наименьший offset для каждого (несколько POI на одном узле)"""
+    best = np.full(n, np.inf)
+    np.minimum.at(best, nodes, offsets)
+    nodes = np.flatnonzero(np.isfinite(best))
+    return nodes, best[nodes]
+
+
+def with_super_source(graph, nodes, offsets):
+    """
+    Граф с виртуальным узлом n, связанным с nodes ребрами длины offsets
+    (для повторяющихся узлов — наименьшей: coo_matrix складывает дубликаты)
+    """
+    n = graph.shape[0]
+    nodes, offsets = min_offsets(np.asarray(nodes), np.asarray(offsets, dtype=float), n)
+    graph = graph.tocoo()
+    rows = np.concatenate([graph.row, np.full(len(nodes), n)])
+    cols = np.concatenate([graph.col, nodes])
+    data = np.concatenate([graph.data, np.maximum(offsets, MIN_WEIGHT)])
+    return coo_matrix((data, (rows, cols)), shape=(n + 1, n + 1)).tocsr()
+
+
+def nearest_source_distance(graph, nodes, offsets, cutoff):
+    """
+    Сетевое расстояние от каждого узла до ближайшего источника — один
+    проход Dijkstra из виртуального узла. Дальше cutoff — inf.
+    """
+    n = graph.shape[0]
+    if len(nodes) == 0:
+        return np.full(n, np.inf)
+    dist = dijkstra(with_super_source(graph, nodes, offsets), directed=False,
+                    indices=n, limit=cutoff)
+    return dist[:n]
+
+
+def _cells(xy, size):
+    """Ячейки сетки size для точек xy: (ключи ячеек, {ключ: индексы точек})"""
+    cell = np.floor(xy / size).astype(np.int64)
+    keys, inverse = np.unique(cell, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1])
+    return keys, {tuple(k): g for k, g in zip(keys.tolist(), groups)}
+
+
+def reachable_counts(graph, nodes, offsets, radii, node_xy):
+    """
+    Сколько источников достижимо из каждого узла в пределах каждого радиуса.
+    Узлы-источники группируются по ячейкам размера max(radii); Dijkstra
+    (limit=max(radii)) для ячейки идет по подграфу узлов соседних 3×3
+    ячеек: путь короче радиуса не выходит за евклидов круг этого радиуса.
+    """
+    n = graph.shape[0]
+    counts = {r: np.zeros(n, dtype=np.int64) for r in radii}
+    if not radii or len(nodes) == 0 or n == 0:
+        return counts
+    limit = max(radii)
+    size = max(float(limit), 1.0)
+    nodes = np.asarray(nodes)
+    offsets = np.asarray(offsets, dtype=float)
+    graph = graph.tocsr()
+
+    # Поиск один на узел, а не на POI: POI узла различаются только offset
+    src_nodes, src_of_poi = np.unique(nodes, return_inverse=True)
+    src_of_poi = src_of_poi.ravel()
+    poi_order = np.argsort(src_of_poi, kind="stable")
+    poi_bounds = np.searchsorted(src_of_poi[poi_order], np.arange(len(src_nodes) + 1))
+
+    _, node_cells = _cells(node_xy, size)
+    src_keys, src_cells = _cells(node_xy[src_nodes], size)
+    shifts = [(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+    for key in map(tuple, src_keys.tolist()):
+        local = np.concatenate([node_cells.get((key[0] + dx, key[1] + dy), np.empty(0, dtype=np.intp))
+                                for dx, dy in shifts])
+        subgraph = graph[local][:, local]
+        position = {node: i for i, node in enumerate(local.tolist())}
+        cell_sources = src_cells[key]
+        for start in range(0, len(cell_sources), DIJKSTRA_BATCH):
+            batch = cell_sources[start:start + DIJKSTRA_BATCH]
+            indices = [position[node] for node in src_nodes[batch].tolist()]
+            dist = dijkstra(subgraph, directed=False, indices=indices, limit=limit)
+            # Строки расстояний -> строки POI (со своими offset)
+            pois = np.concatenate([poi_order[poi_bounds[i]:poi_bounds[i + 1]] for i in batch])
+            row = np.repeat(np.arange(len(batch)), poi_bounds[batch + 1] - poi_bounds[batch])
+            dist = dist[row] + offsets[pois, None]
+            for r in radii:
+                counts[r][local] += (dist <= r).sum(axis=0)
+    return counts
+
+
+def network_accessibility(points_xy, poi_xy, poi_category, roads_proj,
+                          categories, radii, cutoff):
+    """
+    Фичи для зданий (центроиды points_xy):
+    расстояние по сети до ближайшего POI каждой категории (дальше cutoff —
+    cutoff) и число POI, достижимых по сети в пределах каждого радиуса.
+    Расстояние здания до сети (привязка к ближайшему узлу) прибавляется
+    к расстояниям, но не учитывается в подсчете достижимых POI.
+    Возвращает (dist {категория: массив}, counts {r: массив}).
+    """
+    graph, node_xy = road_graph(roads_proj)
+    bld_node, bld_offset = snap(points_xy, node_xy)
+    poi_node, poi_offset = snap(poi_xy, node_xy)
+    poi_category = np.asarray(poi_category)
+
+    distances = {}
+    for cat in categories:
+        mask = poi_category == cat
+        node_dist = nearest_source_distance(graph, poi_node[mask], poi_offset[mask], cutoff)
+        dist = node_dist[bld_node] + bld_offset if len(node_xy) else bld_offset
+        distances[cat] = np.minimum(dist, cutoff)
+
+    counts = reachable_counts(graph, poi_node, poi_offset, radii, node_xy)
+    counts = {r: c[bld_node] if len(node_xy) else np.zeros(len(points_xy), dtype=np.int64)
+              for r, c in counts.items()}
+    return distances, counts
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+osm_layers.py
+Общие для всех способов загрузки OSM (Overpass по тайлам, локальный .osm.pbf)
+правила раскладки объектов по слоям и выходные файлы:
+    buildings — объекты с тегом building (только площадные),
+    pois      — объекты с amenity / shop / leisure,
+    roads     — автомобильные дороги (как network_type="drive" в osmnx),
+                разрезанные на ребра в узлах пересечений (u, v, length).
+Имена файлов совпадают с тем, что ждут featurize_*.py по умолчанию.
+"""
+
+import numpy as np
+import geopandas as gpd
+import pandas as pd
+from shapely.geometry import LineString
+
+# Слои и теги, по которым объект в них попадает (как tags= в osmnx)
+LAYERS = {
+    "buildings": ("building",),
+    "pois": ("amenity", "shop", "leisure"),
+}
+LAYER_FILES = {
+    "buildings": "buildings_osm.geojson",
+    "pois": "pois_osm.geojson",
+    "roads": "roads_edges.geojson",
+}
+
+# Фильтр "drive" из osmnx: такие highway и доступы в сеть не входят
+DRIVE_EXCLUDED_HIGHWAYS = {
+    "abandoned", "bridleway", "bus_guideway", "construction", "corridor", "cycleway",
+    "elevator", "escalator", "footway", "no", "path", "pedestrian", "planned",
+    "platform", "proposed", "raceway", "razed", "service", "steps", "track",
+}
+# Теги дороги, которые переносятся на ребра
+ROAD_TAGS = ("highway", "name", "ref", "oneway", "maxspeed", "lanes")
+EARTH_RADIUS = 6371009.0
+
+
+def layers_for(tags, layers=LAYERS):
+    """Слои (кроме дорог), в которые попадает объект с тегами tags"""
+    return [name for name, keys in layers.items() if any(k in tags for k in keys)]
+
+
+def is_drive_road(tags):
+    """Дорога для автомобилей (упрощенный фильтр osmnx network_type="drive")"""
+    highway = tags.get("highway")
+    if not highway or highway in DRIVE_EXCLUDED_HIGHWAYS:
+        return False
+    if tags.get("area") == "yes" or tags.get("access") == "private":
+        return False
+    return tags.get("motor_vehicle") != "no" and tags.get("motorcar") != "no"
+
+
+def great_circle(lon1, lat1, lon2, lat2):
+    """Длина по дуге большого круга в метрах (как length у osmnx)"""
+    lon1, lat1, lon2, lat2 = map(np.radians, (lon1, lat1, lon2, lat2))
+    h = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def ways_to_edges(ways):
+    """
+    Ребра дорожного графа из линий OSM.
+    ways — список (osmid, tags, node_ids, coords) с координатами (lon, lat)
+    узлов линии. Линия режется в узлах, через которые проходит больше одной
+    дороги (перекрестки), и на концах. Возвращает GeoDataFrame EPSG:4326
+    с колонками u, v, key, osmid, теги ROAD_TAGS, length, geometry.
+    """
+    columns = ["u", "v", "key", "osmid", *ROAD_TAGS, "length", "geometry"]
+    if not ways:
+        return gpd.GeoDataFrame(pd.DataFrame(columns=columns), geometry="geometry", crs="EPSG:4326")
+    ids = np.concatenate([np.asarray(nodes, dtype=np.int64) for _, _, nodes, _ in ways])
+    unique, counts = np.unique(ids, return_counts=True)
+    shared = set(unique[counts > 1].tolist())
+
+    rows = []
+    seen = {}
+    for osmid, tags, nodes, coords in ways:
+        nodes = np.asarray(nodes, dtype=np.int64)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if len(nodes) < 2:
+            continue
+        cut = [0] + [i for i in range(1, len(nodes) - 1) if nodes[i] in shared] + [len(nodes) - 1]
+        step = great_circle(coords[:-1, 0], coords[:-1, 1], coords[1:, 0], coords[1:, 1])
+        for a, b in zip(cut[:-1], cut[1:]):
+            u, v = int(nodes[a]), int(nodes[b])
+            # Параллельные ребра между теми же узлами различаются key
+            key = seen.get((u, v), -1) + 1
+            seen[(u, v)] = key
+            rows.append({"u": u, "v": v, "key": key, "osmid": osmid,
+                         **{t: tags.get(t) for t in ROAD_TAGS},
+                         "length": float(step[a:b].sum()),
+                         "geometry": LineString(coords[a:b + 1])})
+    return gpd.GeoDataFrame(pd.DataFrame(rows, columns=columns), geometry="geometry", crs="EPSG:4326")
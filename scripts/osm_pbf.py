@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+osm_pbf.py
+Офлайн-загрузка из локальной выгрузки региона (.osm.pbf, например
+privolzhsky-fed-district с Geofabrik) вместо Overpass.
+Файл читается потоком обработчиком pyosmium (колбэки node/way/area):
+    - здания и площадные POI — из областей (замкнутые линии и
+      мультиполигоны собирает сам osmium), точечные POI — из узлов;
+    - здания и POI сразу дописываются в GeoJSON и в памяти не копятся;
+    - в памяти держатся только автомобильные дороги (id узлов + координаты),
+      в конце они режутся на ребра в перекрестках.
+Координаты узлов хранит индекс osmium: flex_mem для области, для целого
+края лучше файловый (dense_file_array,<файл>) — память остается ограниченной.
+Выходные файлы те же, что у extract_osm.py (+ roads_edges.geojson).
+Нужен пакет osmium (необязательная зависимость).
+"""
+
+import json
+import logging
+from array import array
+from contextlib import ExitStack
+from pathlib import Path
+
+import shapely
+
+from osm_layers import (LAYER_FILES, LAYERS, ROAD_TAGS, is_drive_road, layers_for,
+                        ways_to_edges)
+
+logger = logging.getLogger(__name__)
+
+# Индекс координат узлов по умолчанию (см. osmium.index.map_types())
+DEFAULT_INDEX = "flex_mem"
+# Каждые сколько объектов писать прогресс в лог
+LOG_EVERY = 100000
+
+
+class GeoJSONWriter:
+    """Потоковая запись FeatureCollection: объект за объектом, без GeoDataFrame"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, "w", encoding="utf-8")
+        self._file.write('{"type": "FeatureCollection", "features": [\n')
+        return self
+
+    def write(self, properties, geometry):
+        if self.count:
+            self._file.write(",\n")
+        self._file.write('{"type": "Feature", "properties": ')
+        self._file.write(json.dumps(properties, ensure_ascii=False))
+        self._file.write(', "geometry": ')
+        self._file.write(shapely.to_geojson(geometry))
+        self._file.write("}")
+        self.count += 1
+
+    def __exit__(self, *exc):
+        self._file.write("\n]}\n")
+        self._file.close()
+
+
+def _area_geometry(factory, area):
+    """Полигон области (мультиполигон из одной части -> Polygon, как у osmnx)"""
+    geometry = shapely.from_wkb(factory.create_multipolygon(area), on_invalid="ignore")
+    if geometry is None or geometry.is_empty:
+        return None
+    parts = shapely.get_parts(geometry)
+    return parts[0] if len(parts) == 1 else geometry
+
+
+def extract_pbf(pbf_path, out_dir, index=DEFAULT_INDEX, layers=LAYERS):
+    """
+    Один проход по pbf_path: здания, POI и ребра дорог в out_dir под
+    именами LAYER_FILES. Возвращает {слой: путь}.
+    """
+    import osmium
+    from osmium.geom import WKBFactory
+
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    paths = {name: out / LAYER_FILES.get(name, f"{name}_osm.geojson")
+             for name in (*layers, "roads")}
+    factory = WKBFactory()
+    roads = []
+
+    class Handler(osmium.SimpleHandler):
+        def __init__(self, writers):
+            super().__init__()
+            self.writers = writers
+            self.seen = 0
+
+        def _emit(self, tags, element_type, osmid, geometry, matched):
+            if geometry is None:
+                return
+            properties = {"element_type": element_type, "osmid": osmid, **tags}
+            for name in matched:
+                self.writers[name].write(properties, geometry)
+
+        def _progress(self):
+            self.seen += 1
+            if self.seen % LOG_EVERY == 0:
+                counts = ", ".join(f"{k}={w.count}" for k, w in self.writers.items())
+                logger.info(f"{self.seen} объектов с тегами слоев: {counts}, дорог {len(roads)}")
+
+        def node(self, n):
+            tags = dict(n.tags)
+            matched = [name for name in layers_for(tags, layers) if name != "buildings"]
+            if matched and n.location.valid():
+                self._progress()
+                self._emit(tags, "node", n.id, shapely.Point(n.location.lon, n.location.lat), matched)
+
+        def way(self, w):
+            tags = dict(w.tags)
+            if is_drive_road(tags):
+                try:
+                    nodes = array("q", (nd.ref for nd in w.nodes))
+                    coords = array("d", (c for nd in w.nodes for c in (nd.lon, nd.lat)))
+                except osmium.InvalidLocationError:
+                    return
+                roads.append((w.id, {t: tags[t] for t in ROAD_TAGS if t in tags}, nodes, coords))
+                return
+            # Замкнутые линии придут в area(); здесь только открытые POI-линии
+            matched = [name for name in layers_for(tags, layers) if name != "buildings"]
+            if matched and not w.is_closed() and len(w.nodes) >= 2:
+                try:
+                    line = shapely.LineString([(nd.lon, nd.lat) for nd in w.nodes])
+                except osmium.InvalidLocationError:
+                    return
+                self._progress()
+                self._emit(tags, "way", w.id, line, matched)
+
+        def area(self, a):
+            tags = dict(a.tags)
+            matched = layers_for(tags, layers)
+            if not matched:
+                return
+            self._progress()
+            try:
+                geometry = _area_geometry(factory, a)
+            except RuntimeError:
+                # Незамкнутые кольца и прочая битая геометрия
+                return
+            element_type = "way" if a.from_way() else "relation"
+            self._emit(tags, element_type, a.orig_id(), geometry, matched)
+
+    with ExitStack() as stack:
+        writers = {name: stack.enter_context(GeoJSONWriter(paths[name])) for name in layers}
+        logger.info(f"Читаем {pbf_path} (индекс узлов {index})")
+        Handler(writers).apply_file(str(pbf_path), locations=True, idx=index)
+    for name, writer in writers.items():
+        logger.info(f"Сохранено {paths[name]}: {writer.count} объектов")
+
+    edges = ways_to_edges(roads)
+    edges.to_file(paths["roads"], driver="GeoJSON")
+    logger.info(f"Сохранено {paths['roads']}: {len(edges)} ребер из {len(roads)} дорог")
+    return paths
@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+osm_store.py
+Локальное хранилище OSM (SQLite) для инкрементального обновления слоев
+без повторной выгрузки региона.
+    init   — заполняет хранилище из выгрузки .osm.pbf: POI-узлы, линии и
+             мультиполигоны слоев (здания, POI, дороги) и узлы этих линий;
+    apply  — применяет файлы изменений OsmChange (.osc, .osc.gz) с диска:
+             пересобираются только затронутые объекты (в т.ч. линии, у
+             которых сдвинулись узлы), слои с изменениями переписываются
+             целиком (см. export), а список
+             изменившихся объектов — пары [тип, id] (у узлов, линий и
+             отношений id пересекаются) — пишется в JSON для featurize_incremental.py.
+Геометрия и теги объектов слоев лежат в таблице features по ключу
+(слой, тип, OSM id); прошлые версии слоев сохраняются как *.prev.geojson
+(старые геометрии для --prev-pois / --prev-roads).
+Нужен пакет osmium (необязательная зависимость).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+from contextlib import ExitStack
+from pathlib import Path
+
+import click
+import shapely
+
+from osm_layers import LAYER_FILES, LAYERS, ROAD_TAGS, is_drive_road, layers_for, ways_to_edges
+from osm_pbf import DEFAULT_INDEX, GeoJSONWriter
+from overpass_tiles import element_geometry, element_layers, element_road
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (id INTEGER PRIMARY KEY, lon REAL, lat REAL, tags TEXT);
+CREATE TABLE IF NOT EXISTS ways (id INTEGER PRIMARY KEY, nodes TEXT, tags TEXT);
+CREATE TABLE IF NOT EXISTS relations (id INTEGER PRIMARY KEY, members TEXT, tags TEXT);
+CREATE TABLE IF NOT EXISTS node_ways (node INTEGER, way INTEGER, PRIMARY KEY (node, way)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS way_relations (way INTEGER, relation INTEGER,
+                                          PRIMARY KEY (way, relation)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS features (layer TEXT, type TEXT, id INTEGER, properties TEXT,
+                                     geometry BLOB, PRIMARY KEY (layer, type, id)) WITHOUT ROWID;
+"""
+CHANGE_KINDS = ("added", "modified", "removed")
+OUTPUT_LAYERS = (*LAYERS, "roads")
+
+
+def relevant(tags):
+    """Объект нужен хранилищу сам по себе (теги слоя или автомобильная дорога)"""
+    return bool(layers_for(tags)) or is_drive_road(tags)
+
+
+def is_area_relation(tags):
+    return tags.get("type") == "multipolygon" and bool(layers_for(tags))
+
+
+class OsmStore:
+    """Узлы, линии, отношения и готовые объекты слоев в одном файле SQLite"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.executescript(SCHEMA)
+        # Объекты, чьи нужные узлы/линии отсутствуют в хранилище
+        self.unresolved = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # ---------- примитивы ----------
+
+    def put_node(self, node_id, lon, lat, tags=None):
+        self.db.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)",
+                        (node_id, lon, lat, json.dumps(tags, ensure_ascii=False) if tags else None))
+
+    def put_way(self, way_id, nodes, tags):
+        self.delete_way(way_id)
+        self.db.execute("INSERT INTO ways VALUES (?, ?, ?)",
+                        (way_id, json.dumps(nodes), json.dumps(tags, ensure_ascii=False)))
+        self.db.executemany("INSERT OR IGNORE INTO node_ways VALUES (?, ?)",
+                            [(n, way_id) for n in nodes])
+
+    def put_relation(self, relation_id, members, tags):
+        """members — [(id линии, роль)]; узлы и вложенные отношения не нужны"""
+        self.delete_relation(relation_id)
+        self.db.execute("INSERT INTO relations VALUES (?, ?, ?)",
+                        (relation_id, json.dumps(members), json.dumps(tags, ensure_ascii=False)))
+        self.db.executemany("INSERT OR IGNORE INTO way_relations VALUES (?, ?)",
+                            [(way, relation_id) for way, _ in members])
+
+    def delete_node(self, node_id):
+        self.db.execute("DELETE FROM nodes WHERE id = ?", (node_id,))
+
+    def delete_way(self, way_id):
+        self.db.execute("DELETE FROM ways WHERE id = ?", (way_id,))
+        self.db.execute("DELETE FROM node_ways WHERE way = ?", (way_id,))
+
+    def delete_relation(self, relation_id):
+        self.db.execute("DELETE FROM relations WHERE id = ?", (relation_id,))
+        self.db.execute("DELETE FROM way_relations WHERE relation = ?", (relation_id,))
+
+    def ways_of_nodes(self, node_ids):
+        return {r[0] for r in self._lookup("SELECT way FROM node_ways WHERE node IN ({})", node_ids)}
+
+    def relations_of_ways(self, way_ids):
+        return {r[0] for r in self._lookup("SELECT relation FROM way_relations WHERE way IN ({})",
+                                           way_ids)}
+
+    def _lookup(self, sql, ids):
+        """Строки запроса с IN (...) по ids пачками (предел переменных SQLite)"""
+        ids, out = list(ids), []
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            out.extend(self.db.execute(sql.format(",".join("?" * len(chunk))), chunk))
+        return out
+
+    # ---------- элементы в формате Overpass JSON ----------
+
+    def _way_points(self, nodes):
+        """Координаты узлов линии или None, если каких-то узлов нет"""
+        rows = {r[0]: (r[1], r[2]) for r in
+                self._lookup("SELECT id, lon, lat FROM nodes WHERE id IN ({})", set(nodes))}
+        if len(rows) < len(set(nodes)):
+            return None
+        return [{"lon": rows[n][0], "lat": rows[n][1]} for n in nodes]
+
+    def element(self, kind, osm_id):
+        """Элемент как в ответе Overpass "out body geom" или None (не собирается)"""
+        if kind == "node":
+            row = self.db.execute("SELECT lon, lat, tags FROM nodes WHERE id = ?", (osm_id,)).fetchone()
+            if row is None or row[2] is None:
+                return None
+            return {"type": "node", "id": osm_id, "lon": row[0], "lat": row[1],
+                    "tags": json.loads(row[2])}
+        if kind == "way":
+            row = self.db.execute("SELECT nodes, tags FROM ways WHERE id = ?", (osm_id,)).fetchone()
+            if row is None:
+                return None
+            nodes = json.loads(row[0])
+            points = self._way_points(nodes)
+            if points is None:
+                self.unresolved += 1
+                return None
+            return {"type": "way", "id": osm_id, "nodes": nodes, "geometry": points,
+                    "tags": json.loads(row[1])}
+        row = self.db.execute("SELECT members, tags FROM relations WHERE id = ?", (osm_id,)).fetchone()
+        if row is None:
+            return None
+        members = []
+        for way_id, role in json.loads(row[0]):
+            way_row = self.db.execute("SELECT nodes FROM ways WHERE id = ?", (way_id,)).fetchone()
+            points = self._way_points(json.loads(way_row[0])) if way_row else None
+            if points is None:
+                self.unresolved += 1
+                return None
+            members.append({"type": "way", "ref": way_id, "role": role, "geometry": points})
+        return {"type": "relation", "id": osm_id, "members": members, "tags": json.loads(row[1])}
+
+    def refresh(self, kind, osm_id):
+        """
+        Пересобирает объекты слоев элемента. Возвращает {слой: added /
+        modified / removed} для слоев, где объект есть сейчас или был раньше.
+        """
+        before = {r[0] for r in self.db.execute(
+            "SELECT layer FROM features WHERE type = ? AND id = ?", (kind, osm_id))}
+        self.db.execute("DELETE FROM features WHERE type = ? AND id = ?", (kind, osm_id))
+        element = self.element(kind, osm_id)
+        after = set()
+        if element is not None:
+            rows = self._feature_rows(element)
+            self.db.executemany("INSERT INTO features VALUES (?, ?, ?, ?, ?)", rows)
+            after = {r[0] for r in rows}
+        return {layer: ("added" if layer not in before else
+                        "removed" if layer not in after else "modified")
+                for layer in before | after}
+
+    def _feature_rows(self, element):
+        tags = element.get("tags", {})
+        rows = []
+        base = {"element_type": element["type"], "osmid": element["id"]}
+        layers = [name for name in element_layers(element) if name != "roads"]
+        geometry = element_geometry(element) if layers else None
+        for name in layers:
+            if geometry is None or (name == "buildings" and
+                                    geometry.geom_type not in ("Polygon", "MultiPolygon")):
+                continue
+            rows.append((name, element["type"], element["id"],
+                         json.dumps({**base, **tags}, ensure_ascii=False), shapely.to_wkb(geometry)))
+        road = element_road(element)
+        if road is not None:
+            _, road_tags, _, coords = road
+            rows.append(("roads", "way", element["id"],
+                         json.dumps({**base, **road_tags}, ensure_ascii=False),
+                         shapely.to_wkb(shapely.LineString(coords))))
+        return rows
+
+    # ---------- загрузка и изменения ----------
+
+    def load_pbf(self, pbf_path, index=DEFAULT_INDEX):
+        """Заполняет хранилище из .osm.pbf (два прохода: отношения, затем узлы и линии)"""
+        import osmium
+
+        members = set()
+        for rel in osmium.FileProcessor(str(pbf_path), osmium.osm.RELATION):
+            tags = dict(rel.tags)
+            if is_area_relation(tags):
+                way_members = [(m.ref, m.role) for m in rel.members if m.type == "w"]
+                self.put_relation(rel.id, way_members, tags)
+                members.update(ref for ref, _ in way_members)
+        logger.info(f"Отношений-мультиполигонов: {self.count('relations')}")
+
+        processor = osmium.FileProcessor(str(pbf_path), osmium.osm.NODE | osmium.osm.WAY)
+        processor.with_locations(osmium.index.create_map(index))
+        for obj in processor:
+            tags = dict(obj.tags)
+            if obj.is_node():
+                if layers_for(tags) and obj.location.valid():
+                    self.put_node(obj.id, obj.location.lon, obj.location.lat, tags)
+            elif relevant(tags) or obj.id in members:
+                try:
+                    refs = [(nd.ref, nd.lon, nd.lat) for nd in obj.nodes]
+                except osmium.InvalidLocationError:
+                    self.unresolved += 1
+                    continue
+                # Узлы линии: нужны, чтобы потом двигать их по изменениям
+                self.db.executemany("INSERT OR IGNORE INTO nodes VALUES (?, ?, ?, NULL)", refs)
+                self.put_way(obj.id, [r[0] for r in refs], tags)
+        self.db.commit()
+
+        for kind, table in (("node", "nodes WHERE tags IS NOT NULL"), ("way", "ways"),
+                            ("relation", "relations")):
+            ids = [r[0] for r in self.db.execute(f"SELECT id FROM {table}")]
+            for osm_id in ids:
+                self.refresh(kind, osm_id)
+        self.db.commit()
+        logger.info(f"Хранилище {self.path}: " + ", ".join(
+            f"{layer}={self.count('features', layer)}" for layer in OUTPUT_LAYERS))
+
+    def apply_osc(self, osc_path):
+        """
+        Применяет файл OsmChange. Возвращает {слой: {added/modified/removed: [(тип, id)]}}.
+        """
+        import osmium
+
+        touched = {"node": set(), "way": set(), "relation": set()}
+        # Линии без тегов слоев: понадобятся, если на них сошлется отношение из этого же файла
+        spare = {}
+        for obj in osmium.FileProcessor(str(osc_path)):
+            tags = dict(obj.tags)
+            if obj.is_node():
+                if obj.deleted:
+                    self.delete_node(obj.id)
+                elif obj.location.valid():
+                    # Неотмеченные узлы тоже храним: на них могут ссылаться новые линии
+                    self.put_node(obj.id, obj.location.lon, obj.location.lat,
+                                  tags if layers_for(tags) else None)
+                touched["node"].add(obj.id)
+            elif obj.is_way():
+                member = bool(self.relations_of_ways([obj.id]))
+                if obj.deleted or not (relevant(tags) or member):
+                    self.delete_way(obj.id)
+                    if not obj.deleted:
+                        spare[obj.id] = ([nd.ref for nd in obj.nodes], tags)
+                else:
+                    self.put_way(obj.id, [nd.ref for nd in obj.nodes], tags)
+                touched["way"].add(obj.id)
+            elif obj.is_relation():
+                if obj.deleted or not is_area_relation(dict(obj.tags)):
+                    self.delete_relation(obj.id)
+                else:
+                    self.put_relation(obj.id, [(m.ref, m.role) for m in obj.members
+                                               if m.type == "w"], tags)
+                touched["relation"].add(obj.id)
+
+        member_ways = {r[0] for r in self.db.execute("SELECT way FROM way_relations")} & set(spare)
+        for way_id in member_ways:
+            self.put_way(way_id, *spare[way_id])
+
+        # Сдвинутые узлы меняют линии, линии — отношения
+        touched["way"] |= self.ways_of_nodes(touched["node"])
+        touched["relation"] |= self.relations_of_ways(touched["way"])
+        changes = {layer: {kind: set() for kind in CHANGE_KINDS} for layer in OUTPUT_LAYERS}
+        for kind, ids in touched.items():
+            for osm_id in ids:
+                for layer, change in self.refresh(kind, osm_id).items():
+                    changes[layer][change].add((kind, osm_id))
+        self.db.commit()
+        return {layer: {kind: sorted(ids) for kind, ids in kinds.items()}
+                for layer, kinds in changes.items()}
+
+    def count(self, table, layer=None):
+        if layer is None:
+            return self.db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        return self.db.execute(f"SELECT COUNT(*) FROM {table} WHERE layer = ?", (layer,)).fetchone()[0]
+
+    # ---------- выгрузка слоев ----------
+
+    def export(self, out_dir, keep_prev=True, layers=OUTPUT_LAYERS):
+        """
+        Пишет слои layers в out_dir под именами LAYER_FILES; прошлые файлы
+        переименовываются в *.prev.geojson (keep_prev). Возвращает {слой: путь}.
+        Это полная перезапись слоя: файл пишется из всех объектов слоя в
+        хранилище, а ребра дорог заново режутся по всему региону, то есть
+        стоимость — размер слоя, а не размер изменений. Поэтому apply
+        переписывает только слои, в которых что-то изменилось.
+        """
+        out = Path(out_dir)
+        out.mkdir(parents=True, exist_ok=True)
+        paths = {name: out / LAYER_FILES[name] for name in OUTPUT_LAYERS if name in layers}
+        if keep_prev:
+            for path in paths.values():
+                if path.exists():
+                    os.replace(path, path.with_suffix(".prev.geojson"))
+
+        with ExitStack() as stack:
+            writers = {name: stack.enter_context(GeoJSONWriter(paths[name]))
+                       for name in LAYERS if name in paths}
+            rows = self.db.execute("SELECT layer, properties, geometry FROM features "
+                                   "WHERE layer != 'roads' ORDER BY layer, type, id")
+            for layer, properties, geometry in rows:
+                if layer in writers:
+                    writers[layer].write(json.loads(properties), shapely.from_wkb(geometry))
+
+        if "roads" in paths:
+            self._export_roads(paths["roads"])
+        for path in paths.values():
+            logger.info(f"Сохранено {path}")
+        return paths
+
+    def _export_roads(self, path):
+        """Ребра дорог всего региона (линии режутся в перекрестках заново)"""
+        roads = []
+        rows = self.db.execute("SELECT f.id, f.properties, f.geometry, w.nodes FROM features f "
+                               "JOIN ways w ON w.id = f.id WHERE f.layer = 'roads' ORDER BY f.id")
+        for osm_id, properties, geometry, nodes in rows:
+            properties = json.loads(properties)
+            roads.append((osm_id, {t: properties[t] for t in ROAD_TAGS if t in properties},
+                          json.loads(nodes), shapely.get_coordinates(shapely.from_wkb(geometry))))
+        ways_to_edges(roads).to_file(path, driver="GeoJSON")
+
+
+@click.group()
+def cli():
+    """Локальное хранилище OSM: заполнение из .osm.pbf и применение .osc"""
+
+
+@cli.command()
+@click.option("--pbf", required=True, type=click.Path(exists=True, dir_okay=False),
+              help="Выгрузка региона .osm.pbf")
+@click.option("--store", default="data/osm/osm_store.sqlite", help="Файл хранилища")
+@click.option("--out-dir", default="data/osm", help="Куда писать слои")
+@click.option("--pbf-index", default=DEFAULT_INDEX, help="Индекс координат узлов osmium")
+def init(pbf, store, out_dir, pbf_index):
+    """Создает хранилище из .osm.pbf и пишет слои"""
+    if Path(store).exists():
+        raise click.ClickException(f"{store} уже существует — удалите его или используйте apply")
+    osm = OsmStore(store)
+    osm.load_pbf(pbf, index=pbf_index)
+    osm.export(out_dir, keep_prev=False)
+    osm.close()
+
+
+@cli.command()
+@click.argument("osc_files", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+@click.option("--store", default="data/osm/osm_store.sqlite", help="Файл хранилища")
+@click.option("--out-dir", default="data/osm", help="Куда писать слои")
+@click.option("--changes-out", default="data/osm/changes.json",
+              help="JSON изменившихся объектов [тип, id] (для featurize_incremental.py --changes)")
+def apply(osc_files, store, out_dir, changes_out):
+    """
+    Применяет файлы .osc по порядку, целиком переписывает изменившиеся слои
+    и пишет список изменений
+    """
+    if not Path(store).exists():
+        raise click.ClickException(f"Нет хранилища {store}: сначала init")
+    osm = OsmStore(store)
+    # {слой: {(тип, id): [первое изменение, последнее изменение]}}
+    history = {layer: {} for layer in OUTPUT_LAYERS}
+    for osc in osc_files:
+        changes = osm.apply_osc(osc)
+        logger.info(f"{osc}: " + ", ".join(
+            f"{layer} +{len(c['added'])} ~{len(c['modified'])} -{len(c['removed'])}"
+            for layer, c in changes.items()))
+        for layer, kinds in changes.items():
+            for kind, ids in kinds.items():
+                for obj in ids:
+                    history[layer].setdefault(obj, [kind, kind])[1] = kind
+    if osm.unresolved:
+        logger.warning(f"Не собрано объектов: {osm.unresolved} (нет узлов или линий в "
+                       f"хранилище); при необходимости пересоздайте его из свежей выгрузки")
+
+    # Итог по нескольким файлам: добавлен и удален — нет изменения,
+    # удален и добавлен заново — изменен
+    total = {layer: {kind: [] for kind in CHANGE_KINDS} for layer in OUTPUT_LAYERS}
+    for layer, objects in history.items():
+        for obj, (first, last) in objects.items():
+            if first == "added":
+                kind = None if last == "removed" else "added"
+            else:
+                kind = "removed" if last == "removed" else "modified"
+            if kind:
+                total[layer][kind].append(obj)
+    # Слои без изменений не переписываются (и их *.prev.geojson не трогаются)
+    changed = [layer for layer, kinds in total.items() if any(kinds.values())]
+    if changed:
+        osm.export(out_dir, layers=changed)
+    else:
+        logger.info("Изменений в слоях нет, файлы слоев не переписываются")
+    osm.close()
+
+    Path(changes_out).parent.mkdir(parents=True, exist_ok=True)
+    with open(changes_out, "w", encoding="utf-8") as f:
+        json.dump({layer: {kind: [list(obj) for obj in sorted(objs)] for kind, objs in kinds.items()}
+                   for layer, kinds in total.items()}, f, indent=2)
+    logger.info(f"Список изменений: {changes_out} (прошлые слои — *.prev.geojson)")
+
+
+if __name__ == "__main__":
+    cli()
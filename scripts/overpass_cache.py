@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+overpass_cache.py
+Локальный кэш ответов Overpass по тайлам вместо ox.settings.use_cache.
+Ключ — слой, состав его тегов и границы тайла глобальной сетки (а не текст
+запроса), поэтому пересекающиеся выгрузки районов берут общие тайлы с диска.
+    - записи — gzip JSON: время загрузки и элементы одного слоя тайла;
+    - у каждого слоя свой срок жизни (POI меняются чаще зданий и дорог):
+      устаревший слой тайла перекачивается, свежие остаются;
+    - общий размер ограничен, сверх предела вытесняются давно
+      использованные записи (LRU по времени доступа);
+    - счетчики попаданий, промахов, устаревших и вытесненных записей.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Срок жизни слоя, дни (слой без записи — DEFAULT_TTL_DAYS)
+LAYER_TTL_DAYS = {"buildings": 30, "pois": 7, "roads": 30}
+DEFAULT_TTL_DAYS = 14
+SUFFIX = ".json.gz"
+
+
+class OverpassCache:
+    """Кэш элементов Overpass по (слой, теги, тайл) в папке root"""
+
+    def __init__(self, root, max_mb=1024, ttl_days=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.ttl = {**LAYER_TTL_DAYS, **(ttl_days or {})}
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # Путь -> (размер, время доступа): вытеснение без обхода папки на каждую запись
+        self._entries = {p: (p.stat().st_size, p.stat().st_mtime)
+                         for p in self.root.glob("*" + SUFFIX)}
+        # Предел мог уменьшиться с прошлого запуска
+        self.evict()
+
+    def key(self, layer, spec, bbox):
+        """Ключ записи: слой, его теги/фильтр и границы тайла"""
+        payload = json.dumps({"layer": layer, "spec": spec,
+                              "bbox": [round(float(v), 7) for v in bbox]}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def path(self, layer, key):
+        return self.root / f"{layer}-{key}{SUFFIX}"
+
+    def ttl_seconds(self, layer):
+        return self.ttl.get(layer, DEFAULT_TTL_DAYS) * 86400
+
+    def get(self, layer, spec, bbox):
+        """Элементы слоя тайла или None (нет записи, устарела, повреждена)"""
+        path = self.path(layer, self.key(layer, spec, bbox))
+        if not path.exists():
+            self._count("misses")
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except Exception as e:
+            logger.warning(f"Поврежденная запись кэша Overpass {path.name}: {e}")
+            self._drop(path)
+            self._count("misses")
+            return None
+        if time.time() - entry["fetched"] > self.ttl_seconds(layer):
+            self._count("expired")
+            return None
+        # Время доступа для LRU
+        os.utime(path)
+        with self._lock:
+            self._entries[path] = (self._entries.get(path, (path.stat().st_size, 0))[0], time.time())
+            self.hits += 1
+        return entry["elements"]
+
+    def put(self, layer, spec, bbox, elements):
+        """Сохраняет элементы слоя тайла и при необходимости вытесняет старые записи"""
+        path = self.path(layer, self.key(layer, spec, bbox))
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump({"fetched": time.time(), "elements": elements}, f)
+        os.replace(tmp, path)
+        with self._lock:
+            self._entries[path] = (path.stat().st_size, time.time())
+        self.evict()
+
+    def evict(self):
+        """Удаляет самые давно использованные записи сверх max_bytes"""
+        with self._lock:
+            total = sum(size for size, _ in self._entries.values())
+            if total <= self.max_bytes:
+                return
+            for path, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                total -= size
+                del self._entries[path]
+                path.unlink(missing_ok=True)
+                self.evicted += 1
+                logger.debug(f"Кэш Overpass: вытеснена запись {path.name}")
+
+    def _drop(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+        path.unlink(missing_ok=True)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def summary(self):
+        size = sum(size for size, _ in self._entries.values()) / 1024 / 1024
+        return (f"Кэш Overpass: попаданий {self.hits}, промахов {self.misses}, "
+                f"устаревших {self.expired}, вытеснено {self.evicted}, "
+                f"{len(self._entries)} записей, {size:.1f} МБ")
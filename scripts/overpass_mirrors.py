@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+overpass_mirrors.py
+Пул зеркал Overpass вместо зашитого ox.settings.overpass_url и ручного
+переключения после исключения.
+    - /api/status каждого зеркала опрашивается при старте и после ошибок
+      или по истечении probe_interval: число слотов (Rate limit), свободные
+      слоты, время до освобождения слота и задержка ответа (EWMA);
+    - запрос тайла уходит на самое быстрое зеркало со свободным слотом;
+      одновременных запросов к зеркалу не больше его лимита слотов,
+      после 429 зеркало не используется до освобождения слота;
+    - failure_threshold ошибок подряд размыкают зеркало (circuit breaker)
+      на cooldown секунд, потом пропускается один пробный запрос тайла
+      (не опрос status); его ошибка снова размыкает зеркало;
+    - acquire() ждет свободного зеркала не дольше acquire_timeout и
+      бросает MirrorError, если все зеркала отключены дольше этого срока.
+Для osmnx (ox.settings.overpass_url) нужен адрес .../api без /interpreter —
+его возвращает best(); сами запросы тайлов идут на .../api/interpreter.
+"""
+
+import logging
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIRRORS = (
+    "https://overpass-api.de/api/interpreter",
+    "https://overpass.kumi.systems/api/interpreter",
+    "https://maps.mail.ru/osm/tools/overpass/api/interpreter",
+)
+# Слотов у зеркала, если status их не сообщает (Rate limit: 0 — без лимита)
+DEFAULT_SLOTS = 2
+PROBE_TIMEOUT = 10
+PROBE_INTERVAL = 60
+FAILURE_THRESHOLD = 3
+COOLDOWN = 120
+# Вес нового замера в скользящей средней задержки
+LATENCY_ALPHA = 0.3
+# Пауза после 429, если status не сказал, когда освободится слот
+BUSY_PAUSE = 10
+# Дольше этого acquire() свободного зеркала не ждет, секунды
+ACQUIRE_TIMEOUT = 600
+
+
+class MirrorError(Exception):
+    """Временная ошибка зеркала (занято, 5xx, обрыв) или нет доступных зеркал"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP-код ответа (429 — зеркало занято, а не сломано)
+        self.status = status
+
+
+def status_url(url):
+    """.../api/interpreter -> .../api/status"""
+    return re.sub(r"/interpreter/?$", "/status", url)
+
+
+def api_url(url):
+    """.../api/interpreter -> .../api (osmnx сам дописывает /interpreter)"""
+    return re.sub(r"/interpreter/?$", "", url)
+
+
+def parse_status(text):
+    """
+    Текст /api/status -> (лимит слотов или None, свободных слотов,
+    секунд до освобождения слота)
+    """
+    limit = re.search(r"Rate limit:\s*(\d+)", text)
+    free = re.search(r"(\d+)\s+slots? available now", text)
+    waits = [int(s) for s in re.findall(r"in\s+(-?\d+)\s+seconds?", text)]
+    return (int(limit.group(1)) if limit else None,
+            int(free.group(1)) if free else 0,
+            max(min(waits), 0) if waits else 0)
+
+
+class Mirror:
+    """Состояние одного зеркала (меняется только под замком пула)"""
+
+    def __init__(self, url, slots=DEFAULT_SLOTS):
+        self.url = url
+        self.slots = slots
+        self.latency = None
+        self.inflight = 0
+        self.not_before = 0.0      # раньше этого времени запросы не слать
+        self.failures = 0
+        self.open_until = 0.0      # circuit breaker разомкнут до этого времени
+        self.half_open = False
+        self.probed_at = 0.0
+        self.probing = False
+
+    def available(self, now):
+        if now < self.open_until or now < self.not_before:
+            return False
+        if self.half_open and self.inflight:
+            return False
+        return self.inflight < self.slots
+
+    def __repr__(self):
+        latency = "?" if self.latency is None else f"{self.latency * 1000:.0f} мс"
+        return f"{self.url} ({latency}, слотов {self.slots}, в работе {self.inflight})"
+
+
+class MirrorPool:
+    """Выбор зеркала для каждого запроса: acquire() -> запрос -> release()"""
+
+    def __init__(self, urls=DEFAULT_MIRRORS, probe_interval=PROBE_INTERVAL,
+                 failure_threshold=FAILURE_THRESHOLD, cooldown=COOLDOWN,
+                 default_slots=DEFAULT_SLOTS, probe=True, acquire_timeout=ACQUIRE_TIMEOUT):
+        if not urls:
+            raise ValueError("Список зеркал Overpass пуст")
+        self.mirrors = [Mirror(url, default_slots) for url in dict.fromkeys(urls)]
+        self.probe_interval = probe_interval
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.default_slots = default_slots
+        self.acquire_timeout = acquire_timeout
+        self._cond = threading.Condition()
+        if probe:
+            self.probe_all()
+
+    # ---------- опрос /api/status ----------
+
+    def probe(self, mirror):
+        """Опрашивает status зеркала; недоступный status считается ошибкой зеркала"""
+        start = time.monotonic()
+        try:
+            request = urllib.request.Request(status_url(mirror.url),
+                                             headers={"User-Agent": "osm-population"})
+            with urllib.request.urlopen(request, timeout=PROBE_TIMEOUT) as response:
+                text = response.read().decode("utf-8", errors="replace")
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Зеркало {mirror.url}: status недоступен ({e})")
+            with self._cond:
+                mirror.probing = False
+                mirror.probed_at = time.monotonic()
+                self._failure(mirror)
+            return
+        elapsed = time.monotonic() - start
+        limit, free, wait = parse_status(text)
+        with self._cond:
+            mirror.probing = False
+            mirror.probed_at = time.monotonic()
+            mirror.latency = elapsed if mirror.latency is None else \
+                (1 - LATENCY_ALPHA) * mirror.latency + LATENCY_ALPHA * elapsed
+            mirror.slots = limit if limit else self.default_slots
+            # Своих запросов в работе status тоже не видит свободными
+            if free == 0 and mirror.inflight == 0 and limit:
+                mirror.not_before = time.monotonic() + wait
+            self._cond.notify_all()
+
+    def probe_all(self):
+        """Параллельный опрос всех зеркал"""
+        threads = [threading.Thread(target=self.probe, args=(m,), daemon=True) for m in self.mirrors]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.info("Зеркала Overpass: " + "; ".join(map(repr, self.ranked())))
+
+    def _stale(self, now):
+        """
+        Зеркала, которые пора опросить заново (помечаются как опрашиваемые).
+        Разомкнутые и полуоткрытые не опрашиваются: их проверяет пробный запрос тайла.
+        """
+        stale = [m for m in self.mirrors if not m.probing and now >= m.open_until
+                 and not m.half_open and now - m.probed_at > self.probe_interval]
+        for mirror in stale:
+            mirror.probing = True
+        return stale
+
+    # ---------- выбор зеркала ----------
+
+    def ranked(self):
+        """Зеркала от быстрых к медленным (неопрошенные — в конце)"""
+        return sorted(self.mirrors, key=lambda m: float("inf") if m.latency is None else m.latency)
+
+    def best(self):
+        """
+        Адрес API (.../api, без /interpreter) самого быстрого неразомкнутого
+        зеркала — для ox.settings.overpass_url
+        """
+        now = time.monotonic()
+        closed = [m for m in self.ranked() if now >= m.open_until]
+        return api_url((closed or self.ranked())[0].url)
+
+    def acquire(self, timeout=None):
+        """
+        Блокирует, пока у какого-нибудь зеркала не освободится слот, и
+        занимает слот самого быстрого из них. MirrorError — если за timeout
+        (по умолчанию acquire_timeout) зеркало не нашлось или все зеркала
+        отключены дольше этого срока.
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                stale = self._stale(now)
+                if not stale:
+                    free = [m for m in self.ranked() if m.available(now)]
+                    if free:
+                        mirror = free[0]
+                        mirror.inflight += 1
+                        return mirror
+                    if all(now < m.open_until for m in self.mirrors) and \
+                            min(m.open_until for m in self.mirrors) > deadline:
+                        raise MirrorError(f"Все зеркала Overpass отключены дольше {timeout:.0f} с")
+                    if now >= deadline:
+                        raise MirrorError(f"Нет свободного зеркала Overpass за {timeout:.0f} с")
+                    # Ждем освобождения слота, конца паузы или cooldown (не дольше срока)
+                    wakeups = [t for m in self.mirrors for t in (m.open_until, m.not_before) if t > now]
+                    self._cond.wait(timeout=min([*wakeups, deadline]) - now)
+                    continue
+            for mirror in stale:
+                self.probe(mirror)
+
+    def release(self, mirror, ok=True, busy=False):
+        """
+        Возвращает слот. ok=False — ошибка зеркала (счетчик для circuit
+        breaker), busy=True — 429: зеркало ждет освобождения слота.
+        """
+        with self._cond:
+            mirror.inflight -= 1
+            now = time.monotonic()
+            if busy:
+                mirror.not_before = max(mirror.not_before, now + BUSY_PAUSE)
+                # Перед следующим запросом уточнить время по status
+                mirror.probed_at = 0.0
+            elif ok:
+                mirror.failures = 0
+                if mirror.half_open:
+                    logger.info(f"Зеркало {mirror.url} снова работает")
+                mirror.half_open = False
+            else:
+                self._failure(mirror)
+            self._cond.notify_all()
+
+    def _failure(self, mirror):
+        mirror.failures += 1
+        if time.monotonic() < mirror.open_until:
+            # Ответы запросов, ушедших до размыкания
+            return
+        if mirror.half_open or mirror.failures >= self.failure_threshold:
+            mirror.open_until = time.monotonic() + self.cooldown
+            mirror.half_open = True
+            logger.warning(f"Зеркало {mirror.url}: {mirror.failures} ошибок подряд — "
+                           f"отключено на {self.cooldown} с")
+        self._cond.notify_all()
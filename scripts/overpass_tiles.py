@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+overpass_tiles.py
+Загрузка OSM через Overpass по тайлам квадродерева вместо одного огромного
+запроса features_from_place.
+    - bbox режется на корневые тайлы не больше tile_size градусов; тайл,
+      на котором сервер не уложился во время (или в память) и сообщил об
+      этом в remark ответа, делится на 4 (зависшее зеркало — нет);
+    - тайлы качаются параллельно (не больше workers запросов одновременно);
+      зеркало для каждого запроса выбирает пул overpass_mirrors.py (самое
+      быстрое со свободным слотом, без разомкнутых); при 5xx/обрыве —
+      пауза с экспоненциальным ростом и повтор;
+    - каждый готовый тайл пишется в <tiles>/<ключ>.json, а его ключ — в
+      manifest.json: повторный запуск докачивает только недостающее;
+    - тайлы лежат на глобальной сетке, и ответы по слоям хранятся в кэше
+      overpass_cache.py: пересекающиеся выгрузки не качают общие тайлы заново;
+    - при сборке объекты из разных тайлов дедуплицируются по (тип, OSM id).
+Один запрос на тайл сразу на все слои (здания, POI и автомобильные
+дороги); слои разделяются по тегам локально, дороги режутся на ребра
+в перекрестках (roads_edges.geojson). Используется только стандартная библиотека (urllib).
+"""
+
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import click
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import LineString, Point, Polygon
+
+from osm_layers import (DRIVE_EXCLUDED_HIGHWAYS, LAYER_FILES, LAYERS, ROAD_TAGS,
+                        is_drive_road, layers_for, ways_to_edges)
+from overpass_cache import OverpassCache
+from overpass_mirrors import DEFAULT_MIRRORS, MirrorError, MirrorPool
+
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 0.05        # градусы, ~5 км по широте
+QUERY_TIMEOUT = 180     # [timeout:] запроса, секунды
+MAX_DEPTH = 6           # делений корневого тайла (1/64 стороны)
+MAX_RETRIES = 6         # попыток на тайл по всем зеркалам
+BUSY_RETRIES = 30       # ответов 429 на тайл, после которых сдаемся
+BACKOFF = 2.0           # первая пауза, секунды
+SOCKET_MARGIN = 30      # запас таймаута сокета сверх [timeout:] запроса, секунды
+MANIFEST = "manifest.json"
+
+# Коды, после которых стоит подождать и сходить на другое зеркало
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Признаки в remark ответа, что тайл слишком тяжелый
+TOO_LARGE_REMARKS = ("timed out", "out of memory")
+
+
+class TileTooLarge(Exception):
+    """Сервер не уложился в таймаут или память: тайл надо делить"""
+
+
+# ---------- ТАЙЛЫ ----------
+
+def root_tiles(bbox, tile_size=TILE_SIZE):
+    """
+    {ключ: (west, south, east, north)} тайлов глобальной сетки с шагом
+    tile_size, покрывающих bbox. Ключ — номера клетки сетки, поэтому тайлы
+    разных bbox совпадают и переиспользуются кэшем.
+    """
+    west, south, east, north = bbox
+    i0, j0 = int(np.floor(west / tile_size + 1e-9)), int(np.floor(south / tile_size + 1e-9))
+    i1 = max(int(np.ceil(east / tile_size - 1e-9)), i0 + 1)
+    j1 = max(int(np.ceil(north / tile_size - 1e-9)), j0 + 1)
+    return {f"{i}_{j}": (i * tile_size, j * tile_size, (i + 1) * tile_size, (j + 1) * tile_size)
+            for j in range(j0, j1) for i in range(i0, i1)}
+
+
+def children(key, bbox):
+    """Четыре дочерних тайла: ключ родителя + .0-.3 (ЮЗ, ЮВ, СЗ, СВ)"""
+    west, south, east, north = bbox
+    mx, my = (west + east) / 2, (south + north) / 2
+    boxes = [(west, south, mx, my), (mx, south, east, my),
+             (west, my, mx, north), (mx, my, east, north)]
+    return {f"{key}.{q}": box for q, box in enumerate(boxes)}
+
+
+def depth(key):
+    return key.count(".")
+
+
+# ---------- ЗАПРОС ----------
+
+def drive_filter():
+    """Фильтр Overpass QL для автомобильных дорог (как is_drive_road)"""
+    excluded = "|".join(sorted(DRIVE_EXCLUDED_HIGHWAYS))
+    return (f'["highway"]["highway"!~"^({excluded})$"]["area"!="yes"]'
+            f'["access"!="private"]["motor_vehicle"!="no"]["motorcar"!="no"]')
+
+
+def build_query(bbox, layers=LAYERS, timeout=QUERY_TIMEOUT, roads=True):
+    """
+    Overpass QL: все объекты с тегами слоев (и дороги, если roads) в bbox,
+    с геометрией и id узлов линий
+    """
+    west, south, east, north = bbox
+    box = f"{south:.7f},{west:.7f},{north:.7f},{east:.7f}"
+    keys = dict.fromkeys(tag for tags in layers.values() for tag in tags)
+    body = "".join(f'nwr["{tag}"]({box});' for tag in keys)
+    if roads:
+        body += f"way{drive_filter()}({box});"
+    return f"[out:json][timeout:{int(timeout)}];({body});out body geom;"
+
+
+def fetch(url, query, timeout=QUERY_TIMEOUT):
+    """
+    POST запроса на зеркало url -> список элементов.
+    TileTooLarge — сервер сам сообщил (remark), что не уложился во
+    время/память; MirrorError — временная ошибка зеркала, в т.ч. нет
+    ответа до таймаута сокета (зеркало зависло или перегружено — тайл не
+    делится, а уходит на другое зеркало); остальные HTTP-ошибки (400 —
+    ошибка в запросе) пробрасываются.
+    """
+    data = urllib.parse.urlencode({"data": query}).encode("utf-8")
+    request = urllib.request.Request(url, data=data, headers={"User-Agent": "osm-population"})
+    try:
+        # Сокету даем запас сверх серверного таймаута
+        with urllib.request.urlopen(request, timeout=timeout + SOCKET_MARGIN) as response:
+            payload = json.loads(response.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        if e.code in RETRY_STATUS:
+            raise MirrorError(f"{url}: HTTP {e.code}", e.code) from e
+        raise
+    except (socket.timeout, TimeoutError) as e:
+        raise MirrorError(f"{url}: нет ответа за {timeout + SOCKET_MARGIN} с") from e
+    except (urllib.error.URLError, ConnectionError, json.JSONDecodeError) as e:
+        raise MirrorError(f"{url}: {e}") from e
+
+    remark = payload.get("remark", "")
+    if any(marker in remark for marker in TOO_LARGE_REMARKS):
+        raise TileTooLarge(f"{url}: {remark}")
+    if remark:
+        raise MirrorError(f"{url}: {remark}")
+    return payload.get("elements", [])
+
+
+# ---------- ЗАГРУЗЧИК ----------
+
+class TileDownloader:
+    """
+    Параллельная докачиваемая загрузка тайлов bbox в папку root.
+    manifest.json: bbox, размер корневого тайла, состав запроса и состояние
+    тайлов ("done" — файл тайла записан, "split" — тайл заменен детьми,
+    "failed" — не скачан, следующий запуск попробует снова).
+    """
+
+    def __init__(self, root, bbox, mirrors=DEFAULT_MIRRORS, workers=4,
+                 tile_size=TILE_SIZE, timeout=QUERY_TIMEOUT, max_depth=MAX_DEPTH,
+                 max_retries=MAX_RETRIES, backoff=BACKOFF, layers=LAYERS, roads=True,
+                 cache=None, pool=None):
+        if not mirrors and pool is None:
+            raise ValueError("Список зеркал Overpass пуст")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.bbox = tuple(float(v) for v in bbox)
+        self.mirrors = [m.url for m in pool.mirrors] if pool is not None else list(mirrors)
+        self.workers = max(int(workers), 1)
+        self.tile_size = float(tile_size)
+        self.timeout = timeout
+        self.max_depth = max_depth
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.layers = layers
+        self.roads = roads
+        # OverpassCache или None
+        self.cache = cache
+        # MirrorPool создается (и опрашивает зеркала) только если есть что качать
+        self.pool = pool
+        self._lock = threading.Lock()
+        self.state = self._load_manifest()
+
+    # --- manifest ---
+
+    @property
+    def manifest_path(self):
+        return self.root / MANIFEST
+
+    def _load_manifest(self):
+        path = self.manifest_path
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            if tuple(manifest.get("bbox", ())) == self.bbox and \
+                    manifest.get("tile_size") == self.tile_size and \
+                    manifest.get("query") == self.query_spec:
+                return manifest.get("tiles", {})
+            logger.warning(f"{path}: другой bbox, размер тайла или состав запроса — начинаем заново")
+        return {}
+
+    def _save_manifest(self):
+        """Атомарная запись: прерванный запуск не портит manifest"""
+        manifest = {"bbox": list(self.bbox), "tile_size": self.tile_size,
+                    "query": self.query_spec, "tiles": self.state}
+        tmp = self.manifest_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    @property
+    def query_spec(self):
+        """Состав запроса: тайлы другого состава переиспользовать нельзя"""
+        return {"layers": {name: list(tags) for name, tags in self.layers.items()},
+                "roads": self.roads}
+
+    @property
+    def layer_specs(self):
+        """{слой: теги или фильтр Overpass} — по ним слои тайла кэшируются отдельно"""
+        specs = {name: list(tags) for name, tags in self.layers.items()}
+        if self.roads:
+            specs["roads"] = drive_filter()
+        return specs
+
+    def _mark(self, key, status):
+        with self._lock:
+            self.state[key] = status
+            self._save_manifest()
+
+    def tile_path(self, key):
+        return self.root / f"{key}.json"
+
+    # --- план ---
+
+    def pending(self):
+        """{ключ: bbox} тайлов, которые еще надо скачать (с учетом делений)"""
+        todo = {}
+        stack = list(root_tiles(self.bbox, self.tile_size).items())
+        while stack:
+            key, box = stack.pop()
+            status = self.state.get(key)
+            if status == "split":
+                stack.extend(children(key, box).items())
+            elif status != "done" or not self.tile_path(key).exists():
+                todo[key] = box
+        return todo
+
+    def done_tiles(self):
+        return [key for key, status in self.state.items()
+                if status == "done" and self.tile_path(key).exists()]
+
+    # --- загрузка ---
+
+    def fetch_tile(self, key, bbox, layers, roads):
+        """Элементы слоев тайла с повторами по зеркалам; TileTooLarge пробрасывается"""
+        query = build_query(bbox, layers, self.timeout, roads)
+        attempt = busy_count = 0
+        # 429 — не ошибка, но и бесконечно ждать занятые зеркала не будем
+        while attempt < self.max_retries and busy_count < BUSY_RETRIES:
+            mirror = self.pool.acquire()
+            try:
+                elements = fetch(mirror.url, query, self.timeout)
+            except TileTooLarge:
+                # Зеркало исправно, тяжел сам тайл
+                self.pool.release(mirror)
+                raise
+            except MirrorError as e:
+                busy = e.status == 429
+                self.pool.release(mirror, ok=False, busy=busy)
+                if busy:
+                    # Паузу до свободного слота выдержит пул
+                    logger.info(f"Тайл {key}: {e}; ждем слот")
+                    busy_count += 1
+                    continue
+                delay = self.backoff * 2 ** attempt * (1 + random.random())
+                logger.warning(f"Тайл {key}: {e}; повтор через {delay:.1f} с")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except Exception:
+                self.pool.release(mirror, ok=False)
+                raise
+            self.pool.release(mirror)
+            return elements
+        raise MirrorError(f"Тайл {key}: попытки исчерпаны ({attempt} ошибок, {busy_count} отказов 429)")
+
+    def _run_tile(self, key, bbox):
+        """
+        Скачивает тайл (только слои, которых нет в кэше или они устарели);
+        возвращает детей, если тайл пришлось делить
+        """
+        elements, stale = [], list(self.layer_specs)
+        if self.cache is not None:
+            stale = []
+            for name, spec in self.layer_specs.items():
+                cached = self.cache.get(name, spec, bbox)
+                if cached is None:
+                    stale.append(name)
+                else:
+                    elements.extend(cached)
+        try:
+            if stale:
+                fetched = self.fetch_tile(key, bbox, {n: self.layers[n] for n in stale if n in self.layers},
+                                          "roads" in stale)
+                elements.extend(fetched)
+                if self.cache is not None:
+                    by_layer = {name: [] for name in stale}
+                    for element in fetched:
+                        for name in element_layers(element, self.layers):
+                            if name in by_layer:
+                                by_layer[name].append(element)
+                    for name, layer_elements in by_layer.items():
+                        self.cache.put(name, self.layer_specs[name], bbox, layer_elements)
+        except TileTooLarge as e:
+            if depth(key) >= self.max_depth:
+                raise MirrorError(f"Тайл {key}: {e}; делить дальше нельзя") from e
+            logger.info(f"Тайл {key} слишком тяжелый ({e}) — делим на 4")
+            self._mark(key, "split")
+            return children(key, bbox)
+        tmp = self.tile_path(key).with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(elements, f)
+        os.replace(tmp, self.tile_path(key))
+        self._mark(key, "done")
+        logger.info(f"Тайл {key}: {len(elements)} объектов")
+        return {}
+
+    def run(self):
+        """
+        Качает все недостающие тайлы. Возвращает ключи тайлов, которые не
+        удалось скачать (их докачает следующий запуск).
+        """
+        todo = self.pending()
+        logger.info(f"Тайлов к загрузке: {len(todo)} (готово {len(self.done_tiles())}), "
+                    f"зеркал {len(self.mirrors)}, потоков {self.workers}")
+        if todo and self.pool is None:
+            self.pool = MirrorPool(self.mirrors)
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            running = {pool.submit(self._run_tile, key, box): key for key, box in todo.items()}
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    key = running.pop(future)
+                    try:
+                        extra = future.result()
+                    except MirrorError as e:
+                        logger.error(str(e))
+                        self._mark(key, "failed")
+                        failed.append(key)
+                        continue
+                    for child, box in extra.items():
+                        running[pool.submit(self._run_tile, child, box)] = child
+        return failed
+
+    def elements(self):
+        """Элементы всех готовых тайлов без повторов по (тип, id)"""
+        merged = {}
+        for key in self.done_tiles():
+            with open(self.tile_path(key), encoding="utf-8") as f:
+                for element in json.load(f):
+                    merged.setdefault((element["type"], element["id"]), element)
+        return list(merged.values())
+
+
+# ---------- ГЕОМЕТРИЯ И СЛОИ ----------
+
+def _line(points):
+    return [(p["lon"], p["lat"]) for p in points if p]
+
+
+def element_geometry(element):
+    """Геометрия элемента из ответа "out geom" (None, если не строится)"""
+    kind = element["type"]
+    if kind == "node":
+        return Point(element["lon"], element["lat"])
+    if kind == "way":
+        coords = _line(element.get("geometry", []))
+        if len(coords) >= 4 and coords[0] == coords[-1]:
+            return Polygon(coords)
+        return LineString(coords) if len(coords) >= 2 else None
+    # Отношение-мультиполигон: кольца собираются из линий outer/inner
+    rings = {"outer": [], "inner": []}
+    for member in element.get("members", []):
+        coords = _line(member.get("geometry", []))
+        if member.get("type") == "way" and len(coords) >= 2:
+            rings["inner" if member.get("role") == "inner" else "outer"].append(coords)
+    if not rings["outer"]:
+        return None
+
+    def polygons(lines):
+        merged = shapely.line_merge(shapely.multilinestrings(lines))
+        return shapely.union_all(shapely.get_parts(shapely.polygonize(shapely.get_parts(merged))))
+
+    shape = polygons(rings["outer"])
+    if rings["inner"]:
+        shape = shape.difference(polygons(rings["inner"]))
+    return None if shape.is_empty else shape
+
+
+def element_road(element):
+    """(osmid, теги, id узлов, координаты) дороги для ways_to_edges или None"""
+    tags = element.get("tags", {})
+    if element["type"] != "way" or not is_drive_road(tags):
+        return None
+    nodes, points = element.get("nodes", []), element.get("geometry", [])
+    if len(nodes) < 2 or len(nodes) != len(points) or not all(points):
+        return None
+    return (element["id"], {t: tags[t] for t in ROAD_TAGS if t in tags},
+            nodes, _line(points))
+
+
+def element_layers(element, layers=LAYERS):
+    """Слои элемента, включая roads для автомобильных дорог"""
+    tags = element.get("tags", {})
+    names = layers_for(tags, layers)
+    if element["type"] == "way" and is_drive_road(tags):
+        names.append("roads")
+    return names
+
+
+def elements_to_layers(elements, layers=LAYERS, roads=True):
+    """
+    {слой: GeoDataFrame} в EPSG:4326: колонки element_type, osmid, теги
+    (как у osmnx features_*). Объект попадает во все слои, чьи теги у него есть.
+    roads — еще слой roads: ребра автомобильных дорог (ways_to_edges).
+    """
+    rows = {name: [] for name in layers}
+    road_ways = []
+    for element in elements:
+        tags = element.get("tags", {})
+        road = element_road(element) if roads else None
+        if road is not None:
+            road_ways.append(road)
+        matched = layers_for(tags, layers)
+        if not matched:
+            continue
+        geometry = element_geometry(element)
+        if geometry is None:
+            continue
+        row = {"element_type": element["type"], "osmid": element["id"], **tags,
+               "geometry": geometry}
+        for name in matched:
+            rows[name].append(row)
+    out = {}
+    for name, layer_rows in rows.items():
+        frame = pd.DataFrame(layer_rows, columns=None if layer_rows else
+                             ["element_type", "osmid", "geometry"])
+        out[name] = gpd.GeoDataFrame(frame, geometry="geometry", crs="EPSG:4326")
+    # Здания — только площадные объекты (как фильтруют потребители слоя)
+    if "buildings" in out:
+        bld = out["buildings"]
+        out["buildings"] = bld[bld.geom_type.isin(["Polygon", "MultiPolygon"])].reset_index(drop=True)
+    if roads:
+        out["roads"] = ways_to_edges(road_ways)
+    return out
+
+
+def download_layers(bbox, out_dir, tiles_dir=None, polygon=None, **kwargs):
+    """
+    Тайловая загрузка bbox (west, south, east, north) и запись слоев
+    в out_dir под именами extract_osm.py. Остаются объекты, пересекающие
+    polygon (EPSG:4326, граница места) или сам bbox. Возвращает {слой: путь}.
+    Если часть тайлов не скачалась — RuntimeError (повторный запуск докачает).
+    """
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    downloader = TileDownloader(tiles_dir or out / "tiles", bbox, **kwargs)
+    failed = downloader.run()
+    if failed:
+        raise RuntimeError(f"Не скачано тайлов: {len(failed)} ({', '.join(sorted(failed)[:5])}...). "
+                           f"Повторите запуск — готовые тайлы не перекачиваются")
+    elements = downloader.elements()
+    logger.info(f"Собрано {len(elements)} уникальных объектов из "
+                f"{len(downloader.done_tiles())} тайлов")
+    if downloader.cache is not None:
+        logger.info(downloader.cache.summary())
+    # Тайлы сетки выходят за bbox: лишнее отрезаем
+    area = polygon if polygon is not None else shapely.box(*bbox)
+    paths = {}
+    for name, gdf in elements_to_layers(elements, downloader.layers, downloader.roads).items():
+        gdf = gdf[gdf.intersects(area)].reset_index(drop=True)
+        path = out / LAYER_FILES.get(name, f"{name}_osm.geojson")
+        logger.info(f"Сохраняем {path}: {len(gdf)} объектов")
+        gdf.to_file(path, driver="GeoJSON")
+        paths[name] = path
+    return paths
+
+
+@click.command()
+@click.option("--north", type=float, required=True)
+@click.option("--south", type=float, required=True)
+@click.option("--east", type=float, required=True)
+@click.option("--west", type=float, required=True)
+@click.option("--out-dir", default="data/osm", help="Выходная папка")
+@click.option("--tiles-dir", default=None, help="Папка тайлов и manifest.json (по умолчанию <out-dir>/tiles)")
+@click.option("--mirror", "mirrors", multiple=True, help="URL зеркала Overpass (можно несколько)")
+@click.option("--workers", type=int, default=4, help="Одновременных запросов")
+@click.option("--tile-size", type=float, default=TILE_SIZE, help="Сторона корневого тайла, градусы")
+@click.option("--timeout", type=int, default=QUERY_TIMEOUT, help="Таймаут запроса тайла, секунды")
+@click.option("--cache-dir", default="data/cache/overpass", help="Кэш ответов Overpass по тайлам")
+@click.option("--cache-max-mb", type=float, default=1024, help="Предел размера кэша, МБ")
+@click.option("--no-cache", is_flag=True, help="Не читать и не писать кэш")
+def main(north, south, east, west, out_dir, tiles_dir, mirrors, workers, tile_size, timeout,
+         cache_dir, cache_max_mb, no_cache):
+    logging.basicConfig(level=logging.INFO)
+    cache = None if no_cache else OverpassCache(cache_dir, max_mb=cache_max_mb)
+    try:
+        download_layers((west, south, east, north), out_dir, tiles_dir=tiles_dir,
+                        mirrors=mirrors or DEFAULT_MIRRORS, workers=workers,
+                        tile_size=tile_size, timeout=timeout, cache=cache)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+point_store.py
+Загрузка точек населения из XLSX вместо pd.read_excel в каждом скрипте.
+    - книга читается потоком (openpyxl read_only, values_only) порциями
+      по chunk_rows строк, берутся только нужные колонки;
+    - координаты приводятся к числам и превращаются в точки одним
+      векторным вызовом points_from_xy, без списка Point по строкам;
+    - таблица один раз пишется в колоночное хранилище (.npz: массив на
+      колонку) в data/cache/points; следующие запуски читают его за
+      миллисекунды.
+Запись хранилища действительна, пока у XLSX те же размер и mtime; если
+они поменялись, а sha256 содержимого тот же (файл скопировали), запись
+тоже используется, иначе таблица перечитывается из книги.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+
+from feature_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "data/cache/points"
+CHUNK_ROWS = 50000
+# Меняется при изменении формата хранилища: старые записи перестают совпадать
+STORE_VERSION = 1
+META_KEY = "__meta__"
+
+
+def iter_xlsx_chunks(path, columns=None, chunk_rows=CHUNK_ROWS, sheet=None):
+    """
+    Порции листа sheet (по умолчанию первого) книги path как DataFrame по
+    chunk_rows строк. Первая строка — заголовок; columns — только эти колонки.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = workbook[sheet] if sheet else workbook.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = [str(name) if name is not None else f"column_{i}"
+                  for i, name in enumerate(next(rows, ()))]
+        if columns is None:
+            columns = header
+        missing = [c for c in columns if c not in header]
+        if missing:
+            raise KeyError(f"В {path} нет колонок {missing} (есть {header})")
+        positions = [header.index(c) for c in columns]
+
+        chunk = []
+        yielded = False
+        for row in rows:
+            if not any(v is not None for v in row):
+                continue
+            chunk.append([row[i] if i < len(row) else None for i in positions])
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=columns)
+                yielded = True
+                chunk = []
+        if chunk or not yielded:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+
+def coerce(frame, dtypes):
+    """Приводит колонки к dtypes; нечисловые значения в числовых колонках -> NaN"""
+    for column, dtype in (dtypes or {}).items():
+        if column not in frame.columns:
+            continue
+        dtype = pd.api.types.pandas_dtype(dtype)
+        if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+            frame[column] = pd.to_numeric(frame[column], errors="coerce").astype(dtype)
+        else:
+            frame[column] = frame[column].astype(dtype)
+    return frame
+
+
+def read_xlsx(path, columns=None, dtypes=None, chunk_rows=CHUNK_ROWS, sheet=None):
+    """Вся таблица из книги: порции приводятся к dtypes по мере чтения"""
+    chunks = [coerce(chunk, dtypes) for chunk in iter_xlsx_chunks(path, columns, chunk_rows, sheet)]
+    return pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
+
+
+def to_points(frame, lon, lat, crs="EPSG:4326"):
+    """GeoDataFrame с точками из числовых колонок lon/lat (пустая геометрия, где их нет)"""
+    x = pd.to_numeric(frame[lon], errors="coerce").to_numpy(dtype=float)
+    y = pd.to_numeric(frame[lat], errors="coerce").to_numpy(dtype=float)
+    geometry = gpd.points_from_xy(x, y, crs=crs)
+    geometry[np.isnan(x) | np.isnan(y)] = None
+    return gpd.GeoDataFrame(frame, geometry=geometry, crs=crs)
+
+
+# ---------- колоночное хранилище ----------
+
+def save_store(frame, path, meta=None):
+    """
+    Пишет таблицу в .npz: по массиву на колонку (+ маска пропусков для
+    строковых и nullable-колонок); имена и типы колонок — в meta.
+    """
+    arrays = {}
+    columns = []
+    for i, column in enumerate(frame.columns):
+        series = frame[column]
+        spec = {"name": str(column), "dtype": str(series.dtype)}
+        if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) and \
+                pd.api.types.is_numeric_dtype(series.dtype):
+            spec["kind"] = "nullable"
+            arrays[f"m{i}"] = series.isna().to_numpy()
+            arrays[f"c{i}"] = series.to_numpy(dtype=series.dtype.numpy_dtype, na_value=0)
+        elif pd.api.types.is_numeric_dtype(series.dtype) or \
+                pd.api.types.is_datetime64_dtype(series.dtype):
+            spec["kind"] = "plain"
+            arrays[f"c{i}"] = series.to_numpy()
+        else:
+            # Строки и смешанные значения хранятся строками с маской None/NaN
+            spec["kind"] = "str"
+            mask = series.isna().to_numpy()
+            arrays[f"m{i}"] = mask
+            arrays[f"c{i}"] = np.where(mask, "", series.astype(str).to_numpy()).astype(str)
+        columns.append(spec)
+    arrays[META_KEY] = np.array(json.dumps({**(meta or {}), "columns": columns}, ensure_ascii=False))
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.stem + ".tmp.npz")
+    np.savez(tmp, **arrays)
+    os.replace(tmp, path)
+
+
+def read_meta(path):
+    """meta записи хранилища без чтения колонок"""
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data[META_KEY]))
+
+
+def load_store(path):
+    """Таблица из .npz, записанного save_store"""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data[META_KEY]))
+        columns = {}
+        for i, spec in enumerate(meta["columns"]):
+            values = data[f"c{i}"]
+            if spec["kind"] == "nullable":
+                values = pd.array(values, dtype=spec["dtype"])
+                values[data[f"m{i}"]] = pd.NA
+            elif spec["kind"] == "str":
+                values = values.astype(object)
+                values[data[f"m{i}"]] = None
+            columns[spec["name"]] = values
+    return pd.DataFrame(columns)
+
+
+# ---------- кэш таблиц XLSX ----------
+
+def store_path(path, params, cache_dir=DEFAULT_CACHE_DIR):
+    """Запись хранилища для книги path и параметров чтения params"""
+    payload = json.dumps({"version": STORE_VERSION, **params}, sort_keys=True, ensure_ascii=False)
+    tag = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return Path(cache_dir) / f"{Path(path).stem}-{tag}.npz"
+
+
+def _valid(store, source):
+    """Запись совпадает с книгой: те же размер и mtime или тот же sha256"""
+    if not store.exists():
+        return False
+    try:
+        meta = read_meta(store)["source"]
+    except Exception as e:
+        logger.warning(f"Поврежденная запись хранилища точек {store.name}: {e}")
+        return False
+    stat = source.stat()
+    if meta["size"] == stat.st_size and meta["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    return meta["size"] == stat.st_size and meta["sha256"] == file_digest(source)
+
+
+def load_table(path, columns=None, dtypes=None, cache_dir=DEFAULT_CACHE_DIR,
+               refresh=False, chunk_rows=CHUNK_ROWS, sheet=None):
+    """
+    Таблица книги path из хранилища; при первом чтении (или если книга
+    поменялась, или refresh) — потоковое чтение XLSX и запись хранилища.
+    cache_dir=None — без хранилища.
+    """
+    source = Path(path)
+    if cache_dir is None:
+        return read_xlsx(source, columns, dtypes, chunk_rows, sheet)
+    params = {"columns": columns, "sheet": sheet,
+              "dtypes": {k: str(pd.api.types.pandas_dtype(v)) for k, v in (dtypes or {}).items()}}
+    store = store_path(source, params, cache_dir)
+    if not refresh and _valid(store, source):
+        logger.debug(f"{source.name}: таблица из хранилища {store}")
+        return load_store(store)
+
+    logger.info(f"Читаем {source} порциями по {chunk_rows} строк")
+    frame = read_xlsx(source, columns, dtypes, chunk_rows, sheet)
+    stat = source.stat()
+    save_store(frame, store, {"source": {"path": str(source), "size": stat.st_size,
+                                         "mtime_ns": stat.st_mtime_ns,
+                                         "sha256": file_digest(source)},
+                              "params": params})
+    logger.info(f"{source.name}: {len(frame)} строк сохранено в {store}")
+    return frame
+
+
+def load_points(path, lon, lat, columns=None, dtypes=None, crs="EPSG:4326",
+                cache_dir=DEFAULT_CACHE_DIR, refresh=False, chunk_rows=CHUNK_ROWS, sheet=None):
+    """
+    Точки из книги path: колонки координат lon/lat приводятся к float64
+    (в книгах они бывают строками) и хранятся уже числами.
+    """
+    dtypes = {lon: "float64", lat: "float64", **(dtypes or {})}
+    frame = load_table(path, columns, dtypes, cache_dir, refresh, chunk_rows, sheet)
+    return to_points(frame, lon, lat, crs)
@@ -13,6 +13,8 @@ import pandas as pd
 import joblib
 import numpy as np
 
+from featurize_fixed import compute_features, model_type_encoder
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -21,14 +23,19 @@ logger = logging.getLogger(__name__)
 @click.option("--bld-features-geojson", default="data/features/building_features.geojson")
 @click.option("--model-joblib", default="models/rf_pop_model.joblib")
 @click.option("--out-geojson", default="data/predictions/buildings_with_pred_pop.geojson")
-def main(bld_features_geojson, model_joblib, out_geojson):
+@click.option("--buildings", default=None,
+              help="Слой зданий OSM: считать фичи на лету, только нужные модели")
+@click.option("--pois", default="data/osm/pois_osm.geojson")
+@click.option("--roads", default="data/osm/roads_edges.geojson")
+def main(bld_features_geojson, model_joblib, out_geojson, buildings, pois, roads):
     print("=" * 60)
     print("ПРЕДСКАЗАНИЕ НАСЕЛЕНИЯ ПО ЗДАНИЯМ")
     print("=" * 60)
 
     # 1. Проверяем файлы
-    if not Path(bld_features_geojson).exists():
-        print(f"❌ Файл с фичами не найден: {bld_features_geojson}")
+    source = buildings or bld_features_geojson
+    if not Path(source).exists():
+        print(f"❌ Файл не найден: {source}")
         return
 
     if not Path(model_joblib).exists():
@@ -36,14 +43,8 @@ def main(bld_features_geojson, model_joblib, out_geojson):
         print("   Сначала обучите модель: python train_fixed.py")
         return
 
-    # 2. Загружаем данные
-    print("\n1. Загрузка данных...")
-    bld = gpd.read_file(bld_features_geojson)
-    print(f"   Зданий: {len(bld)}")
-    print(f"   Колонок: {len(bld.columns)}")
-
-    # 3. Загружаем модель
-    print("\n2. Загрузка модели...")
+    # 2. Загружаем модель
+    print("\n1. Загрузка модели...")
     try:
         model_data = joblib.load(model_joblib)
         model = model_data["model"]
@@ -61,14 +62,28 @@ def main(bld_features_geojson, model_joblib, out_geojson):
         print(f"❌ Ошибка загрузки модели: {e}")
         return
 
+    # 3. Загружаем данные
+    print("\n2. Загрузка данных...")
+    if buildings:
+        # Считаем только группы фич, которые нужны модели
+        bld = compute_features(gpd.read_file(buildings), pois, roads,
+                               required=feat_cols,
+                               type_encoder=model_type_encoder(model_data))
+        print(f"   Фичи посчитаны из {buildings}")
+    else:
+        bld = gpd.read_file(bld_features_geojson)
+    print(f"   Зданий: {len(bld)}")
+    print(f"   Колонок: {len(bld.columns)}")
+
     # 4. Подготавливаем признаки для предсказания
     print("\n3. Подготовка признаков...")
 
-    # Проверяем, что все нужные признаки есть в данных
+    # Колонки типов задает кодировщик модели, поэтому они всегда совпадают;
+    # отсутствовать могут только фичи, посчитанные без нужной группы
     missing_features = [f for f in feat_cols if f not in bld.columns]
     if missing_features:
         print(f"⚠️  Отсутствуют признаки: {missing_features[:5]}...")
-        print("   Заполняем нулями...")
+        print("   Пересчитайте фичи с --model-joblib; пока заполняем нулями...")
         for feat in missing_features:
             bld[feat] = 0
 
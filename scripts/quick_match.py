@@ -1,15 +1,18 @@
 import geopandas as gpd
-from shapely.geometry import Point
 import pandas as pd
 import argparse
 import os
 
+from region_schemas import REGIONS, load_region, region_schema
+
 
 def main():
     parser = argparse.ArgumentParser(
         description='Сопоставление точек с OSM зданиями')
     parser.add_argument(
-        '--points', type=str, default='data/zones/perm_points.geojson', help='Файл с точками населения')
+        '--region', type=str, default='perm', choices=sorted(REGIONS), help='Регион (схема источника точек)')
+    parser.add_argument(
+        '--points', type=str, default=None, help='Другой XLSX с точками той же схемы')
     parser.add_argument(
         '--osm', type=str, default='data/osm_real/buildings.geojson', help='Файл с OSM зданиями')
     parser.add_argument(
@@ -22,7 +25,7 @@ def main():
     print("📥 Загружаем данные...")
 
     # Загружаем точки населения
-    points_gdf = gpd.read_file(args.points)
+    points_gdf = load_region(args.region, source=args.points)
     print(f"✅ Загружено {len(points_gdf)} точек")
 
     # Загружаем OSM здания
@@ -30,8 +33,8 @@ def main():
     print(f"✅ Загружено {len(buildings_gdf)} зданий")
 
     # Переводим в одну проекцию (для точного измерения расстояний)
-    # Используем проекцию, которая сохраняет расстояния
-    crs_utm = 'EPSG:32640'  # UTM зона 40N для Перми
+    # Используем проекцию, которая сохраняет расстояния (UTM зона региона)
+    crs_utm = region_schema(args.region)['metric_crs']
 
     points_utm = points_gdf.to_crs(crs_utm)
     buildings_utm = buildings_gdf.to_crs(crs_utm)
@@ -59,7 +62,7 @@ def main():
             matched_data.append({
                 'point_id': idx,
                 'building_id': closest_idx,
-                'population': point.get('INHAB') or point.get('ЧН_Расчет') or point.get('population', 0),
+                'population': point['population'],
                 'lon': point.geometry.x,
                 'lat': point.geometry.y,
                 'building_area': closest_building.get('area', 0),
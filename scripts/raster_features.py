@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+raster_features.py
+Зональная статистика локальных растров (land cover, DEM, ночные огни) по
+пятнам зданий и их буферам: mean, max и cover — доля пикселей зоны со
+значением > 0. Растр не читается целиком: здания раскладываются по блокам
+растра (по центроиду), и каждое окно «блок + вынос зон за его край»
+читается один раз. Пиксели зоны — центры пикселей окна внутри полигона
+(один запрос к STRtree на окно); зона меньше пикселя берет пиксель
+под центроидом.
+Нужен rasterio (необязательная зависимость).
+"""
+
+import logging
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import shapely
+from shapely import STRtree
+
+logger = logging.getLogger(__name__)
+
+STATS = ("mean", "max", "cover")
+
+
+def raster_name(path):
+    """Имя растра в колонках: имя файла без расширения"""
+    return Path(path).stem.replace(" ", "_").lower()
+
+
+def raster_columns(path, buffer):
+    """Колонки растра: статистики по пятну и (если buffer) по буферу"""
+    name = raster_name(path)
+    columns = [f"rast_{name}_{stat}" for stat in STATS]
+    if buffer:
+        columns += [f"rast_{name}_{stat}_buf{int(buffer)}m" for stat in STATS]
+    return columns
+
+
+def pixel_index(transform, x, y):
+    """(строки, столбцы) пикселей под точками x, y"""
+    col, row = ~transform * (np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    return np.floor(row).astype(np.int64), np.floor(col).astype(np.int64)
+
+
+def zone_statistics(src, zones, valid_fill=np.nan):
+    """
+    mean / max / cover значений растра src (открытый rasterio dataset)
+    в полигонах zones (numpy-массив в CRS растра), читая растр окнами по блокам.
+    Зона без валидных пикселей — NaN.
+    """
+    from rasterio.windows import Window, from_bounds
+
+    n = len(zones)
+    total = np.zeros(n)
+    count = np.zeros(n)
+    positive = np.zeros(n)
+    maximum = np.full(n, -np.inf)
+    if n == 0:
+        return {"mean": total, "max": maximum, "cover": positive}
+
+    # Блок растра, в который попадает центроид каждой зоны
+    block_h, block_w = src.block_shapes[0]
+    cx, cy = shapely.get_coordinates(shapely.centroid(zones)).T
+    rows, cols = pixel_index(src.transform, cx, cy)
+    block = (rows // block_h) * (src.width // block_w + 1) + cols // block_w
+    order = np.argsort(block, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(block[order]) != 0])
+    bounds = shapely.bounds(zones)
+    nodata = src.nodata
+    full = Window(0, 0, src.width, src.height)
+
+    for group in np.split(order, starts[1:]):
+        # Окно: блок, расширенный до рамок всех его зон
+        minx, miny = bounds[group, 0].min(), bounds[group, 1].min()
+        maxx, maxy = bounds[group, 2].max(), bounds[group, 3].max()
+        exact = from_bounds(minx, miny, maxx, maxy, src.transform)
+        col0, row0 = int(np.floor(exact.col_off)), int(np.floor(exact.row_off))
+        col1 = int(np.ceil(exact.col_off + exact.width))
+        row1 = int(np.ceil(exact.row_off + exact.height))
+        try:
+            window = Window(col0, row0, max(col1 - col0, 1),
+                            max(row1 - row0, 1)).intersection(full)
+        except Exception:
+            # Зоны целиком вне растра
+            continue
+        data = src.read(1, window=window, masked=False).astype(float)
+        if nodata is not None:
+            data[data == nodata] = np.nan
+        transform = src.window_transform(window)
+
+        # Центры пикселей окна -> пары (зона, пиксель)
+        r, c = np.mgrid[0:data.shape[0], 0:data.shape[1]]
+        px, py = transform * (c.ravel() + 0.5, r.ravel() + 0.5)
+        pixels = shapely.points(px, py)
+        zone_idx, pixel_idx = STRtree(pixels).query(zones[group], predicate="contains")
+        zone_idx = group[zone_idx]
+        values = data.ravel()[pixel_idx]
+
+        # Зоны без пикселя внутри — пиксель под центроидом
+        empty = np.setdiff1d(group, zone_idx)
+        if len(empty):
+            er, ec = pixel_index(src.transform, cx[empty], cy[empty])
+            er, ec = er - int(window.row_off), ec - int(window.col_off)
+            inside = (er >= 0) & (er < data.shape[0]) & (ec >= 0) & (ec < data.shape[1])
+            zone_idx = np.concatenate([zone_idx, empty[inside]])
+            values = np.concatenate([values, data[er[inside], ec[inside]]])
+
+        valid = ~np.isnan(values)
+        zone_idx, values = zone_idx[valid], values[valid]
+        total += np.bincount(zone_idx, weights=values, minlength=n)
+        count += np.bincount(zone_idx, minlength=n)
+        positive += np.bincount(zone_idx, weights=(values > 0).astype(float), minlength=n)
+        np.maximum.at(maximum, zone_idx, values)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"mean": np.where(count > 0, total / count, valid_fill),
+                "max": np.where(count > 0, maximum, valid_fill),
+                "cover": np.where(count > 0, positive / count, valid_fill)}
+
+
+def raster_zonal_features(geoms, crs, path, buffer=0):
+    """
+    Статистики растра path по пятнам geoms (GeoSeries/массив в crs) и их
+    буферам buffer метров (буфер строится в crs, он должен быть метрическим).
+    Возвращает {колонка: массив} в порядке raster_columns.
+    """
+    import rasterio
+
+    geoms = gpd.GeoSeries(np.asarray(geoms, dtype=object), crs=crs)
+    name = raster_name(path)
+    out = {}
+    with rasterio.open(path) as src:
+        zones = {"": geoms}
+        if buffer:
+            zones[f"_buf{int(buffer)}m"] = geoms.buffer(buffer)
+        for suffix, zone in zones.items():
+            if src.crs is not None:
+                zone = zone.to_crs(src.crs)
+            stats = zone_statistics(src, np.asarray(zone, dtype=object))
+            for stat in STATS:
+                out[f"rast_{name}_{stat}{suffix}"] = stats[stat]
+    logger.info(f"Растр {Path(path).name}: статистики по {len(geoms)} зданиям")
+    return out
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+region_schemas.py
+Схемы источников точек населения по регионам вместо поиска колонки
+населения по ключевым словам в каждом скрипте.
+Схема региона описывает:
+    source     — XLSX с точками;
+    crs        — CRS координат lon/lat, metric_crs — метрическая (UTM) для расстояний;
+    columns    — общее имя колонки -> колонка источника (lon, lat,
+                 population обязательны);
+    dtypes     — узкие типы общих колонок;
+    bounds     — допустимые диапазоны: строка с lon/lat/population вне
+                 диапазона отбрасывается, прочие значения вне диапазона -> NA.
+Читаются только колонки из columns (у Свердловской области остальные
+три десятка полей ЖКХ пропускаются), через хранилище точек point_store.
+Новый регион — новая запись в REGIONS (или register()).
+"""
+
+import logging
+
+import pandas as pd
+
+from point_store import DEFAULT_CACHE_DIR, load_points
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ("lon", "lat", "population")
+
+REGIONS = {
+    "perm": {
+        "source": "data/Пермский край - Население.xlsx",
+        "crs": "EPSG:4326",
+        "metric_crs": "EPSG:32640",
+        "columns": {"lon": "Longitude", "lat": "Latitude",
+                    "population": "ЧН_Расчет", "house_id": "id"},
+        "dtypes": {"lon": "float64", "lat": "float64",
+                   "population": "float32", "house_id": "Int64"},
+        "bounds": {"lon": (51.0, 60.0), "lat": (56.0, 62.0), "population": (0, 20000)},
+    },
+    "sverdlovsk": {
+        "source": "data/Свердловская область - Население.xlsx",
+        "crs": "EPSG:4326",
+        "metric_crs": "EPSG:32641",
+        "columns": {"lon": "LON", "lat": "LAT", "population": "INHAB",
+                    "levels": "LEVELS", "area_live": "AREA_LIVE", "house_id": "HOUSE_ID"},
+        "dtypes": {"lon": "float64", "lat": "float64", "population": "float32",
+                   "levels": "Int16", "area_live": "float32", "house_id": "Int64"},
+        "bounds": {"lon": (57.0, 67.0), "lat": (56.0, 62.5), "population": (0, 20000),
+                   "levels": (1, 100), "area_live": (0, 500000)},
+    },
+}
+
+
+def register(name, schema):
+    """Добавляет (или заменяет) схему региона"""
+    missing = [c for c in REQUIRED_COLUMNS if c not in schema.get("columns", {})]
+    if missing:
+        raise ValueError(f"В схеме региона {name} нет колонок {missing}")
+    REGIONS[name] = schema
+
+
+def region_schema(name):
+    """Схема региона по имени"""
+    if name not in REGIONS:
+        raise KeyError(f"Неизвестный регион {name!r}, есть: {', '.join(REGIONS)}")
+    return REGIONS[name]
+
+
+def apply_bounds(frame, bounds, name=""):
+    """Отбрасывает строки с обязательными колонками вне bounds, прочие значения вне bounds -> NA"""
+    keep = pd.Series(True, index=frame.index)
+    for column in REQUIRED_COLUMNS:
+        keep &= frame[column].notna()
+    for column, (low, high) in bounds.items():
+        if column not in frame.columns:
+            continue
+        inside = frame[column].between(low, high).fillna(False).astype(bool)
+        if column in REQUIRED_COLUMNS:
+            keep &= inside
+        else:
+            outside = frame[column].notna() & ~inside
+            if outside.any():
+                logger.info(f"{name}: {int(outside.sum())} значений {column} вне {low}..{high} -> NA")
+                frame.loc[outside, column] = pd.NA
+    dropped = int((~keep).sum())
+    if dropped:
+        logger.warning(f"{name}: отброшено {dropped} точек без координат/населения или вне допустимых границ")
+    return frame[keep].reset_index(drop=True)
+
+
+def load_region(name, source=None, cache_dir=DEFAULT_CACHE_DIR, refresh=False, validate=True):
+    """
+    Точки населения региона: GeoDataFrame с общими именами колонок
+    (lon, lat, population, ...) в CRS схемы. source — другой XLSX той же схемы.
+    """
+    schema = region_schema(name)
+    columns = schema["columns"]
+    dtypes = {columns[k]: v for k, v in schema.get("dtypes", {}).items() if k in columns}
+    points = load_points(source or schema["source"], lon=columns["lon"], lat=columns["lat"],
+                         columns=list(columns.values()), dtypes=dtypes,
+                         crs=schema.get("crs", "EPSG:4326"), cache_dir=cache_dir, refresh=refresh)
+    points = points.rename(columns={v: k for k, v in columns.items()})
+    if validate:
+        points = apply_bounds(points, schema.get("bounds", {}), name)
+    logger.info(f"{name}: {len(points)} точек, население {points['population'].sum():,.0f}")
+    return points
@@ -5,14 +5,16 @@ import geopandas as gpd
 from pathlib import Path
 import time
 
+from overpass_mirrors import MirrorPool, api_url
+
 print("=" * 60)
 print("Надежный загрузчик OSM с альтернативными серверами")
 print("=" * 60)
 
-# 1. ПЕРЕКЛЮЧАЕМСЯ НА АЛЬТЕРНАТИВНЫЙ СЕРВЕР
-ox.settings.overpass_url = "https://overpass.kumi.systems/api/interpreter"
-# или другой вариант:
-# ox.settings.overpass_url = "https://overpass.nchc.org.tw/api/interpreter"
+# 1. ВЫБИРАЕМ САМОЕ БЫСТРОЕ ДОСТУПНОЕ ЗЕРКАЛО (опрос /api/status)
+mirrors = MirrorPool()
+ox.settings.overpass_url = mirrors.best()
+print(f"Зеркало: {ox.settings.overpass_url}")
 
 # 2. УВЕЛИЧИВАЕМ ТАЙМАУТЫ
 ox.settings.timeout = 300  # 5 минут
@@ -57,8 +59,9 @@ try:
 except Exception as e:
     print(f"❌ ОШИБКА с альтернативным сервером: {type(e).__name__}")
     print(f"   {e}")
-    print("\n   Пробуем вернуться к основному серверу...")
-    ox.settings.overpass_url = "https://overpass-api.de/api/interpreter"
+    print("\n   Пробуем следующее по скорости зеркало...")
+    ranked = [api_url(m.url) for m in mirrors.ranked() if api_url(m.url) != ox.settings.overpass_url]
+    ox.settings.overpass_url = ranked[0] if ranked else ox.settings.overpass_url
 
     try:
         buildings = ox.features_from_bbox(
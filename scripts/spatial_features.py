@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+spatial_features.py
+Массовые пространственные фичи на пространственном индексе (shapely STRtree).
+Все функции ожидают геометрии в метрической проекции и возвращают
+numpy-массивы в порядке входных зданий.
+"""
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from shapely import STRtree
+
+# Разрешение буферов как у GeoSeries.buffer по умолчанию
+QUAD_SEGS = 16
+
+
+def as_geometry_array(geoms):
+    """GeoSeries / список / массив геометрий -> numpy-массив shapely объектов"""
+    return np.asarray(geoms, dtype=object)
+
+
+def as_tree(targets):
+    """Строит STRtree по целевым геометриям (или возвращает готовое дерево)"""
+    if isinstance(targets, STRtree):
+        return targets
+    return STRtree(as_geometry_array(targets))
+
+
+def pairs_within(points, targets, distance):
+    """
+    Все пары (здание, объект) на расстоянии не больше distance.
+    Один запрос к индексу на все здания: O(N log M + K).
+    Возвращает (src, dst, dist) — индексы зданий, индексы объектов и расстояния.
+    """
+    points = as_geometry_array(points)
+    tree = as_tree(targets)
+    if len(points) == 0 or len(tree) == 0:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, np.array([], dtype=float)
+
+    src, dst = tree.query(points, predicate="dwithin", distance=distance)
+    dist = shapely.distance(points[src], tree.geometries[dst])
+    return src, dst, dist
+
+
+def point_pairs_within(src_xy, dst, distance):
+    """
+    Все пары точек на расстоянии не больше distance через KD-дерево (scipy).
+    Для точка-точка в разы быстрее STRtree. dst — координаты или готовое
+    cKDTree. Пары упорядочены по (src, dst), чтобы суммы по зданиям не
+    зависели от того, каким куском считались здания. Возвращает (src, dst, dist).
+    """
+    src_xy = np.asarray(src_xy, dtype=float).reshape(-1, 2)
+    if not isinstance(dst, cKDTree):
+        dst = cKDTree(np.asarray(dst, dtype=float).reshape(-1, 2))
+    if len(src_xy) == 0 or dst.n == 0:
+        empty = np.array([], dtype=np.intp)
+        return empty, empty, np.array([], dtype=float)
+
+    pairs = cKDTree(src_xy).sparse_distance_matrix(
+        dst, distance, output_type="ndarray")
+    order = np.lexsort((pairs["j"], pairs["i"]))
+    pairs = pairs[order]
+    return pairs["i"].astype(np.intp), pairs["j"].astype(np.intp), pairs["v"]
+
+
+def within_buffer(points, targets, src, dst, dist, r, quad_segs=QUAD_SEGS):
+    """
+    Маска пар, для которых объект пересекает buffer(r) вокруг геометрии здания.
+    Буфер — вписанный в окружность многоугольник, поэтому пары ближе его
+    вписанного радиуса принимаются сразу, а полосу у границы проверяем
+    настоящим буфером — результат совпадает с geom.buffer(r).intersects(obj).
+    """
+    points = as_geometry_array(points)
+    tree = as_tree(targets)
+    inner = r * np.cos(np.pi / (4 * quad_segs))
+    mask = dist <= inner
+    band = np.flatnonzero((dist > inner) & (dist <= r))
+    if len(band):
+        bufs = shapely.buffer(points[src[band]], r, quad_segs=quad_segs)
+        mask[band] = shapely.intersects(bufs, tree.geometries[dst[band]])
+    return mask
+
+
+def count_within_radii(points, targets, radii, quad_segs=QUAD_SEGS):
+    """
+    Число объектов targets в буфере радиуса r вокруг каждой точки для всех r.
+    Индекс опрашивается один раз на максимальном радиусе, затем пары
+    раскладываются по радиусам. Возвращает {r: np.ndarray[int]}.
+    """
+    points = as_geometry_array(points)
+    tree = as_tree(targets)
+    radii = sorted(set(radii))
+    counts = {r: np.zeros(len(points), dtype=np.int64) for r in radii}
+    if not radii:
+        return counts
+
+    src, dst, dist = pairs_within(points, tree, max(radii))
+    for r in radii:
+        mask = within_buffer(points, tree, src, dst, dist, r, quad_segs)
+        counts[r] = np.bincount(src[mask], minlength=len(points))
+    return counts
+
+
+def category_counts_within_radii(points, targets, radii, codes, n_codes,
+                                 quad_segs=QUAD_SEGS):
+    """
+    Число объектов в буфере радиуса r — всего и по категориям — за один
+    проход по парам. codes — номер категории каждого объекта (-1 — вне
+    списка). Пары радиуса r образуют разреженную матрицу здание × объект,
+    ее произведение на one-hot матрицу объект × категория дает счетчики
+    сразу по всем категориям.
+    Возвращает ({r: np.ndarray[int]}, {r: np.ndarray[int] формы (здания, n_codes)}).
+    """
+    points = as_geometry_array(points)
+    tree = as_tree(targets)
+    radii = sorted(set(radii))
+    codes = np.asarray(codes, dtype=np.int64)
+    totals, by_category = {}, {}
+    known = np.flatnonzero(codes >= 0)
+    onehot = csr_matrix((np.ones(len(known), dtype=np.int64), (known, codes[known])),
+                        shape=(len(tree), n_codes))
+
+    src, dst, dist = pairs_within(points, tree, max(radii)) if radii else ([], [], [])
+    for r in radii:
+        mask = within_buffer(points, tree, src, dst, dist, r, quad_segs)
+        incidence = csr_matrix((np.ones(int(mask.sum()), dtype=np.int64),
+                                (src[mask], dst[mask])), shape=(len(points), len(tree)))
+        totals[r] = np.asarray(incidence.sum(axis=1)).ravel()
+        by_category[r] = (incidence @ onehot).toarray()
+    return totals, by_category
+
+
+def clipped_length_within_radii(points, lines, radii, quad_segs=QUAD_SEGS):
+    """
+    Суммарная длина линий (дорог) внутри буфера радиуса r вокруг каждой точки.
+    Кандидатные пары берутся из индекса одним запросом, отрезки обрезаются
+    буфером векторизованным shapely.intersection, длины суммируются по зданиям.
+    Возвращает {r: np.ndarray[float]}.
+    """
+    points = as_geometry_array(points)
+    tree = as_tree(lines)
+    radii = sorted(set(radii))
+    lengths = {r: np.zeros(len(points), dtype=float) for r in radii}
+    if not radii:
+        return lengths
+
+    src, dst, dist = pairs_within(points, tree, max(radii))
+    for r in radii:
+        mask = dist <= r
+        if not mask.any():
+            continue
+        # Один буфер на здание, а не на пару
+        owners, inverse = np.unique(src[mask], return_inverse=True)
+        bufs = shapely.buffer(points[owners], r, quad_segs=quad_segs)
+        clipped = shapely.intersection(tree.geometries[dst[mask]], bufs[inverse])
+        lengths[r] = np.bincount(src[mask], weights=shapely.length(clipped),
+                                 minlength=len(points))
+    return lengths
+
+
+def building_density(geoms, targets, radii, mode="centroid", target_areas=None,
+                     quad_segs=QUAD_SEGS):
+    """
+    Плотность застройки вокруг зданий geoms (зданий на гектар) для всех r.
+
+    mode="centroid" — соседи считаются по центроидам в круге радиуса r
+    через KD-дерево, площадь зоны pi*r^2 (самый быстрый вариант);
+    mode="exact" — сосед засчитывается, если его полигон пересекает
+    buffer(r) полигона здания, площадь зоны — площадь этого буфера
+    (то же, что прежний цикл bld_proj.intersects(geom.buffer(r))).
+
+    targets — все здания-соседи (None — сами geoms; можно передать готовое
+    cKDTree центроидов или STRtree полигонов), target_areas — их площади;
+    если заданы, дополнительно считается доля застроенной площади
+    (built-up ratio). Возвращает (density, builtup) — словари {r: массив},
+    builtup пустой без target_areas.
+    """
+    geoms = as_geometry_array(geoms)
+    targets = geoms if targets is None else targets
+    radii = sorted(set(radii))
+    density, builtup = {}, {}
+    if not radii:
+        return density, builtup
+
+    if mode == "centroid":
+        if isinstance(targets, STRtree):
+            targets = targets.geometries
+        if not isinstance(targets, cKDTree):
+            targets = shapely.get_coordinates(
+                shapely.centroid(as_geometry_array(targets)))
+        src, dst, dist = point_pairs_within(
+            shapely.get_coordinates(shapely.centroid(geoms)), targets, max(radii))
+    elif mode == "exact":
+        tree = as_tree(targets)
+        src, dst, dist = pairs_within(geoms, tree, max(radii))
+    else:
+        raise ValueError(f"Неизвестный режим плотности: {mode}")
+
+    for r in radii:
+        if mode == "centroid":
+            mask = dist <= r
+            zone_ha = np.full(len(geoms), np.pi * r * r / 10000.0)
+        else:
+            mask = within_buffer(geoms, tree, src, dst, dist, r, quad_segs)
+            zone_ha = shapely.area(
+                shapely.buffer(geoms, r, quad_segs=quad_segs)) / 10000.0
+
+        counts = np.bincount(src[mask], minlength=len(geoms))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            density[r] = np.where(zone_ha > 0, counts / zone_ha, 0.0)
+            if target_areas is not None:
+                covered = np.bincount(
+                    src[mask], weights=np.asarray(target_areas, dtype=float)[dst[mask]],
+                    minlength=len(geoms))
+                builtup[r] = np.where(zone_ha > 0, covered / (zone_ha * 10000.0), 0.0)
+    return density, builtup
+
+
+def nearest_distance(points, targets, max_distance):
+    """
+    Расстояние от каждой точки до ближайшего объекта targets (не дальше
+    max_distance, иначе max_distance). targets — геометрии, STRtree или
+    cKDTree по точкам; у точек запрос идет через KD-дерево.
+    """
+    points = as_geometry_array(points)
+    out = np.full(len(points), float(max_distance))
+    if isinstance(targets, cKDTree):
+        if len(points) and targets.n:
+            dist, _ = targets.query(shapely.get_coordinates(points),
+                                    distance_upper_bound=max_distance)
+            out = np.minimum(dist, max_distance)
+        return out
+    tree = as_tree(targets)
+    if len(points) and len(tree):
+        (src, _), dist = tree.query_nearest(points, max_distance=max_distance,
+                                            return_distance=True, all_matches=False)
+        out[src] = dist
+    return out
+
+
+def nearest_by_code(points, targets, codes, n_codes, max_distance):
+    """
+    Расстояние до ближайшего объекта каждой категории: по KD-дереву на
+    категорию, один пакетный запрос на дерево. targets — точки или cKDTree
+    по ним; codes — категория каждого объекта (-1 — вне списка).
+    Возвращает массив формы (точки, n_codes).
+    """
+    xy = shapely.get_coordinates(as_geometry_array(points))
+    target_xy = targets.data if isinstance(targets, cKDTree) else \
+        shapely.get_coordinates(shapely.centroid(as_geometry_array(targets)))
+    codes = np.asarray(codes)
+    out = np.full((len(xy), n_codes), float(max_distance))
+    for k in range(n_codes):
+        mask = codes == k
+        if mask.any() and len(xy):
+            dist, _ = cKDTree(target_xy[mask]).query(xy, distance_upper_bound=max_distance)
+            out[:, k] = np.minimum(dist, max_distance)
+    return out
+
+
+def poi_category(pois):
+    """
+    Категория POI из тегов OSM: значение amenity (school, pharmacy, ...),
+    иначе "shop" для магазинов, иначе значение leisure; без тегов — "other"
+    """
+    category = pd.Series("other", index=pois.index, dtype=object)
+    for tag in ("leisure", "shop", "amenity"):
+        if tag in pois.columns:
+            values = pois[tag]
+            if tag == "shop":
+                values = values.where(values.isna(), "shop")
+            category = values.where(values.notna(), category)
+    return category.astype(str).to_numpy()
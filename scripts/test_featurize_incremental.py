@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверки featurize_incremental.py: сопоставление изменений по (тип, id) и
+совпадение инкрементального обновления с полным пересчетом
+(pytest scripts/test_featurize_incremental.py)
+"""
+
+import json
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+from shapely.geometry import LineString, Point, box
+
+import featurize_fixed
+import featurize_incremental
+from featurize_incremental import load_changes, match_ids, object_keys
+
+
+def layer():
+    return gpd.GeoDataFrame({"element_type": ["way", "relation", "node"], "osmid": [5, 5, 7]},
+                            geometry=[Point(0, 0), Point(1, 1), Point(2, 2)], crs="EPSG:4326")
+
+
+def test_typed_changes_do_not_collide_across_element_types(tmp_path):
+    path = tmp_path / "changes.json"
+    path.write_text(json.dumps({"buildings": {"modified": [["relation", 5]], "removed": [7]}}))
+    changes = load_changes(path)["buildings"]
+    assert match_ids(layer(), changes["modified"]).tolist() == [False, True, False]
+    # Голый id совпадает с объектом любого типа
+    assert match_ids(layer(), changes["removed"]).tolist() == [False, False, True]
+
+
+def test_typed_changes_match_layers_without_type_column():
+    roads = gpd.GeoDataFrame({"osmid": [[5, 6], 8]}, geometry=[Point(0, 0), Point(1, 1)])
+    assert match_ids(roads, ["way/6"]).tolist() == [True, False]
+
+
+def test_object_keys_are_unique_per_type():
+    assert object_keys(layer()).tolist() == ["way/5", "relation/5", "node/7"]
+    assert object_keys(layer(), typed=False).tolist() == ["5", "5", "7"]
+
+
+# ---------- сквозная проверка: save_features -> featurize_incremental ----------
+
+def write_layers(root, grow=False, new_poi=False):
+    """
+    Два квартала в ~6 км друг от друга (дальше любого радиуса фич):
+    A (lon 56.20) — здесь изменения, B (lon 56.30) — без изменений
+    """
+    root.mkdir(exist_ok=True)
+    rows, geoms = [], []
+    for block, x0 in (("A", 56.20), ("B", 56.30)):
+        for i in range(6):
+            x, y = x0 + (i % 3) * 0.0007, 58.01 + (i // 3) * 0.0004
+            size = 0.0004 if grow and block == "A" and i == 0 else 0.0002
+            osmid = (1 if block == "A" else 100) + i
+            rows.append({"element_type": "way", "osmid": osmid,
+                         "building": "apartments" if i % 2 else "house"})
+            geoms.append(box(x, y, x + size, y + size * 0.6))
+    # Отношение с тем же id, что у линии 100 квартала B
+    rows.append({"element_type": "relation", "osmid": 100, "building": "house"})
+    geoms.append(box(56.3025, 58.0110, 56.3028, 58.0112))
+    gpd.GeoDataFrame(rows, geometry=geoms, crs="EPSG:4326").to_file(root / "buildings.geojson")
+
+    pois = [{"element_type": "node", "osmid": 500 + i, "amenity": "school"} for i in range(2)]
+    poi_geoms = [Point(56.2012, 58.0105), Point(56.3012, 58.0105)]
+    if new_poi:
+        pois.append({"element_type": "node", "osmid": 900, "amenity": "shop"})
+        poi_geoms.append(Point(56.2003, 58.0098))
+    gpd.GeoDataFrame(pois, geometry=poi_geoms, crs="EPSG:4326").to_file(root / "pois.geojson")
+
+    roads = gpd.GeoDataFrame(
+        {"u": [1, 3], "v": [2, 4], "key": [0, 0], "osmid": [700, 701], "highway": ["residential"] * 2},
+        geometry=[LineString([(56.199, 58.0099), (56.203, 58.0099)]),
+                  LineString([(56.299, 58.0099), (56.303, 58.0099)])], crs="EPSG:4326")
+    roads.to_file(root / "roads.geojson")
+    return root
+
+
+def write_raster(path):
+    """Растр только над кварталом A: у зданий B статистики — NaN (нет пикселей)"""
+    rasterio = pytest.importorskip("rasterio")
+    from rasterio.transform import from_origin
+
+    data = np.arange(40 * 40, dtype="float32").reshape(40, 40)
+    with rasterio.open(path, "w", driver="GTiff", height=40, width=40, count=1, dtype="float32",
+                       crs="EPSG:4326", nodata=-9999.0,
+                       transform=from_origin(56.198, 58.013, 0.0002, 0.0001)) as dst:
+        dst.write(data, 1)
+    return path
+
+
+def run(command, args):
+    result = CliRunner().invoke(command, [str(a) for a in args], catch_exceptions=False)
+    assert result.exit_code == 0, result.output
+
+
+def features(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["features"]
+
+
+def test_incremental_matches_full_recompute(tmp_path):
+    raster = write_raster(tmp_path / "r.tif")
+    old = write_layers(tmp_path / "old")
+    new = write_layers(tmp_path / "new", grow=True, new_poi=True)
+    common = ["--raster-file", raster, "--lag"]
+
+    run(featurize_fixed.main, ["--buildings", old / "buildings.geojson", "--pois", old / "pois.geojson",
+                               "--roads", old / "roads.geojson", "--no-cache",
+                               "--out-csv", tmp_path / "prev" / "building_features.csv", *common])
+    run(featurize_fixed.main, ["--buildings", new / "buildings.geojson", "--pois", new / "pois.geojson",
+                               "--roads", new / "roads.geojson", "--no-cache",
+                               "--out-csv", tmp_path / "full" / "building_features.csv", *common])
+    changes = tmp_path / "changes.json"
+    changes.write_text(json.dumps({"buildings": {"modified": [["way", 1]]},
+                                   "pois": {"added": [["node", 900]]}}))
+    run(featurize_incremental.main, [
+        "--prev-features", tmp_path / "prev" / "building_features.geojson", "--changes", changes,
+        "--buildings", new / "buildings.geojson", "--pois", new / "pois.geojson",
+        "--roads", new / "roads.geojson", "--prev-pois", old / "pois.geojson",
+        "--out-csv", tmp_path / "inc" / "building_features.csv", *common])
+
+    prev = features(tmp_path / "prev" / "building_features.geojson")
+    full = features(tmp_path / "full" / "building_features.geojson")
+    inc = features(tmp_path / "inc" / "building_features.geojson")
+    assert len(inc) == len(full) == len(prev)
+
+    # Квартал B не затронут: строки прошлой таблицы переносятся байт в байт
+    for before, after in zip(prev, inc):
+        if before["properties"]["centroid_lon"] > 56.25:
+            assert json.dumps(before, sort_keys=True) == json.dumps(after, sort_keys=True)
+
+    # Все строки совпадают с полным пересчетом, включая NaN растровых статистик
+    frame_inc = pd.DataFrame([f["properties"] for f in inc])
+    frame_full = pd.DataFrame([f["properties"] for f in full])
+    assert list(frame_inc.columns) == list(frame_full.columns)
+    assert frame_full.filter(like="rast_").isna().any().any()
+    numeric = frame_full.select_dtypes(include=[np.number]).columns
+    np.testing.assert_allclose(frame_inc[numeric].to_numpy(dtype=float),
+                               frame_full[numeric].to_numpy(dtype=float), equal_nan=True)
+    assert (frame_inc.drop(columns=numeric) == frame_full.drop(columns=numeric)).all().all()
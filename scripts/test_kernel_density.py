@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверки kernel_density.py (pytest scripts/test_kernel_density.py)
+"""
+
+import numpy as np
+from shapely.geometry import LineString, MultiLineString
+
+from kernel_density import line_pieces
+
+
+def test_line_pieces_multilinestring_parts_are_not_joined():
+    road = MultiLineString([[(0, 0), (100, 0)], [(0, 500), (100, 500)]])
+    mids, lengths = line_pieces([road], cell=10.0)
+    assert np.isclose(lengths.sum(), 200.0)
+    # Ни одного куска между частями (y = 0 и y = 500)
+    assert set(np.unique(mids[:, 1])) == {0.0, 500.0}
+    assert lengths.max() <= 5.0 + 1e-9
+
+
+def test_line_pieces_keeps_lines_separate():
+    lines = [LineString([(0, 0), (30, 0)]), LineString([(1000, 0), (1000, 40)])]
+    _, lengths = line_pieces(lines, cell=10.0)
+    assert np.isclose(lengths.sum(), 70.0)
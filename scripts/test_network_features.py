@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверки network_features.py на маленьких графах (pytest scripts/test_network_features.py)
+"""
+
+import numpy as np
+import geopandas as gpd
+from scipy.sparse.csgraph import dijkstra
+from shapely.geometry import LineString
+
+from network_features import (nearest_source_distance, network_accessibility,
+                              reachable_counts, road_graph)
+
+
+def grid_roads(size=6, step=100.0):
+    """Квадратная сетка улиц size × size с шагом step метров"""
+    lines = []
+    for i in range(size):
+        for j in range(size - 1):
+            lines.append(LineString([(j * step, i * step), ((j + 1) * step, i * step)]))
+            lines.append(LineString([(i * step, j * step), (i * step, (j + 1) * step)]))
+    return gpd.GeoDataFrame(geometry=lines, crs="EPSG:32640")
+
+
+def test_two_pois_on_one_node_take_smallest_offset():
+    graph, node_xy = road_graph(grid_roads())
+    node = int(np.argmin(np.hypot(*(node_xy - [200, 200]).T)))
+    far = int(np.argmin(np.hypot(*(node_xy - [0, 200]).T)))
+    dist = nearest_source_distance(graph, np.array([node, node]), np.array([10.0, 30.0]), cutoff=5000)
+    assert np.isclose(dist[far], 210.0)
+
+
+def test_network_accessibility_two_pois_on_one_node():
+    roads = grid_roads()
+    # Оба POI привязываются к узлу (200, 200): в 10 и 30 м от него
+    pois = np.array([[210.0, 200.0], [200.0, 230.0]])
+    buildings = np.array([[0.0, 200.0]])
+    distances, counts = network_accessibility(buildings, pois, ["school", "school"], roads,
+                                              categories=["school"], radii=[200, 250], cutoff=5000)
+    assert np.isclose(distances["school"][0], 210.0)
+    assert counts[200][0] == 0
+    assert counts[250][0] == 2
+
+
+def test_reachable_counts_match_full_dijkstra():
+    rng = np.random.default_rng(0)
+    graph, node_xy = road_graph(grid_roads(size=12, step=90.0))
+    nodes = rng.integers(0, graph.shape[0], 60)
+    offsets = rng.uniform(0, 40, 60)
+    radii = [150, 400]
+
+    counts = reachable_counts(graph, nodes, offsets, radii, node_xy)
+
+    full = dijkstra(graph, directed=False, indices=nodes) + offsets[:, None]
+    for r in radii:
+        np.testing.assert_array_equal(counts[r], (full <= r).sum(axis=0))
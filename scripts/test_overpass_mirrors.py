@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверки пула зеркал overpass_mirrors.py на локальных заглушках Overpass
+(http.server на localhost): переключение, circuit breaker, ранжирование по
+задержке, все зеркала недоступны (pytest scripts/test_overpass_mirrors.py)
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from overpass_mirrors import MirrorError, MirrorPool, api_url
+from overpass_tiles import TileDownloader, fetch
+
+
+class StubMirror(BaseHTTPRequestHandler):
+    """Заглушка зеркала: поведение задается атрибутами сервера"""
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body=b"", content_type="text/plain"):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        server.status_calls += 1
+        time.sleep(server.delay)
+        if server.down:
+            return self._reply(503)
+        self._reply(200, f"Connected as: 1\nRate limit: {server.slots}\n"
+                         f"{server.slots} slots available now.\n".encode())
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers["Content-Length"]))
+        server.queries += 1
+        time.sleep(server.delay)
+        if server.down:
+            return self._reply(503)
+        body = json.dumps({"elements": [{"type": "node", "id": 1, "lat": 58.0, "lon": 56.0,
+                                         "tags": {"amenity": "school"}}]}).encode()
+        self._reply(200, body, "application/json")
+
+
+@pytest.fixture
+def mirrors():
+    """Фабрика заглушек: mirrors(delay=..., down=...) -> (сервер, URL interpreter)"""
+    servers = []
+
+    def start(delay=0.0, down=False, slots=2):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubMirror)
+        server.delay, server.down, server.slots = delay, down, slots
+        server.status_calls = server.queries = 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server, f"http://127.0.0.1:{server.server_port}/api/interpreter"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def request(pool, query="[out:json];node(1);out;"):
+    """Один запрос через пул, как в TileDownloader.fetch_tile"""
+    mirror = pool.acquire()
+    try:
+        elements = fetch(mirror.url, query, timeout=5)
+    except MirrorError:
+        pool.release(mirror, ok=False)
+        raise
+    pool.release(mirror)
+    return mirror.url, elements
+
+
+def test_ranked_by_status_latency(mirrors):
+    slow, slow_url = mirrors(delay=0.2)
+    fast, fast_url = mirrors(delay=0.0)
+    pool = MirrorPool([slow_url, fast_url])
+    assert [m.url for m in pool.ranked()] == [fast_url, slow_url]
+    assert pool.best() == api_url(fast_url)
+    assert pool.best().endswith("/api")
+    url, _ = request(pool)
+    assert url == fast_url and slow.queries == 0
+
+
+def test_failover_to_working_mirror(mirrors):
+    dead, dead_url = mirrors(down=True)
+    alive, alive_url = mirrors(delay=0.05)
+    pool = MirrorPool([dead_url, alive_url], failure_threshold=1, cooldown=60)
+    for _ in range(3):
+        url, elements = request(pool)
+        assert url == alive_url and len(elements) == 1
+    assert dead.queries == 0
+
+
+def test_breaker_opens_then_half_open_trial_closes_it(mirrors):
+    server, url = mirrors()
+    pool = MirrorPool([url], failure_threshold=2, cooldown=0.3, probe_interval=3600)
+    mirror = pool.mirrors[0]
+    server.down = True
+    for _ in range(2):
+        with pytest.raises(MirrorError):
+            request(pool)
+    assert mirror.open_until > time.monotonic() and mirror.half_open
+    with pytest.raises(MirrorError):
+        pool.acquire(timeout=0.05)
+
+    # После cooldown пропускается один пробный запрос, а не опрос status
+    server.down = False
+    status_calls = server.status_calls
+    start = time.monotonic()
+    request(pool)
+    assert time.monotonic() - start >= 0.2
+    assert server.status_calls == status_calls
+    assert not mirror.half_open and mirror.failures == 0
+
+
+def test_failed_half_open_trial_reopens_breaker(mirrors):
+    server, url = mirrors(down=True)
+    pool = MirrorPool([url], failure_threshold=1, cooldown=0.2, probe=False)
+    with pytest.raises(MirrorError):
+        request(pool)
+    first_open = pool.mirrors[0].open_until
+    with pytest.raises(MirrorError):
+        request(pool)
+    assert pool.mirrors[0].open_until > first_open
+    assert server.queries == 2
+
+
+def test_all_mirrors_down_raise_mirror_error(mirrors):
+    _, url1 = mirrors(down=True)
+    _, url2 = mirrors(down=True)
+    pool = MirrorPool([url1, url2], failure_threshold=1, cooldown=30, acquire_timeout=1)
+    start = time.monotonic()
+    with pytest.raises(MirrorError):
+        pool.acquire()
+    assert time.monotonic() - start < 5
+
+
+def test_all_mirrors_down_downloader_lists_failed_tiles(mirrors, tmp_path):
+    _, url = mirrors(down=True)
+    pool = MirrorPool([url], failure_threshold=1, cooldown=0.2, acquire_timeout=2)
+    downloader = TileDownloader(tmp_path, (56.0, 58.0, 56.1, 58.05), pool=pool, workers=2,
+                                max_retries=2, backoff=0.01)
+    failed = downloader.run()
+    assert sorted(failed) == sorted(downloader.pending())
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert set(manifest["tiles"].values()) == {"failed"}
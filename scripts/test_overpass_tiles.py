@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверки загрузчика тайлов overpass_tiles.py на локальной заглушке Overpass
+(http.server на localhost): деление тяжелых тайлов, докачка по manifest,
+дедупликация объектов соседних тайлов (pytest scripts/test_overpass_tiles.py)
+"""
+
+import json
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import overpass_tiles
+from overpass_mirrors import MirrorPool
+from overpass_tiles import TileDownloader
+
+BBOX = (56.0, 58.0, 56.1, 58.05)
+
+
+def building(osm_id, west, south, east, north):
+    ring = [{"lon": x, "lat": y} for x, y in
+            ((west, south), (east, south), (east, north), (west, north), (west, south))]
+    return {"type": "way", "id": osm_id, "tags": {"building": "yes"}, "geometry": ring}
+
+
+def bounds(element):
+    lons = [p["lon"] for p in element["geometry"]]
+    lats = [p["lat"] for p in element["geometry"]]
+    return min(lons), min(lats), max(lons), max(lats)
+
+
+class StubOverpass(BaseHTTPRequestHandler):
+    """
+    Заглушка Overpass: объекты server.elements, пересекающие bbox запроса.
+    Больше server.max_elements — ответ "timed out"; bbox из server.blocked — 503;
+    server.hang — столько секунд молчит перед ответом на запрос,
+    server.status_delay — перед ответом status (порядок зеркал в пуле).
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body=b""):
+        self.send_response(code)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.server.status_delay)
+        self._reply(200, b"Rate limit: 4\n4 slots available now.\n")
+
+    def do_POST(self):
+        server = self.server
+        form = urllib.parse.parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode())
+        south, west, north, east = map(float, re.search(
+            r"\(([-\d.]+),([-\d.]+),([-\d.]+),([-\d.]+)\)", form["data"][0]).groups())
+        box = (round(west, 7), round(south, 7), round(east, 7), round(north, 7))
+        with server.lock:
+            server.queries.append(box)
+        time.sleep(server.hang)
+        if box in server.blocked:
+            return self._reply(503)
+        hits = [e for e in server.elements
+                if bounds(e)[0] <= east and bounds(e)[2] >= west
+                and bounds(e)[1] <= north and bounds(e)[3] >= south]
+        if len(hits) > server.max_elements:
+            payload = {"elements": [], "remark": "runtime error: Query timed out in \"query\""}
+        else:
+            payload = {"elements": hits}
+        self._reply(200, json.dumps(payload).encode())
+
+
+def start_stub(elements=()):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOverpass)
+    server.elements, server.max_elements, server.blocked = list(elements), 1000, set()
+    server.hang = server.status_delay = 0.0
+    server.queries, server.lock = [], threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = f"http://127.0.0.1:{server.server_port}/api/interpreter"
+    return server
+
+
+def stop_stub(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def overpass():
+    server = start_stub()
+    yield server
+    stop_stub(server)
+
+
+def downloader(root, server, **kw):
+    pool = MirrorPool([server.url], failure_threshold=1000, acquire_timeout=10)
+    return TileDownloader(root, BBOX, pool=pool, workers=2, backoff=0.01,
+                          roads=False, **kw)
+
+
+def grid_buildings(west, south, n, step=0.002, size=0.0002, start=1):
+    return [building(start + i * n + j, west + i * step, south + j * step,
+                     west + i * step + size, south + j * step + size)
+            for i in range(n) for j in range(n)]
+
+
+def test_heavy_tile_is_split_into_children(overpass, tmp_path):
+    # Корневой тайл 56.00-56.05: 25 зданий при пределе 10 — делится
+    overpass.elements = grid_buildings(56.001, 58.001, 5, step=0.009)
+    overpass.max_elements = 10
+    tiles = downloader(tmp_path, overpass)
+    assert tiles.run() == []
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())["tiles"]
+    assert manifest["1120_1160"] == "split"
+    assert {k for k, v in manifest.items() if v == "done"} >= {f"1120_1160.{q}" for q in range(4)}
+    assert sorted(e["id"] for e in tiles.elements()) == sorted(e["id"] for e in overpass.elements)
+
+
+def test_tile_that_cannot_be_split_further_fails(overpass, tmp_path):
+    overpass.elements = grid_buildings(56.001, 58.001, 5, step=0.009)
+    overpass.max_elements = 0
+    tiles = downloader(tmp_path, overpass, max_depth=1)
+    failed = tiles.run()
+    assert failed and all(key.startswith("1120_1160.") for key in failed)
+
+
+def test_resume_fetches_only_missing_tiles(overpass, tmp_path):
+    overpass.elements = grid_buildings(56.001, 58.001, 3) + grid_buildings(56.051, 58.001, 3, start=100)
+    overpass.blocked = {(56.05, 58.0, 56.1, 58.05)}
+    first = downloader(tmp_path, overpass, max_retries=1)
+    assert first.run() == ["1121_1160"]
+    assert first.done_tiles() == ["1120_1160"]
+
+    # Новый запуск (новый процесс) читает manifest и докачивает только упавший тайл
+    overpass.blocked = set()
+    overpass.queries.clear()
+    second = downloader(tmp_path, overpass)
+    assert list(second.pending()) == ["1121_1160"]
+    assert second.run() == []
+    assert overpass.queries == [(56.05, 58.0, 56.1, 58.05)]
+    assert len(second.elements()) == len(overpass.elements)
+
+
+def test_manifest_of_other_bbox_is_ignored(overpass, tmp_path):
+    overpass.elements = grid_buildings(56.001, 58.001, 2)
+    assert downloader(tmp_path, overpass).run() == []
+    other = TileDownloader(tmp_path, (56.0, 58.0, 56.05, 58.05), pool=MirrorPool([overpass.url]))
+    assert list(other.pending()) == ["1120_1160"]
+
+
+def test_elements_in_overlapping_child_tiles_are_deduplicated(overpass, tmp_path):
+    # Большое здание пересекает середину тайла и попадает во все 4 дочерних
+    big = building(999, 56.02, 58.02, 56.03, 58.03)
+    overpass.elements = grid_buildings(56.001, 58.001, 4, step=0.011) + [big]
+    overpass.max_elements = 10
+    tiles = downloader(tmp_path, overpass)
+    assert tiles.run() == []
+
+    children = [k for k in tiles.done_tiles() if k.startswith("1120_1160.")]
+    raw = [e["id"] for k in children for e in json.loads(tiles.tile_path(k).read_text())]
+    assert raw.count(999) == 4
+    ids = [e["id"] for e in tiles.elements()]
+    assert ids.count(999) == 1
+    assert sorted(ids) == sorted(e["id"] for e in overpass.elements)
+
+
+def test_hanging_mirror_fails_over_instead_of_splitting(overpass, tmp_path, monkeypatch):
+    # Таймаут сокета 1 с, первое по скорости status зеркало молчит 2 с
+    monkeypatch.setattr(overpass_tiles, "SOCKET_MARGIN", 1 - overpass_tiles.QUERY_TIMEOUT)
+    overpass.elements = grid_buildings(56.001, 58.001, 3)
+    overpass.hang = 2.0
+    backup = start_stub(overpass.elements)
+    backup.status_delay = 0.2
+    try:
+        pool = MirrorPool([overpass.url, backup.url], failure_threshold=1, cooldown=60,
+                          acquire_timeout=10)
+        tiles = TileDownloader(tmp_path, (56.0, 58.0, 56.05, 58.05), pool=pool, workers=1,
+                               backoff=0.01, roads=False)
+        assert tiles.run() == []
+    finally:
+        stop_stub(backup)
+
+    # Тайл не делился: тот же bbox ушел на второе зеркало
+    manifest = json.loads((tmp_path / "manifest.json").read_text())["tiles"]
+    assert manifest == {"1120_1160": "done"}
+    assert overpass.queries == backup.queries == [(56.0, 58.0, 56.05, 58.05)]
+    assert len(tiles.elements()) == 9
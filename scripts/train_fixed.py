@@ -15,6 +15,8 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
 
+from category_encoder import load_encoders
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -153,6 +155,8 @@ def main(features_csv, train_csv, model_out, test_size):
         "model": rf,
         "features": X_filled.columns.tolist(),
         "feature_importance": feature_importance.to_dict("records"),
+        # Словари категорий (типы зданий): предсказание кодирует так же
+        "encoders": load_encoders(features_csv),
         "metrics": {
             "test_mae": test_mae,
             "test_rmse": test_rmse,